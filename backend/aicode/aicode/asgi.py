@@ -13,4 +13,14 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'aicode.settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+from mainapp.consumers import chat_application  # noqa: E402  (needs apps loaded)
+
+
+async def application(scope, receive, send):
+    # WebSocket chat sessions are handled outside Django's HTTP stack
+    if scope["type"] == "websocket":
+        await chat_application(scope, receive, send)
+    else:
+        await django_application(scope, receive, send)
@@ -50,6 +50,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'mainapp.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -61,6 +62,7 @@ MIDDLEWARE = [
     
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
+    "mainapp.middleware.CompressionMiddleware",
 ]
 
 CORS_ALLOW_ALL_ORIGINS = True
@@ -92,6 +94,9 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Take the write lock when a transaction starts, so concurrent writers
+        # wait for each other instead of failing with "database is locked"
+        'OPTIONS': {'transaction_mode': 'IMMEDIATE'},
     }
 }
 
@@ -131,3 +136,319 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/6.0/howto/static-files/
 
 STATIC_URL = 'static/'
+
+
+# LLM provider
+# BACKEND is "gemini", "fake" (deterministic offline stub) or "replay"
+# (record/replay to disk). See mainapp/llm.py for the available OPTIONS.
+
+LLM_PROVIDER = {
+    'BACKEND': os.environ.get('LLM_PROVIDER', 'gemini'),
+    'OPTIONS': {},
+}
+
+if LLM_PROVIDER['BACKEND'] == 'replay':
+    LLM_PROVIDER['OPTIONS'] = {
+        'mode': os.environ.get('LLM_REPLAY_MODE', 'auto'),
+        'directory': os.environ.get('LLM_REPLAY_DIR', BASE_DIR / 'llm_recordings'),
+        'inner': {'BACKEND': 'gemini'},
+    }
+elif LLM_PROVIDER['BACKEND'] == 'fake':
+    LLM_PROVIDER['OPTIONS'] = {
+        'latency_ms': float(os.environ.get('LLM_FAKE_LATENCY_MS', 0)),
+        'latency_sigma': float(os.environ.get('LLM_FAKE_LATENCY_SIGMA', 0)),
+        'error_rate': float(os.environ.get('LLM_FAKE_ERROR_RATE', 0)),
+    }
+
+
+# Code sandbox
+# Snippets run in isolated child processes; see mainapp/sandbox.py.
+
+SANDBOX = {
+    'TIMEOUT': 5,
+    'MAX_WORKERS': 4,
+    'REPEAT': 5,
+    'MIN_RUN_TIME': 0.05,
+    'MAX_NUMBER': 1000,
+    'PROFILE_TOP_FUNCTIONS': 15,
+    'PROFILE_TOP_ALLOCATIONS': 10,
+    'OUTPUT_HEAD': 4000,
+    'OUTPUT_TAIL': 4000,
+    'STREAM_MAX_CHARS': 1000000,
+    'STREAM_FLUSH_INTERVAL': 0.05,
+}
+
+
+# Worker warm-up
+# With ON_READY the classifier, knowledge base and sandbox pool are prepared
+# in AppConfig.ready(). Pre-forking servers should call
+# mainapp.warmup.warm_up() from their post-fork hook instead.
+
+WARM_UP = {
+    'ON_READY': os.environ.get('AICODE_WARM_UP', '') == '1',
+    'SANDBOX_POOL': True,
+    'LLM_SDK': False,
+}
+
+
+# Fast-path rendering
+# Analyze responses skip the DRF serializer/renderer when the client accepts
+# plain JSON; the bytes are identical. orjson is used when installed.
+
+FAST_RENDER = {
+    'ENABLED': True,
+    'ORJSON': True,
+    'MAX_STATIC': 256,
+}
+
+
+# Response compression and ETags
+# JSON bodies over MIN_SIZE bytes are gzip- or brotli-compressed (brotli when
+# the package is installed); see mainapp/middleware.py.
+
+COMPRESSION = {
+    'MIN_SIZE': 512,
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 5,
+    'CONTENT_TYPES': ('application/json',),
+}
+
+
+# Stored analysis results and idempotency keys
+# POST /api/v2/analyze/ stores its result under a sha256 of the input, which
+# GET /api/v2/analyze/<sha256>/ serves with Cache-Control; see mainapp/results.py.
+
+ANALYSIS_STORE = {
+    'TTL': 24 * 3600,
+    'MAX_AGE': 3600,
+    'IDEMPOTENCY_WINDOW': 24 * 3600,
+    'IDEMPOTENCY_WAIT': 30,
+    'POLL_INTERVAL': 0.1,
+}
+
+
+# Analysis job queue
+# POST /api/v2/jobs/ enqueues; `manage.py run_jobs` workers process the
+# queue straight from the database; see mainapp/jobs.py. Progressive code
+# reviews start their job at once on one of INLINE_WORKERS threads.
+
+JOBS = {
+    'VISIBILITY_TIMEOUT': 300,
+    'MAX_ATTEMPTS': 3,
+    'RETRY_DELAY': 5,
+    'POLL_INTERVAL': 1.0,
+    'SWEEP_INTERVAL': 60,
+    'WORKERS': 2,
+    'INLINE_WORKERS': 4,
+    'EVENT_POLL_INTERVAL': 0.2,
+    'EVENT_TIMEOUT': 60,
+}
+
+
+# Chat sessions
+# ws://<host>/ws/chat/ keeps conversation context server-side, capped at
+# CONTEXT_TOKENS; see mainapp/chat.py. Requires an ASGI server.
+
+CHAT = {
+    'CONTEXT_TOKENS': 1500,
+    'SUMMARY_TOKENS': 300,
+    'TURN_TOKENS': 400,
+    'MIN_RECENT_TURNS': 2,
+}
+
+
+# Prompt budgets
+# User input is compacted before it goes into an LLM prompt and clipped to
+# a per-type token budget; see mainapp/prompts.py. Bump VERSION when a prompt
+# template changes so stored results are recomputed.
+
+PROMPTS = {
+    'VERSION': 1,
+    'LITERAL_CHARS': 200,
+    'BUDGETS': {
+        'code': 3000,
+        'code_request': 400,
+        'programming': 400,
+        'general': 300,
+    },
+}
+
+
+# Admission control
+# /api/v2/analyze/ runs cheap requests and LLM-bound ones in separate lanes;
+# LLM work beyond LLM_CONCURRENCY + LLM_QUEUE_DEPTH, or facing a wait over
+# LLM_MAX_WAIT seconds, gets 503 with Retry-After. Job event streams beyond
+# STREAM_CONCURRENCY are turned away the same way. See mainapp/admission.py.
+
+ADMISSION = {
+    'ENABLED': True,
+    'CHEAP_CONCURRENCY': 16,
+    'LLM_CONCURRENCY': 4,
+    'LLM_QUEUE_DEPTH': 8,
+    'LLM_MAX_WAIT': 2.0,
+    'STREAM_CONCURRENCY': 4,
+    'RETRY_AFTER': 5,
+}
+
+
+# Micro-batching
+# Short programming/general questions arriving within WINDOW_MS share one
+# upstream call of up to MAX_SIZE questions; see mainapp/batching.py. With
+# admission control on, batches are capped at ADMISSION['LLM_CONCURRENCY'].
+
+BATCHING = {
+    'ENABLED': False,
+    'WINDOW_MS': 10,
+    'MAX_SIZE': 8,
+    'TIMEOUT': 120,
+}
+
+
+# Model routing
+# Each LLM prompt goes to a model tier chosen from its kind, its size and
+# the tier's recent latency, with a fallback tier on timeout. Calls are
+# logged as LLMCallLog rows; see mainapp/routing.py and
+# `manage.py routing_report`. Costs are USD per million tokens.
+
+ROUTING = {
+    'TIERS': {
+        'small': {
+            'MODEL': 'gemini-1.5-flash-8b', 'MAX_OUTPUT_TOKENS': 1024, 'TEMPERATURE': 0.4,
+            'TIMEOUT': 15, 'COST_INPUT': 0.0375, 'COST_OUTPUT': 0.15, 'FALLBACK': 'standard',
+        },
+        'standard': {
+            'MODEL': 'gemini-1.5-flash', 'MAX_OUTPUT_TOKENS': 4096, 'TEMPERATURE': 0.2,
+            'TIMEOUT': 30, 'COST_INPUT': 0.075, 'COST_OUTPUT': 0.30, 'FALLBACK': 'small',
+        },
+        'large': {
+            'MODEL': 'gemini-1.5-pro', 'MAX_OUTPUT_TOKENS': 8192, 'TEMPERATURE': 0.2,
+            'TIMEOUT': 60, 'COST_INPUT': 1.25, 'COST_OUTPUT': 5.0, 'FALLBACK': 'standard',
+        },
+    },
+    'POLICY': {
+        'general': 'small',
+        'programming': 'small',
+        'code_request': 'standard',
+        'code': 'standard',
+    },
+    'LARGE_INPUT_TOKENS': 1500,
+    'SLOW_AFTER': 0.8,
+    'LOG_CALLS': True,
+}
+
+
+# Cache prewarming
+# `manage.py prewarm_cache` recomputes stored answers for the TOP_N most
+# requested queries (missing, or older than REFRESH_AGE seconds) at most
+# RATE_PER_MINUTE at a time; run it from cron or with --every. See
+# mainapp/prewarm.py.
+
+PREWARM = {
+    'TOP_N': 50,
+    'RATE_PER_MINUTE': 30,
+    'REFRESH_AGE': 12 * 3600,
+    'INTERVAL': 3600,
+    'MIN_COUNT': 2,
+    'WINDOW_DAYS': 30,
+}
+
+
+# Repository review
+# `manage.py review_repo <path>` reviews changed files only (RepoFileReview
+# rows are the manifest), runs local rules on WORKERS processes and LLM
+# reviews on LLM_WORKERS threads; see mainapp/repo_review.py.
+
+REPO_REVIEW = {
+    'MAX_FILE_BYTES': 512 * 1024,
+    'LLM_WORKERS': 4,
+    'LLM_QUEUE_DEPTH': 16,
+}
+
+
+# Review backfill
+# `manage.py reanalyze_reviews` recomputes CodeReview.review in resumable
+# chunks, throttled to MAX_ROWS_PER_SECOND and DUTY_CYCLE; see
+# mainapp/backfill.py.
+
+BACKFILL = {
+    'CHUNK_SIZE': 500,
+    'WORKERS': 2,
+    'MAX_ROWS_PER_SECOND': 200,
+    'DUTY_CYCLE': 0.5,
+}
+
+# Review retention
+# `manage.py archive_reviews` moves CodeReview rows older than
+# REVIEW_AGE_DAYS to a compressed archive table, keeping per-day totals;
+# see mainapp/retention.py. CODEC 'auto' uses zstd when installed.
+
+RETENTION = {
+    'REVIEW_AGE_DAYS': 90,
+    'BATCH_SIZE': 500,
+    'CODEC': 'auto',
+}
+
+# LLM request hedging
+# A model call still running after the rolling PERCENTILE latency of its
+# kind is raced against an identical second call, within a budget of
+# BUDGET_PCT extra calls; see mainapp/hedging.py.
+
+HEDGING = {
+    'ENABLED': False,
+    'PERCENTILE': 95,
+    'BUDGET_PCT': 10,
+}
+
+# Request profiling
+# ProfilingMiddleware runs a RATE fraction of /api/v2/ requests under
+# cProfile and stores the profiles in DIRECTORY; `manage.py profile_report`
+# aggregates them. See mainapp/profiling.py.
+
+PROFILING = {
+    'ENABLED': False,
+    'RATE': 0.01,
+    'TRACEMALLOC': False,
+}
+
+# Rate limiting
+# Per-client GCRA buckets for LLM-bound and local-only requests; see
+# mainapp/throttling.py. Rates look like "30/min"; CLIENT_RATES maps an
+# X-API-Key value to its own rates. Buckets are kept in a memory-mapped file
+# that all worker processes on this host share. When several hosts serve
+# the API, set RATELIMIT_REDIS_URL (needs the redis package) to keep them in
+# Redis instead.
+
+RATELIMIT = {
+    'ENABLED': True,
+    'RATES': {'llm': '30/min', 'local': '300/min'},
+    'CLIENT_RATES': {},
+    'STORE': 'shared',
+}
+
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+
+if os.environ.get('RATELIMIT_REDIS_URL'):
+    RATELIMIT.update({'STORE': 'cache', 'CACHE': 'ratelimit'})
+    CACHES['ratelimit'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['RATELIMIT_REDIS_URL'],
+    }
+
+# Clients are told apart by IP address. X-Forwarded-For is only trusted when
+# the app runs behind that many reverse proxies (DRF's NUM_PROXIES); with 0
+# the socket address is used, so a client cannot pick its own bucket.
+
+REST_FRAMEWORK = {
+    'NUM_PROXIES': int(os.environ.get('NUM_PROXIES', 0)),
+}
+
+# Structured output
+# Handlers ask for JSON matching a per-kind schema, with code review changes
+# as edit hunks instead of full copies; replies are validated, and invalid
+# ones fall back to the regular prompts. See mainapp/structured.py.
+
+STRUCTURED_OUTPUT = {
+    'ENABLED': False,
+}
@@ -1,5 +1,13 @@
 from django.contrib import admin
-from .models import CodeReview
+from .models import AnalysisJob, ArchivedReview, AnalysisResult, ChatSession, CodeReview, IdempotencyRecord, LLMCallLog, RepoFileReview, ReviewDailyStats
 # Register your models here.
 
 admin.site.register(CodeReview)
+admin.site.register(AnalysisResult)
+admin.site.register(IdempotencyRecord)
+admin.site.register(AnalysisJob)
+admin.site.register(ChatSession)
+admin.site.register(LLMCallLog)
+admin.site.register(RepoFileReview)
+admin.site.register(ArchivedReview)
+admin.site.register(ReviewDailyStats)
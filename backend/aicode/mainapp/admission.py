@@ -0,0 +1,207 @@
+"""
+Admission control for /api/v2/analyze/ and job event streams.
+
+Each request is put in a lane by its expected cost as soon as its input
+type is known. Cheap work (greetings, local-only answers) runs in its own
+lane, so it never waits behind LLM calls. LLM-bound work is capped at
+LLM_CONCURRENCY requests at once with at most LLM_QUEUE_DEPTH more waiting.
+
+A request is turned away with 503 and Retry-After rather than left to
+queue when the lane is full, or when its expected queue wait (from the
+observed service time) would exceed LLM_MAX_WAIT. Keep LLM_CONCURRENCY +
+LLM_QUEUE_DEPTH below the server's worker threads so that some threads
+stay free for cheap requests.
+
+Work that a request hands to another thread, like the LLM phase of a
+progressive review, takes its place in the lane with `reserve` while the
+request can still be turned away, and holds a slot once it runs.
+
+Server-Sent Event streams of jobs hold a worker thread for as long as the
+client follows the job, so they get a lane of their own: at most
+STREAM_CONCURRENCY streams at once, and no waiting for a place.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from . import llm, metrics
+
+
+ADMISSION_DEFAULTS = {
+    'ENABLED': True,
+    'CHEAP_CONCURRENCY': 16,
+    'LLM_CONCURRENCY': 4,
+    'LLM_QUEUE_DEPTH': 8,
+    'LLM_MAX_WAIT': 2.0,  # seconds a request may wait for an LLM slot
+    'STREAM_CONCURRENCY': 4,  # open job event streams
+    'RETRY_AFTER': 5,     # seconds, sent with 503 responses
+}
+
+CHEAP = "cheap"
+LLM = "llm"
+STREAM = "stream"
+
+# Input types answered without the LLM
+LOCAL_INPUT_TYPES = frozenset(["greeting"])
+
+
+def get_setting(name):
+    return getattr(settings, 'ADMISSION', {}).get(name, ADMISSION_DEFAULTS[name])
+
+
+class Overloaded(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "The service is busy. Please retry shortly."
+    default_code = "overloaded"
+
+    def __init__(self, wait):
+        super().__init__()
+        self.wait = wait  # DRF sends this as Retry-After
+
+
+def classify(input_type):
+    """Return the lane for a request of the given input type."""
+    if input_type in LOCAL_INPUT_TYPES or not llm.is_available():
+        return CHEAP
+    return LLM
+
+
+class Lane:
+    """A concurrency limit with a bounded wait queue and a service time estimate."""
+
+    def __init__(self, name, concurrency, queue_depth=None, max_wait=None):
+        self.name = name
+        self.concurrency = concurrency
+        self.queue_depth = queue_depth
+        self.max_wait = max_wait
+        self.slots = threading.BoundedSemaphore(concurrency)
+        self.lock = threading.Lock()
+        self.in_flight = 0  # running or waiting for a slot
+        self.service_time = 0.0  # EWMA of seconds per request
+
+    def expected_wait(self):
+        queued = self.in_flight - self.concurrency + 1
+        return max(queued, 0) / self.concurrency * self.service_time
+
+    @contextmanager
+    def admit(self):
+        self.enter()
+        self.acquire(timeout=self.max_wait)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.release(time.perf_counter() - started)
+
+    def enter(self):
+        """Count a request in, or raise Overloaded when the lane is full or too slow."""
+        with self.lock:
+            full = self.queue_depth is not None and self.in_flight >= self.concurrency + self.queue_depth
+            too_slow = self.max_wait is not None and self.expected_wait() > self.max_wait
+            if not (full or too_slow):
+                self.in_flight += 1
+        if full or too_slow:
+            self.reject("queue_full" if full else "slow")
+
+    def acquire(self, timeout):
+        """Wait for a slot for a request that entered the lane."""
+        started = time.perf_counter()
+        if not self.slots.acquire(timeout=timeout):
+            self.leave()
+            self.reject("timeout")
+        metrics.increment(f"admission.{self.name}.admitted")
+        metrics.increment(f"admission.{self.name}.wait_ms", round((time.perf_counter() - started) * 1000))
+
+    def release(self, elapsed):
+        self.slots.release()
+        self.leave(elapsed)
+
+    def leave(self, elapsed=None):
+        with self.lock:
+            self.in_flight -= 1
+            if elapsed is not None:
+                self.service_time = elapsed if not self.service_time else 0.8 * self.service_time + 0.2 * elapsed
+
+    def reject(self, reason):
+        metrics.increment(f"admission.{self.name}.rejected")
+        metrics.increment(f"admission.{self.name}.rejected.{reason}")
+        raise Overloaded(wait=get_setting('RETRY_AFTER'))
+
+
+_lanes = None
+_lanes_lock = threading.Lock()
+
+
+def get_lanes():
+    global _lanes
+    if _lanes is None:
+        with _lanes_lock:
+            if _lanes is None:
+                _lanes = {
+                    CHEAP: Lane(CHEAP, get_setting('CHEAP_CONCURRENCY')),
+                    LLM: Lane(
+                        LLM, get_setting('LLM_CONCURRENCY'),
+                        queue_depth=get_setting('LLM_QUEUE_DEPTH'),
+                        max_wait=get_setting('LLM_MAX_WAIT'),
+                    ),
+                    STREAM: Lane(STREAM, get_setting('STREAM_CONCURRENCY'), queue_depth=0),
+                }
+    return _lanes
+
+
+def reset_lanes():
+    """Forget the lanes so they are rebuilt from the current settings."""
+    global _lanes
+    with _lanes_lock:
+        _lanes = None
+
+
+class Reservation:
+    """
+    A place in a lane taken by `reserve`. Entering it (on any thread) waits
+    for a slot and holds it until the block ends; `cancel` gives the place
+    back when the work is not going to run.
+    """
+
+    def __init__(self, lane=None):
+        self.lane = lane
+        self.started = None
+
+    def __enter__(self):
+        if self.lane is not None:
+            self.lane.acquire(timeout=None)
+            self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.lane is not None:
+            self.lane.release(time.perf_counter() - self.started)
+            self.lane = None
+
+    def cancel(self):
+        if self.lane is not None and self.started is None:
+            self.lane.leave()
+            self.lane = None
+
+
+def reserve(lane_name):
+    """Take a place in `lane_name` for work that runs later; returns a Reservation or raises Overloaded."""
+    if not get_setting('ENABLED'):
+        return Reservation()
+    lane = get_lanes()[lane_name]
+    lane.enter()
+    return Reservation(lane)
+
+
+@contextmanager
+def admit(lane_name):
+    """Run the enclosed block in `lane_name`, or raise Overloaded."""
+    if not get_setting('ENABLED'):
+        yield
+        return
+    with get_lanes()[lane_name].admit():
+        yield
@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class MainappConfig(AppConfig):
     name = 'mainapp'
+
+    def ready(self):
+        from .warmup import get_setting, warm_up
+        if get_setting('ON_READY'):
+            warm_up()
@@ -0,0 +1,125 @@
+"""
+Recompute stored CodeReview.review values: `manage.py reanalyze_reviews`.
+
+Rows are read in id order with `.iterator(chunk_size=...)`, so memory stays
+bounded by one chunk. Each chunk is reviewed on a process pool and the rows
+whose review changed are written back with one `bulk_update`. After every
+chunk, the last id done is saved to a checkpoint file, and a rerun resumes
+after it; the file is removed once a pass completes.
+
+Throttling keeps the live service responsive. MAX_ROWS_PER_SECOND caps the
+rate, and DUTY_CYCLE makes the command sleep between chunks for a
+proportional share of the time it spent working (0.5 means idle as long as
+busy).
+"""
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+from django.conf import settings
+
+from .code_review import review_code
+from .models import CodeReview
+
+
+BACKFILL_DEFAULTS = {
+    'CHUNK_SIZE': 500,
+    'WORKERS': 2,
+    'MAX_ROWS_PER_SECOND': 200,  # 0 for no limit
+    'DUTY_CYCLE': 0.5,           # fraction of wall time spent working
+    'CHECKPOINT': os.path.join(settings.BASE_DIR, '.reanalyze_reviews.json'),
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'BACKFILL', {}).get(name, BACKFILL_DEFAULTS[name])
+
+
+def load_checkpoint(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_checkpoint(path, state):
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+
+def reanalyze_reviews(chunk_size=None, workers=None, max_rate=None, duty_cycle=None,
+                      checkpoint=None, restart=False, limit=None, log=print):
+    """Recompute CodeReview.review for every row after the checkpoint; returns totals."""
+    chunk_size = chunk_size or get_setting('CHUNK_SIZE')
+    workers = workers or get_setting('WORKERS')
+    max_rate = get_setting('MAX_ROWS_PER_SECOND') if max_rate is None else max_rate
+    duty_cycle = get_setting('DUTY_CYCLE') if duty_cycle is None else duty_cycle
+    checkpoint = checkpoint or get_setting('CHECKPOINT')
+
+    state = {} if restart else load_checkpoint(checkpoint)
+    last_id = state.get("last_id", 0)
+    totals = {"processed": state.get("processed", 0), "updated": state.get("updated", 0)}
+    if last_id:
+        log(f"Resuming after id {last_id}")
+
+    rows = CodeReview.objects.filter(id__gt=last_id).order_by("id").only("id", "code", "review")
+    pending = rows.count()
+    remaining = pending if limit is None else min(limit, pending)
+    rows = rows.iterator(chunk_size=chunk_size)
+    if limit is not None:
+        rows = islice(rows, limit)
+
+    started = time.perf_counter()
+    done = 0
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        while True:
+            chunk = list(islice(rows, chunk_size))
+            if not chunk:
+                break
+            chunk_started = time.perf_counter()
+
+            reviews = pool.map(review_code, [row.code for row in chunk], chunksize=max(1, len(chunk) // workers))
+            changed = []
+            for row, review in zip(chunk, reviews):
+                if row.review != review:
+                    row.review = review
+                    changed.append(row)
+            if changed:
+                CodeReview.objects.bulk_update(changed, ["review"])
+
+            done += len(chunk)
+            totals["processed"] += len(chunk)
+            totals["updated"] += len(changed)
+            save_checkpoint(checkpoint, {"last_id": chunk[-1].id, **totals})
+
+            elapsed = time.perf_counter() - started
+            rate = done / elapsed if elapsed else 0.0
+            eta = (remaining - done) / rate if rate else 0.0
+            log(f"{done}/{remaining} rows, {len(changed)} updated in this chunk, "
+                f"{rate:.0f} rows/s, ETA {eta:.0f}s")
+
+            # Throttle: leave the database to the live service for a while
+            busy = time.perf_counter() - chunk_started
+            pause = busy * (1 - duty_cycle) / duty_cycle if 0 < duty_cycle < 1 else 0.0
+            if max_rate:
+                pause = max(pause, len(chunk) / max_rate - busy)
+            if pause > 0:
+                time.sleep(pause)
+
+    # A finished pass starts from the beginning next time
+    complete = done >= pending
+    if complete and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    elapsed = time.perf_counter() - started
+    return {
+        **totals,
+        "this_run": done,
+        "seconds": round(elapsed, 2),
+        "rows_per_second": round(done / elapsed, 1) if elapsed else 0.0,
+        "complete": complete,
+    }
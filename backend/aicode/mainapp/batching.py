@@ -0,0 +1,171 @@
+"""
+Micro-batching of short LLM questions.
+
+Programming and general questions are small, so per-call overhead and the
+request-rate quota dominate their cost. With BATCHING enabled, questions
+arriving within WINDOW_MS of each other (up to MAX_SIZE) are sent as one
+multi-question prompt and the JSON answer is split back to the callers.
+
+The first caller of a batch leads it: it waits out the window, sends the
+prompt and hands each caller its answer. A caller gets None when its
+question could not be answered from the batch (a batch of one, a provider
+error or a malformed or incomplete answer) and should then make its own
+call as usual.
+
+Questions are asked from inside the LLM admission lane, so no more than
+ADMISSION['LLM_CONCURRENCY'] of them can be waiting at once. A batch is
+therefore capped at that size as well as at MAX_SIZE: it is sent as soon
+as it is full instead of waiting out the window for questions that
+cannot arrive.
+"""
+import json
+import threading
+
+from django.conf import settings
+
+from . import admission, metrics, routing
+
+
+BATCHING_DEFAULTS = {
+    'ENABLED': False,
+    'WINDOW_MS': 10,  # how long the first question waits for company
+    'MAX_SIZE': 8,    # questions per upstream call
+    'TIMEOUT': 120,   # seconds a caller waits for its batch
+}
+
+# Per kind: instructions and the fields each answer carries
+KINDS = {
+    "programming": (
+        "You are a programming expert. Answer each question below independently, "
+        "clearly, with explanation, a code example if relevant and best practices.",
+        '{"id": 0, "response": "explanation here", '
+        '"example_code": "code example if relevant, empty string if not", '
+        '"best_practices": ["practice 1", "practice 2"]}',
+    ),
+    "general": (
+        "You are a helpful AI assistant. Answer each question below independently, "
+        "naturally and clearly. If relevant, you can include a small code example, but don't force it.",
+        '{"id": 0, "response": "your answer here"}',
+    ),
+}
+
+QUESTION_HEADER = "### Question {}"
+
+
+def get_setting(name):
+    return getattr(settings, 'BATCHING', {}).get(name, BATCHING_DEFAULTS[name])
+
+
+def max_size():
+    """Questions per batch: MAX_SIZE, capped at the LLM lane's concurrency."""
+    size = get_setting('MAX_SIZE')
+    if admission.get_setting('ENABLED'):
+        size = min(size, admission.get_setting('LLM_CONCURRENCY'))
+    return size
+
+
+def build_prompt(kind, questions):
+    intro, answer_format = KINDS[kind]
+    blocks = "\n\n".join(f"{QUESTION_HEADER.format(i)}\n{q}" for i, q in enumerate(questions))
+    return f"""{intro}
+
+{blocks}
+
+JSON format, one answer per question with its id:
+{{
+  "answers": [
+    {answer_format}
+  ]
+}}"""
+
+
+def split_answers(text, count):
+    """Return a list of `count` answer dicts (None where missing or malformed)."""
+    answers = [None] * count
+    start = text.find('{')
+    end = text.rfind('}') + 1
+    if start < 0 or end <= start:
+        return answers
+    try:
+        entries = json.loads(text[start:end]).get("answers")
+    except (ValueError, AttributeError):
+        return answers
+    if not isinstance(entries, list):
+        return answers
+    for position, entry in enumerate(entries):
+        if not isinstance(entry, dict) or not isinstance(entry.get("response"), str):
+            continue
+        index = entry.get("id", position)
+        if isinstance(index, int) and 0 <= index < count and answers[index] is None:
+            answers[index] = entry
+    return answers
+
+
+class _Batch:
+    def __init__(self):
+        self.questions = []
+        self.answers = None
+        self.full = threading.Event()
+        self.done = threading.Event()
+
+
+class Batcher:
+    """Collects questions of one kind into batches."""
+
+    def __init__(self, kind):
+        self.kind = kind
+        self.lock = threading.Lock()
+        self.current = None
+
+    def ask(self, question):
+        """Return the answer dict for `question`, or None to call individually."""
+        with self.lock:
+            batch = self.current
+            leader = batch is None
+            if leader:
+                batch = self.current = _Batch()
+            index = len(batch.questions)
+            batch.questions.append(question)
+            if len(batch.questions) >= max_size():
+                self.current = None
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(get_setting('WINDOW_MS') / 1000)
+            with self.lock:
+                if self.current is batch:
+                    self.current = None
+            try:
+                batch.answers = self.send(batch.questions)
+            finally:
+                batch.done.set()
+        elif not batch.done.wait(get_setting('TIMEOUT')):
+            return None
+        return batch.answers[index] if batch.answers else None
+
+    def send(self, questions):
+        if len(questions) == 1:
+            return [None]
+        metrics.increment(f"batch.{self.kind}.calls")
+        metrics.increment(f"batch.{self.kind}.questions", len(questions))
+        try:
+            answers = split_answers(routing.generate(build_prompt(self.kind, questions), self.kind), len(questions))
+        except Exception as e:
+            print(f"Batch error: {e}")
+            answers = [None] * len(questions)
+        metrics.increment(f"batch.{self.kind}.fallbacks", answers.count(None))
+        return answers
+
+
+_batchers = {kind: Batcher(kind) for kind in KINDS}
+
+
+def ask(kind, question):
+    """
+    Answer `question` as part of a batch of its kind. Returns the answer
+    dict, or None when batching is off or the caller should call the model
+    itself.
+    """
+    if not get_setting('ENABLED'):
+        return None
+    return _batchers[kind].ask(question)
@@ -0,0 +1,608 @@
+import json
+import logging
+import os
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+from django.conf import settings
+
+
+# Runs in a fresh interpreter so that import costs are measured cold.
+STARTUP_SCRIPT = r'''
+import json, os, sys, time
+started = time.perf_counter()
+import django
+django.setup()
+import mainapp.views
+imported = time.perf_counter()
+
+from django.test.utils import setup_test_environment
+setup_test_environment()
+from django.test import Client
+
+warm_up_ms = 0.0
+if os.environ.get("BENCH_WARM_UP") == "1":
+    from mainapp.warmup import warm_up
+    t = time.perf_counter()
+    warm_up()
+    warm_up_ms = (time.perf_counter() - t) * 1000
+
+client = Client()
+result = {
+    "import_ms": (imported - started) * 1000,
+    "warm_up_ms": warm_up_ms,
+    "sdk_imported_at_startup": "google.generativeai" in sys.modules,
+}
+for name, query in (("greeting", "hello"), ("code", "def f(x):\n    return x * 2\nprint(f(21))")):
+    t = time.perf_counter()
+    response = client.post("/api/v2/analyze/", {"query": query}, content_type="application/json")
+    result[f"first_{name}_ms"] = (time.perf_counter() - t) * 1000
+    t = time.perf_counter()
+    client.post("/api/v2/analyze/", {"query": query}, content_type="application/json")
+    result[f"second_{name}_ms"] = (time.perf_counter() - t) * 1000
+    result[f"{name}_status"] = response.status_code
+print(json.dumps(result))
+'''
+
+
+def _run_startup_once(warm):
+    env = dict(os.environ, BENCH_WARM_UP="1" if warm else "0")
+    env.setdefault('DJANGO_SETTINGS_MODULE', os.environ.get('DJANGO_SETTINGS_MODULE', 'aicode.settings'))
+    completed = subprocess.run(
+        [sys.executable, '-c', STARTUP_SCRIPT],
+        cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def startup(runs=5, **options):
+    """
+    Cold-start benchmark: module import time and first/second request latency
+    in fresh processes, with and without the warm-up hook. Reports medians.
+    """
+    rows = []
+    for warm in (False, True):
+        samples = [_run_startup_once(warm) for _ in range(runs)]
+        row = {"scenario": "startup", "warm_up": warm, "runs": runs}
+        for key in samples[0]:
+            values = [sample[key] for sample in samples]
+            if isinstance(values[0], bool):
+                row[key] = any(values)
+            elif key.endswith("_ms"):
+                row[key] = round(statistics.median(values), 2)
+        rows.append(row)
+    return rows
+
+
+def _render_payloads():
+    code = "def add(a, b):\n    return a + b\n\nprint(add(2, 3))"
+    return {
+        "greeting": {
+            "type": "greeting", "is_valid": True, "error": None, "corrected_code": "",
+            "improved_versions": [], "best_version": 0, "answer": "Hi there! \U0001F44B",
+            "example_code": "", "documentation": "", "output": "",
+        },
+        "general": {
+            "type": "general", "is_valid": True, "error": None, "corrected_code": "",
+            "improved_versions": [], "best_version": 0,
+            "answer": "Line\u2028separators, \"quotes\", tabs\t and \x01 control chars. " * 20,
+            "example_code": "", "documentation": "", "output": "",
+        },
+        "code": {
+            "type": "code", "is_valid": True, "error": None, "corrected_code": code,
+            "improved_versions": [
+                {"version": v, "code": code, "explanation": f"Version {v}"} for v in (1, 2, 3)
+            ],
+            "best_version": 2, "answer": "", "example_code": code,
+            "documentation": "## Code Analysis\n\nStatus: \u2705 Correct", "output": "5\n",
+            "timings": [
+                {"version": v, "success": True, "matches_original": True,
+                 "best_ms": 0.1234 * (v + 1), "mean_ms": 0.2, "runs": 1000} for v in range(4)
+            ],
+            "performance_hints": [
+                {"line": 2, "rule": "recursion", "message": "'add' is recursive", "complexity": "O(n) stack"}
+            ],
+        },
+    }
+
+
+def render(runs=5, iterations=2000, **options):
+    """
+    Response rendering benchmark: DRF serializer + JSONRenderer against the
+    fast path in mainapp.renderers, for greeting, general and code payloads.
+    Fails if the two paths ever produce different bytes.
+    """
+    from rest_framework.renderers import JSONRenderer
+
+    from . import renderers
+    from .serializers import AnalyzeOutputSerializer
+
+    json_renderer = JSONRenderer()
+
+    def drf(data):
+        return json_renderer.render(AnalyzeOutputSerializer(data).data)
+
+    paths = (("drf", drf), ("fast", renderers.render_analysis))
+    rows = []
+    for name, data in _render_payloads().items():
+        expected = drf(data)
+        if renderers.render_analysis(data) != expected:
+            raise AssertionError(f"Fast path output differs from DRF for the {name} payload")
+        row = {"scenario": "render", "payload": name, "bytes": len(expected), "runs": runs,
+               "orjson": renderers.orjson is not None}
+        for label, encode in paths:
+            samples = []
+            for _ in range(runs):
+                started = time.perf_counter()
+                for _ in range(iterations):
+                    encode(data)
+                samples.append(iterations / (time.perf_counter() - started))
+            row[f"{label}_per_sec"] = round(statistics.median(samples))
+        row["speedup"] = round(row["fast_per_sec"] / row["drf_per_sec"], 2)
+        rows.append(row)
+    return rows
+
+
+BANDWIDTH_WORKLOAD = (
+    "hello",
+    "what is the capital of France",
+    "explain python decorators",
+    "write a function to reverse a string",
+    "def add(a, b):\n    return a + b\n\nprint(add(2, 3))",
+    "numbers = [3, 1, 2]\nfor n in numbers:\n    if n in [1, 2]:\n        print(sorted(numbers))",
+)
+
+
+def bandwidth(runs=1, **options):
+    """
+    Bandwidth benchmark: replays a sample workload against /api/v2/analyze/
+    and reports bytes on the wire for identity, gzip and (if installed)
+    brotli, plus a revalidation pass where every request sends the ETag it
+    was given and should come back as a bodiless 304.
+
+    The configured LLM provider is used when available, so recorded
+    responses can be measured with LLM_PROVIDER=replay; otherwise the fake
+    provider stands in.
+    """
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+
+    from . import llm, middleware
+
+    setup_test_environment()
+    previous = llm.get_provider()
+    if not previous.is_available():
+        llm.set_provider(llm.FakeProvider())
+    encodings = ["identity", "gzip"] + (["br"] if middleware.brotli is not None else [])
+    client = Client()
+    totals = {encoding: 0 for encoding in encodings}
+    revalidated = not_modified = 0
+    try:
+        for query in BANDWIDTH_WORKLOAD:
+            etag = None
+            for encoding in encodings:
+                response = client.post(
+                    "/api/v2/analyze/", {"query": query}, content_type="application/json",
+                    HTTP_ACCEPT_ENCODING=encoding,
+                )
+                totals[encoding] += len(response.content)
+                if encoding == "identity":
+                    etag = response.get("ETag")
+            response = client.post(
+                "/api/v2/analyze/", {"query": query}, content_type="application/json",
+                HTTP_IF_NONE_MATCH=etag or "",
+            )
+            revalidated += len(response.content)
+            not_modified += response.status_code == 304
+    finally:
+        llm.set_provider(previous)
+
+    identity = totals["identity"]
+    rows = []
+    for encoding in encodings:
+        rows.append({
+            "scenario": "bandwidth", "encoding": encoding, "requests": len(BANDWIDTH_WORKLOAD),
+            "bytes": totals[encoding],
+            "saved_pct": round(100 * (1 - totals[encoding] / identity), 1) if identity else 0.0,
+        })
+    rows.append({
+        "scenario": "bandwidth", "encoding": "revalidate", "requests": len(BANDWIDTH_WORKLOAD),
+        "bytes": revalidated, "not_modified": not_modified,
+        "saved_pct": round(100 * (1 - revalidated / identity), 1) if identity else 0.0,
+    })
+    return rows
+
+
+def payload(runs=1, **options):
+    """
+    Payload size benchmark: bytes of a code response in the full and the
+    compact (diff-based) format, for snippets of growing size. Each size is
+    measured with identical versions (the local fallback) and with versions
+    that differ from the original in a few lines. Fails if a compact
+    response does not expand back to the full one.
+    """
+    from . import diffs, renderers
+
+    rows = []
+    for functions in (5, 50, 500):
+        code = "\n".join(f"def f{i}(x):\n    return x + {i}\n" for i in range(functions)) + "\nprint(f1(1))\n"
+        changed = code.replace("return x + 1\n", "return 1 + x\n", 1) + "print(f2(2))\n"
+        for variant, versions in (("identical", [code, code, code]), ("edited", [code, changed, changed + "\n"])):
+            data = {
+                "type": "code", "is_valid": True, "error": None, "corrected_code": code,
+                "improved_versions": [
+                    {"version": n, "code": text, "explanation": f"Version {n}"}
+                    for n, text in enumerate(versions, start=1)
+                ],
+                "best_version": 2, "answer": "", "example_code": code, "documentation": "", "output": "",
+            }
+            full = renderers.render_analysis(data)
+            compact_data = diffs.compact_response(data)
+            compact = renderers.render_analysis(compact_data)
+            if diffs.expand_response(json.loads(compact)) != json.loads(full):
+                raise AssertionError(f"Compact response does not expand back ({functions} functions, {variant})")
+            rows.append({
+                "scenario": "payload", "lines": code.count("\n"), "versions": variant,
+                "full_bytes": len(full), "compact_bytes": len(compact),
+                "ratio": round(len(full) / len(compact), 2),
+            })
+    return rows
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def load(runs=1, workers=8, llm_requests=40, cheap_requests=30, latency_ms=300, **options):
+    """
+    Load benchmark for admission control: a threaded server with `workers`
+    threads is flooded with `llm_requests` LLM-bound questions (fake
+    provider, `latency_ms` each) while greetings arrive every 20 ms. Reports
+    greeting latency with no LLM load, and under load with admission
+    control off and on, plus how many LLM requests were served or shed.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    from django.db import close_old_connections
+    from django.test import Client, override_settings
+    from django.test.utils import setup_test_environment
+
+    from . import admission, llm
+
+    setup_test_environment()
+    previous = llm.get_provider()
+    llm.set_provider(llm.FakeProvider(latency_ms=latency_ms))
+    # Shed requests are expected here; keep their 503s out of the report
+    request_logger = logging.getLogger("django.request")
+    log_level = request_logger.level
+    request_logger.setLevel(logging.CRITICAL)
+
+    def post(query):
+        # Each pool thread stands in for a server thread with its own connection
+        started = time.perf_counter()
+        try:
+            return Client().post("/api/v2/analyze/", {"query": query}, content_type="application/json").status_code, \
+                (time.perf_counter() - started) * 1000
+        finally:
+            close_old_connections()
+
+    def measure(label, flood, enabled):
+        admission.reset_lanes()
+        nonce = time.time_ns()  # fresh questions, so none is served from the store
+        with override_settings(ADMISSION={'ENABLED': enabled, 'LLM_CONCURRENCY': workers // 2,
+                                          'LLM_QUEUE_DEPTH': workers // 4},
+                               RATELIMIT={'ENABLED': False}), \
+                ThreadPoolExecutor(max_workers=workers) as pool:
+            llm_futures = [
+                pool.submit(post, f"explain python decorators, variant {nonce}-{i}")
+                for i in range(llm_requests if flood else 0)
+            ]
+            cheap = []
+            for _ in range(cheap_requests):
+                submitted = time.perf_counter()
+                future = pool.submit(post, "hello")
+                future.add_done_callback(
+                    lambda f, submitted=submitted: cheap.append((time.perf_counter() - submitted) * 1000)
+                )
+                time.sleep(0.02)
+            statuses = [future.result()[0] for future in llm_futures]
+        admission.reset_lanes()
+        return {
+            "scenario": "load", "case": label, "workers": workers,
+            "cheap_p50_ms": round(_percentile(cheap, 50), 1),
+            "cheap_p95_ms": round(_percentile(cheap, 95), 1),
+            "cheap_max_ms": round(max(cheap), 1),
+            "llm_served": statuses.count(200), "llm_rejected": statuses.count(503),
+        }
+
+    try:
+        return [
+            measure("idle", flood=False, enabled=True),
+            measure("flood, admission off", flood=True, enabled=False),
+            measure("flood, admission on", flood=True, enabled=True),
+        ]
+    finally:
+        llm.set_provider(previous)
+        request_logger.setLevel(log_level)
+
+
+def batching(runs=1, threads=16, questions=64, latency_ms=200, **options):
+    """
+    Micro-batching benchmark: `threads` callers ask `questions` short
+    programming questions through handle_programming_question (fake
+    provider, `latency_ms` per call), with batching off and on. Reports
+    upstream calls (the quota unit), questions answered per call and per
+    second, and per-question latency.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    from django.test import override_settings
+
+    from . import llm
+    from .views import handle_programming_question
+
+    class CountingProvider(llm.FakeProvider):
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            self.calls = 0
+            self.lock = threading.Lock()
+
+        def generate(self, prompt, model=None, config=None):
+            with self.lock:
+                self.calls += 1
+            return super().generate(prompt, model=model, config=config)
+
+    previous = llm.get_provider()
+    rows = []
+    try:
+        for enabled in (False, True):
+            provider = CountingProvider(latency_ms=latency_ms)
+            llm.set_provider(provider)
+            latencies = []
+
+            def ask(i):
+                started = time.perf_counter()
+                result = handle_programming_question(f"what is a python closure? ({i})")
+                latencies.append((time.perf_counter() - started) * 1000)
+                return result["response"] == provider.response
+
+            started = time.perf_counter()
+            with override_settings(BATCHING={'ENABLED': enabled}), ThreadPoolExecutor(max_workers=threads) as pool:
+                answered = sum(pool.map(ask, range(questions)))
+            elapsed = time.perf_counter() - started
+            rows.append({
+                "scenario": "batching", "batching": "on" if enabled else "off", "questions": questions,
+                "answered": answered, "upstream_calls": provider.calls,
+                "questions_per_call": round(questions / provider.calls, 2) if provider.calls else 0.0,
+                "questions_per_s": round(questions / elapsed, 1),
+                "p50_ms": round(_percentile(latencies, 50), 1),
+                "p95_ms": round(_percentile(latencies, 95), 1),
+            })
+    finally:
+        llm.set_provider(previous)
+    return rows
+
+
+def hedging(runs=1, threads=8, calls=400, latency_ms=100, tail_rate=0.05, tail_factor=8, **options):
+    """
+    Hedging benchmark: `threads` callers make `calls` general-question LLM
+    calls through routing (fake provider, `latency_ms` typical latency, and
+    `tail_rate` of calls `tail_factor` times slower, drawn per call), with
+    hedging off and on. Reports latency percentiles, upstream calls and the
+    hedge and win rates.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    from django.test import override_settings
+
+    from . import hedging as hedging_module, llm, metrics, routing
+
+    class TailProvider(llm.FakeProvider):
+        def __init__(self, **kwargs):
+            super().__init__(**kwargs)
+            self.calls = 0
+            self.lock = threading.Lock()
+            self.rng = random.Random(0)
+
+        def generate(self, prompt, model=None, config=None):
+            with self.lock:
+                self.calls += 1
+                slow = self.rng.random() < tail_rate
+                jitter = self.rng.uniform(0.8, 1.2)
+            time.sleep(latency_ms / 1000 * jitter * (tail_factor if slow else 1))
+            return self.response
+
+    previous = llm.get_provider()
+    rows = []
+    try:
+        for enabled in (False, True):
+            provider = TailProvider()
+            llm.set_provider(provider)
+            hedging_module.reset()
+            metrics.reset()
+            latencies = []
+
+            def ask(i):
+                started = time.perf_counter()
+                routing.generate(f"question {i}", "general")
+                latencies.append((time.perf_counter() - started) * 1000)
+
+            with override_settings(
+                HEDGING={**getattr(settings, 'HEDGING', {}), 'ENABLED': enabled},
+                ROUTING={**getattr(settings, 'ROUTING', {}), 'LOG_CALLS': False},
+            ), ThreadPoolExecutor(max_workers=threads) as pool:
+                list(pool.map(ask, range(calls)))
+            counters = metrics.snapshot()
+            rates = hedging_module.rates(counters)
+            rows.append({
+                "scenario": "hedging", "hedging": "on" if enabled else "off", "calls": calls,
+                "upstream_calls": provider.calls,
+                "extra_load_pct": round(100 * (provider.calls - calls) / calls, 1),
+                "hedge_rate": rates.get("hedge.general.hedge_rate", 0.0),
+                "win_rate": rates.get("hedge.general.win_rate", 0.0),
+                "p50_ms": round(_percentile(latencies, 50), 1),
+                "p95_ms": round(_percentile(latencies, 95), 1),
+                "p99_ms": round(_percentile(latencies, 99), 1),
+            })
+    finally:
+        llm.set_provider(previous)
+        hedging_module.reset()
+    return rows
+
+
+# Fields each regular prompt asks for (see the handlers in views.py)
+REGULAR_FIELDS = {
+    "code": ("is_valid", "error", "corrected_code", "improvements", "best_version"),
+    "code_request": ("code", "explanation"),
+    "programming": ("response", "example_code", "best_practices"),
+    "general": ("response",),
+}
+
+# First words of each regular prompt
+REGULAR_PROMPTS = (
+    ("Review this Python code:", "code"),
+    ("You are a Python expert. Write clean, working Python code", "code_request"),
+    ("You are a programming expert. Answer this question", "programming"),
+    ("You are a helpful AI assistant. Answer this question", "general"),
+)
+
+SYNTHETIC_QUERIES = (
+    "def total(items):\n    result = 0\n    for i in range(len(items)):\n        result = result + items[i]\n"
+    "    return result\n\nprint(total([1, 2, 3]))",
+    "def find(words, target)\n    for w in words:\n        if w == target:\n            return True\n    return False",
+    "import math\nvalues = [3, 1, 2]\nsquares = []\nfor v in values:\n    squares.append(math.pow(v, 2))\nprint(squares)",
+    "write a python function to reverse a string",
+    "generate code for a fibonacci sequence",
+    "what is a python decorator?",
+    "explain list comprehension in python",
+    "who invented the world wide web?",
+    "what is the capital of australia?",
+)
+
+
+def _recorded_answers(directory):
+    """Yield (kind, code under review, regular result dict, latency) from recordings of regular prompts."""
+    from pathlib import Path
+
+    for path in sorted(Path(directory).glob("*.json")):
+        try:
+            recording = json.loads(path.read_text(encoding="utf-8"))
+            prompt, text = recording["prompt"], recording["response"]
+            result = json.loads(text[text.find("{"):text.rfind("}") + 1])
+        except (OSError, ValueError, KeyError):
+            continue
+        if "### Question" in prompt or not isinstance(result, dict):
+            continue  # micro-batched prompts have their own format
+        kind = next((kind for marker, kind in REGULAR_PROMPTS if marker in prompt), None)
+        if kind is None:
+            continue
+        source = ""
+        if kind == "code":
+            start = prompt.find("```", prompt.find("Review this Python code:"))
+            start = prompt.find("\n", start) + 1
+            source = prompt[start:prompt.find("```", start)].strip("\n")
+        yield kind, source, result, recording.get("latency", 0.0)
+
+
+def structured(runs=1, recordings=None, ms_per_token=5.0, **options):
+    """
+    Structured output benchmark on a recorded workload. Every recorded answer
+    to a regular prompt (llm.RecordReplayProvider files in `recordings`, by
+    default LLM_REPLAY_DIR) is converted to its structured equivalent: the
+    same content, with code changes as hunks. The equivalent is checked
+    against the schema and must expand back to the same code. Output tokens
+    of both forms, serialized the same way, are compared per input type.
+    Generation is decode-bound, so the latency saved is estimated at
+    `ms_per_token` per token and, for recordings, compared with their
+    observed latency. Without recordings, a synthetic workload is recorded
+    first with the fake provider. Its review answers repeat the code
+    unchanged, which is the best case for hunks.
+    """
+    import shutil
+    import tempfile
+
+    from django.test import override_settings
+
+    from . import llm, prompts, structured as structured_module
+    from .views import analyze_query
+
+    directory = recordings or settings.LLM_PROVIDER.get('OPTIONS', {}).get('directory') \
+        or os.path.join(settings.BASE_DIR, 'llm_recordings')
+    workload = "recorded"
+    answers = list(_recorded_answers(directory)) if os.path.isdir(directory) else []
+    if not answers:
+        workload = "synthetic"
+        directory = tempfile.mkdtemp(prefix="structured-bench-")
+        previous = llm.get_provider()
+        llm.set_provider(llm.RecordReplayProvider(
+            inner=llm.FakeProvider(), directory=directory, mode="record",
+        ))
+        try:
+            with override_settings(
+                ROUTING={**getattr(settings, 'ROUTING', {}), 'LOG_CALLS': False},
+                STRUCTURED_OUTPUT={'ENABLED': False},
+            ):
+                for query in SYNTHETIC_QUERIES:
+                    analyze_query(query)
+        finally:
+            llm.set_provider(previous)
+        answers = list(_recorded_answers(directory))
+        shutil.rmtree(directory, ignore_errors=True)
+
+    per_kind = {}
+    for kind, source, result, latency in answers:
+        reply = structured_module.from_regular(kind, result, source)
+        structured_module.validate(reply, structured_module.SCHEMAS[kind])
+        roundtrip = True
+        if kind == "code":
+            expanded = structured_module.expand(kind, reply, source)
+            corrected = result.get("corrected_code") or source
+            roundtrip = expanded["corrected_code"] == corrected and [
+                item["code"] for item in expanded["improvements"]
+            ] == [item.get("code") or corrected for item in (result.get("improvements") or [])[:3]]
+        regular = {name: result.get(name) for name in REGULAR_FIELDS[kind]}
+        regular_tokens = prompts.estimate_tokens(json.dumps(regular, ensure_ascii=False))
+        structured_tokens = prompts.estimate_tokens(json.dumps(reply, ensure_ascii=False))
+        entry = per_kind.setdefault(kind, {"n": 0, "regular": 0, "structured": 0, "latency": 0.0, "roundtrip": 0})
+        entry["n"] += 1
+        entry["regular"] += regular_tokens
+        entry["structured"] += structured_tokens
+        entry["latency"] += latency
+        entry["roundtrip"] += roundtrip
+
+    rows = []
+    for kind, entry in sorted(per_kind.items()):
+        n = entry["n"]
+        saved_ms = (entry["regular"] - entry["structured"]) / n * ms_per_token
+        latency_ms = entry["latency"] / n * 1000
+        row = {
+            "scenario": "structured", "workload": workload, "input_type": kind, "answers": n,
+            "regular_tokens": round(entry["regular"] / n, 1),
+            "structured_tokens": round(entry["structured"] / n, 1),
+            "token_reduction_pct": round(100 * (1 - entry["structured"] / entry["regular"]), 1)
+            if entry["regular"] else 0.0,
+            "est_decode_ms_saved": round(saved_ms, 1),
+            "roundtrip_ok": f"{entry['roundtrip']}/{n}",
+        }
+        if workload == "recorded":
+            row["recorded_latency_ms"] = round(latency_ms, 1)
+            row["est_structured_latency_ms"] = round(max(0.0, latency_ms - saved_ms), 1)
+        rows.append(row)
+    return rows
+
+
+SCENARIOS = {
+    "startup": startup,
+    "render": render,
+    "bandwidth": bandwidth,
+    "payload": payload,
+    "load": load,
+    "batching": batching,
+    "hedging": hedging,
+    "structured": structured,
+}
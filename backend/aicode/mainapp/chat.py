@@ -0,0 +1,144 @@
+"""
+Chat sessions with a bounded conversation context.
+
+A ChatSession keeps the most recent turns verbatim and folds older ones
+into a short extractive summary, so the context sent with each prompt
+stays under CONTEXT_TOKENS however long the conversation runs. Turns are
+stored compacted: assistant replies keep the answer and the code they
+produced, clipped to TURN_TOKENS, not the whole response payload.
+
+Chat messages share the admission lanes of /api/v2/analyze/ (see
+mainapp/admission.py), so a busy socket cannot starve the HTTP API.
+"""
+from django.conf import settings
+from django.db import transaction
+
+from . import admission, routing
+from .models import ChatSession
+from .prompts import clip_text, estimate_tokens
+
+
+CHAT_DEFAULTS = {
+    'CONTEXT_TOKENS': 1500,  # budget for summary + recent turns
+    'SUMMARY_TOKENS': 300,   # budget for the summary of older turns
+    'TURN_TOKENS': 400,      # cap on a single stored turn
+    'MIN_RECENT_TURNS': 2,   # always keep at least this many turns verbatim
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'CHAT', {}).get(name, CHAT_DEFAULTS[name])
+
+
+# ============== TURNS ==============
+
+def _indent(code):
+    # Indented rather than fenced, so the context never opens a ``` block
+    # that could be mistaken for the code under review.
+    return "\n".join("    " + line for line in code.splitlines())
+
+
+def user_turn(query):
+    return {"role": "user", "text": clip_text(query.strip(), get_setting('TURN_TOKENS'))}
+
+
+def assistant_turn(response_data):
+    """Compact an analyze response into the part worth remembering."""
+    parts = []
+    answer = response_data.get("answer") or ""
+    if answer:
+        parts.append(answer.strip())
+    error = response_data.get("error")
+    if isinstance(error, dict) and error.get("message"):
+        parts.append(f"Error: {error['message']}")
+    code = response_data.get("corrected_code") or response_data.get("example_code") or ""
+    if code:
+        best = response_data.get("best_version")
+        for version in response_data.get("improved_versions") or []:
+            if version.get("version") == best and version.get("code"):
+                code = version["code"]
+                break
+        parts.append("Code:\n" + _indent(code.strip()))
+    text = "\n".join(parts) or response_data.get("type", "")
+    return {"role": "assistant", "text": clip_text(text, get_setting('TURN_TOKENS'))}
+
+
+def _summary_line(turn):
+    first_line = turn["text"].strip().splitlines()[0] if turn["text"].strip() else ""
+    who = "User asked" if turn["role"] == "user" else "Assistant answered"
+    if len(first_line) > 100:
+        first_line = first_line[:97] + "..."
+    return f"- {who}: {first_line}"
+
+
+def compact(session):
+    """Fold the oldest turns into the summary until the context fits the budget."""
+    budget = get_setting('CONTEXT_TOKENS')
+    keep = get_setting('MIN_RECENT_TURNS')
+    summary = session.summary.splitlines() if session.summary else []
+    turns = list(session.turns)
+
+    def total():
+        return estimate_tokens("\n".join(summary)) + sum(estimate_tokens(t["text"]) for t in turns)
+
+    while len(turns) > keep and total() > budget:
+        summary.append(_summary_line(turns.pop(0)))
+    # The summary has its own cap; the oldest summary lines go first
+    summary_budget = get_setting('SUMMARY_TOKENS')
+    while summary and estimate_tokens("\n".join(summary)) > summary_budget:
+        summary.pop(0)
+        session.dropped_turns += 1
+
+    session.summary = "\n".join(summary)
+    session.turns = turns
+    session.token_count = total()
+
+
+def build_context(session):
+    """Render the stored conversation as a prompt prefix ("" for a new session)."""
+    if not session.summary and not session.turns:
+        return ""
+    lines = ["Conversation so far (use it to resolve follow-up requests):"]
+    if session.summary:
+        lines += ["Earlier:", session.summary]
+    for turn in session.turns:
+        lines.append(f"{'User' if turn['role'] == 'user' else 'Assistant'}: {turn['text']}")
+    lines.append("Current request follows.")
+    return "\n".join(lines)
+
+
+# ============== SESSIONS ==============
+
+def get_or_create_session(session_id=None):
+    if session_id:
+        session = ChatSession.objects.filter(pk=session_id).first()
+        if session is not None:
+            return session
+    return ChatSession.objects.create()
+
+
+def lane(query):
+    """The admission lane `query` runs in."""
+    from .views import detect_input_type
+
+    return admission.classify(detect_input_type(query))
+
+
+def respond(session_id, query, profile=False):
+    """
+    Answer `query` within a session and record both turns. Returns the
+    response dict; raises admission.Overloaded when its lane is full.
+    """
+    from .views import analyze_query
+
+    session = ChatSession.objects.get(pk=session_id)
+    with admission.admit(lane(query)), routing.request_key(f"chat:{session_id}"):
+        response_data = analyze_query(query, profile=profile, context=build_context(session))
+
+    with transaction.atomic():
+        session = ChatSession.objects.select_for_update().get(pk=session_id)
+        session.turns = session.turns + [user_turn(query), assistant_turn(response_data)]
+        session.turn_count += 2
+        compact(session)
+        session.save()
+    return response_data
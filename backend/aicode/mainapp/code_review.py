@@ -0,0 +1,15 @@
+"""
+The review text stored with each CodeReview (POST /api/v2/aicode/).
+
+Kept free of Django imports so worker processes can run it, e.g. when
+`manage.py reanalyze_reviews` recomputes stored reviews after a change here.
+"""
+import ast
+
+
+def review_code(code):
+    try:
+        ast.parse(code)
+        return "✅ Code is syntactically correct."
+    except SyntaxError as e:
+        return f"❌ Syntax Error: {e}"
@@ -0,0 +1,104 @@
+"""
+WebSocket chat endpoint, served as a plain ASGI application.
+
+    ws://<host>/ws/chat/              start a new session
+    ws://<host>/ws/chat/<session id>/ resume a stored session
+
+After connecting the server sends {"type": "session", "session": <id>}.
+Each client message {"query": "...", "profile": false} is answered with
+{"type": "analysis", "data": <analyze response>} using the session's
+conversation as context; malformed messages get {"type": "error"}.
+
+Messages count against the client's rate limit buckets like API requests
+(see mainapp/throttling.py) and run in the admission lanes. A throttled or
+turned away message gets {"type": "error", "error": ..., "retry_after": n}
+and is not answered.
+"""
+import json
+import re
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from rest_framework.settings import api_settings
+
+from . import admission, chat, throttling
+
+
+CHAT_PATH = re.compile(r'^/ws/chat/(?:(?P<session>[0-9a-fA-F-]{36})/)?$')
+
+
+def _run_db(func, *args, **kwargs):
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def _send_json(send, payload):
+    await send({"type": "websocket.send", "text": json.dumps(payload)})
+
+
+def _client(scope):
+    """(API key, IP address) of the connecting client, as the HTTP throttle sees them."""
+    headers = {name.decode("latin-1").lower(): value.decode("latin-1") for name, value in scope.get("headers", [])}
+    ident = (scope.get("client") or ("",))[0] or ""
+    forwarded = headers.get("x-forwarded-for")
+    num_proxies = api_settings.NUM_PROXIES
+    if num_proxies and forwarded:
+        addresses = forwarded.split(",")
+        ident = addresses[-min(num_proxies, len(addresses))].strip()
+    return headers.get(throttling.get_setting('API_KEY_HEADER').lower(), ""), ident
+
+
+def _check_rate(query, api_key, ident):
+    bucket = throttling.LLM if chat.lane(query) == admission.LLM else throttling.LOCAL
+    return throttling.check_client(bucket, api_key, ident)
+
+
+async def chat_application(scope, receive, send):
+    match = CHAT_PATH.match(scope["path"])
+    event = await receive()
+    if event["type"] != "websocket.connect":
+        return
+    try:
+        session_id = match and match.group("session") and uuid.UUID(match.group("session"))
+    except ValueError:
+        match = None
+    if match is None:
+        await send({"type": "websocket.close", "code": 4404})
+        return
+
+    api_key, ident = _client(scope)
+    session = await sync_to_async(_run_db)(chat.get_or_create_session, session_id)
+    await send({"type": "websocket.accept"})
+    await _send_json(send, {"type": "session", "session": str(session.pk), "turns": session.turn_count})
+
+    while True:
+        event = await receive()
+        if event["type"] == "websocket.disconnect":
+            return
+        if event["type"] != "websocket.receive":
+            continue
+        try:
+            message = json.loads(event.get("text") or event.get("bytes") or b"")
+            query = message["query"]
+            if not isinstance(query, str) or not query.strip():
+                raise ValueError("query must be a non-empty string")
+        except (ValueError, KeyError, TypeError) as e:
+            await _send_json(send, {"type": "error", "error": f"Invalid message: {e}"})
+            continue
+        limit = await sync_to_async(_check_rate, thread_sensitive=False)(query, api_key, ident)
+        if limit is not None and not limit.allowed:
+            await _send_json(send, {"type": "error", "error": "Rate limit exceeded", "retry_after": limit.retry_after})
+            continue
+        # Analyses block on the LLM and the sandbox, so they run off the event loop
+        try:
+            response_data = await sync_to_async(_run_db, thread_sensitive=False)(
+                chat.respond, session.pk, query, profile=bool(message.get("profile"))
+            )
+        except admission.Overloaded as e:
+            await _send_json(send, {"type": "error", "error": str(e.detail), "retry_after": e.wait})
+            continue
+        await _send_json(send, {"type": "analysis", "data": response_data})
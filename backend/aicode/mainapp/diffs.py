@@ -0,0 +1,115 @@
+"""
+Compact response format: every code field as a patch against one base.
+
+A code response can carry the same source five times (corrected_code,
+example_code and three improved versions). In the compact format the base
+source is sent once as `code_base`, the code fields are emptied and
+`code_patches` says how to rebuild each of them:
+
+    {"same": true}              identical to code_base
+    {"ref": "<target>"}         identical to another, earlier target
+    {"edits": [[i, j, [...]]]}  replace base lines i:j with the given lines
+    {"text": "..."}             full text, when an edit script is not smaller
+
+Targets are "corrected_code", "example_code" and "improved_versions.<n>",
+where n is the index in improved_versions. Lines are split on line feeds
+only and keep them, so joining them restores the text exactly.
+"""
+import difflib
+import json
+
+
+def _targets(data):
+    yield "corrected_code", data.get("corrected_code") or ""
+    yield "example_code", data.get("example_code") or ""
+    for index, version in enumerate(data.get("improved_versions") or []):
+        yield f"improved_versions.{index}", version.get("code") or ""
+
+
+def split_lines(text):
+    """Split on line feeds only (unlike str.splitlines), keeping them."""
+    lines = text.split("\n")
+    return [line + "\n" for line in lines[:-1]] + ([lines[-1]] if lines[-1] else [])
+
+
+def edit_script(base_lines, text):
+    """Line edits that turn `base_lines` into `text`, as [i, j, new_lines] triples."""
+    lines = split_lines(text)
+    matcher = difflib.SequenceMatcher(None, base_lines, lines, autojunk=False)
+    return [
+        [i1, i2, lines[j1:j2]]
+        for tag, i1, i2, j1, j2 in matcher.get_opcodes()
+        if tag != "equal"
+    ]
+
+
+def apply_edits(base, edits):
+    lines = split_lines(base)
+    out, position = [], 0
+    for start, end, replacement in edits:
+        out.extend(lines[position:start])
+        out.extend(replacement)
+        position = end
+    out.extend(lines[position:])
+    return "".join(out)
+
+
+def compact_response(data):
+    """Return a copy of an analyze response in the compact format."""
+    base = data.get("corrected_code") or data.get("example_code") or ""
+    if not base:
+        return data
+    base_lines = split_lines(base)
+
+    compact = dict(data)
+    if "improved_versions" in data:
+        compact["improved_versions"] = [dict(v) for v in data["improved_versions"] or []]
+    patches = {}
+    seen = {}
+    for target, text in _targets(data):
+        if not text:
+            continue
+        if text == base:
+            patches[target] = {"same": True}
+        elif text in seen:
+            patches[target] = {"ref": seen[text]}
+        else:
+            edits = edit_script(base_lines, text)
+            encoded = len(json.dumps(edits, ensure_ascii=False))
+            patches[target] = {"edits": edits} if encoded < len(text) else {"text": text}
+            seen[text] = target
+        _set_code(compact, target, "")
+
+    compact["code_base"] = base
+    compact["code_patches"] = patches
+    return compact
+
+
+def expand_response(data):
+    """Rebuild the full code fields of a compact response."""
+    if "code_patches" not in data:
+        return data
+    full = dict(data)
+    if "improved_versions" in data:
+        full["improved_versions"] = [dict(v) for v in data["improved_versions"] or []]
+    base = full.pop("code_base", "")
+    texts = {}
+    for target, patch in full.pop("code_patches").items():
+        if patch.get("same"):
+            text = base
+        elif "ref" in patch:
+            text = texts[patch["ref"]]
+        elif "edits" in patch:
+            text = apply_edits(base, patch["edits"])
+        else:
+            text = patch["text"]
+        texts[target] = text
+        _set_code(full, target, text)
+    return full
+
+
+def _set_code(data, target, text):
+    if target.startswith("improved_versions."):
+        data["improved_versions"][int(target.split(".", 1)[1])]["code"] = text
+    else:
+        data[target] = text
@@ -0,0 +1,169 @@
+"""
+Hedged LLM calls: cut the latency tail by racing a second identical call.
+
+With HEDGING enabled, routing runs each model call on a small thread pool.
+If it has not finished after the rolling PERCENTILE latency of its prompt
+kind, an identical second call is fired and whichever finishes first is
+used. The loser is cancelled if it has not started; a request already in
+flight cannot be aborted, so its result is dropped when it arrives.
+
+Hedges are paid for out of a budget: every call earns BUDGET_PCT / 100 of
+a hedge (up to BURST saved), and a hedge spends one, so hedges add at most
+about BUDGET_PCT percent to upstream load. The delay is learnt from the
+first call of every pair, hedged or not, so hedging does not pull its own
+threshold down.
+
+Counters (GET /api/v2/metrics/): hedge.<kind>.calls, .hedged, .wins (the
+hedge finished first) and .over_budget, plus the derived hedge_rate and
+win_rate. Routing logs every upstream call, hedges included, to
+LLMCallLog (reason "hedge"), so their cost shows in `routing_report`.
+"""
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from . import metrics
+
+
+HEDGING_DEFAULTS = {
+    'ENABLED': False,
+    'PERCENTILE': 95,     # hedge once a call is slower than this share of recent calls
+    'WINDOW': 200,        # recent latencies kept per kind
+    'MIN_SAMPLES': 20,    # no hedging until this many latencies are known
+    'MIN_DELAY': 0.05,    # seconds; never hedge sooner than this
+    'BUDGET_PCT': 10,     # extra upstream calls, as a percentage of calls
+    'BURST': 5,           # hedges that can be saved up while the tail is quiet
+    'WORKERS': 32,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'HEDGING', {}).get(name, HEDGING_DEFAULTS[name])
+
+
+# ============== LATENCY AND BUDGET ==============
+
+_latencies = {}
+_budget = [0.0]
+_lock = threading.Lock()
+
+
+def observe(kind, seconds):
+    with _lock:
+        window = _latencies.get(kind)
+        if window is None or window.maxlen != get_setting('WINDOW'):
+            window = _latencies[kind] = deque(window or (), maxlen=get_setting('WINDOW'))
+        window.append(seconds)
+
+
+def hedge_delay(kind):
+    """Seconds to wait before hedging a call of `kind`, or None while too few calls are known."""
+    with _lock:
+        samples = sorted(_latencies.get(kind, ()))
+    if len(samples) < get_setting('MIN_SAMPLES'):
+        return None
+    index = min(len(samples) - 1, int(len(samples) * get_setting('PERCENTILE') / 100))
+    return max(get_setting('MIN_DELAY'), samples[index])
+
+
+def _earn():
+    with _lock:
+        _budget[0] = min(get_setting('BURST'), _budget[0] + get_setting('BUDGET_PCT') / 100)
+
+
+def _spend():
+    with _lock:
+        if _budget[0] < 1:
+            return False
+        _budget[0] -= 1
+        return True
+
+
+def reset():
+    with _lock:
+        _latencies.clear()
+        _budget[0] = 0.0
+
+
+# ============== CALLS ==============
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=get_setting('WORKERS'), thread_name_prefix="llm-hedge")
+    return _pool
+
+
+def _timed(fn, hedge):
+    # Calls log to the database from pool threads, which outlive requests:
+    # give each task its own connection, as jobs._run_inline does
+    close_old_connections()
+    try:
+        started = time.perf_counter()
+        return fn(hedge), time.perf_counter() - started
+    finally:
+        connection.close()
+
+
+def call(kind, fn):
+    """
+    Return `fn(False)`, hedged with a second call `fn(True)` when the first
+    is slow. When the first call to finish raised, the other is awaited
+    before giving up.
+    """
+    if not get_setting('ENABLED'):
+        return fn(False)
+
+    metrics.increment(f"hedge.{kind}.calls")
+    _earn()
+    pool = _get_pool()
+    primary = pool.submit(_timed, fn, False)
+
+    def record(future):
+        if not future.cancelled() and future.exception() is None:
+            observe(kind, future.result()[1])
+
+    primary.add_done_callback(record)
+
+    delay = hedge_delay(kind)
+    if delay is None or wait([primary], timeout=delay).done:
+        return primary.result()[0]
+    if not _spend():
+        metrics.increment(f"hedge.{kind}.over_budget")
+        return primary.result()[0]
+
+    metrics.increment(f"hedge.{kind}.hedged")
+    hedge = pool.submit(_timed, fn, True)
+    pending = {primary, hedge}
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                for other in pending:
+                    other.cancel()
+                if future is hedge:
+                    metrics.increment(f"hedge.{kind}.wins")
+                return future.result()[0]
+    return primary.result()[0]  # both failed: raise the primary's error
+
+
+def rates(counters):
+    """Hedge and win rates per kind from a metrics snapshot."""
+    derived = {}
+    for name, calls in counters.items():
+        if name.startswith("hedge.") and name.endswith(".calls") and calls:
+            prefix = name[:-len("calls")]
+            hedged = counters.get(f"{prefix}hedged", 0)
+            derived[f"{prefix}hedge_rate"] = round(hedged / calls, 4)
+            derived[f"{prefix}win_rate"] = round(counters.get(f"{prefix}wins", 0) / hedged, 4) if hedged else 0.0
+    return derived
@@ -0,0 +1,260 @@
+"""
+DB-backed job queue for long analyses.
+
+`POST /api/v2/jobs/` enqueues an AnalysisJob; workers started with
+`manage.py run_jobs` claim jobs, run the analyze pipeline and write partial
+and final results back to the row. No broker is needed: on databases that
+support it jobs are claimed with SELECT ... FOR UPDATE SKIP LOCKED,
+elsewhere (SQLite) with a conditional UPDATE that only one worker can win.
+
+A claim lasts VISIBILITY_TIMEOUT seconds and is extended whenever the job
+reports progress, so a job whose worker died is picked up again once its
+claim expires. Failed attempts are retried after RETRY_DELAY seconds until
+the job's max_attempts is reached; an expired claim counts as an attempt,
+and workers mark jobs whose last attempt expired as failed every
+SWEEP_INTERVAL seconds.
+
+Progressive code reviews (`POST /api/v2/analyze/` with "progressive")
+enqueue the LLM phase as a job and `start` it right away on a small thread
+pool in the web process; GET /api/v2/jobs/<id>/events/ streams its
+progress as Server-Sent Events for up to EVENT_TIMEOUT seconds, in a place
+in the stream admission lane. Such a job runs in the place its request
+reserved in the LLM admission lane, which also bounds the pool's queue.
+"""
+import contextlib
+import os
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import results, routing
+from .models import AnalysisJob
+
+
+JOB_DEFAULTS = {
+    'VISIBILITY_TIMEOUT': 300,  # seconds a claim lasts without progress
+    'MAX_ATTEMPTS': 3,
+    'RETRY_DELAY': 5,           # seconds before a failed job is retried
+    'POLL_INTERVAL': 1.0,       # seconds an idle worker sleeps
+    'SWEEP_INTERVAL': 60,       # seconds between sweeps for abandoned jobs
+    'WORKERS': 2,
+    'INLINE_WORKERS': 4,        # threads running jobs started by web requests
+    'EVENT_POLL_INTERVAL': 0.2,  # seconds between job checks of an event stream
+    'EVENT_TIMEOUT': 60,        # seconds an event stream follows a job
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'JOBS', {}).get(name, JOB_DEFAULTS[name])
+
+
+def enqueue(query, profile=False, partial=None):
+    """Create a queued job and return it."""
+    return AnalysisJob.objects.create(
+        query=query,
+        options=results.analysis_options(profile=profile),
+        partial=partial or {},
+        max_attempts=get_setting('MAX_ATTEMPTS'),
+    )
+
+
+def job_timings(job):
+    """Queue wait and run time in ms, as far as they are known."""
+    timings = {}
+    if job.started_at:
+        timings["queue_ms"] = round((job.started_at - job.created_at).total_seconds() * 1000, 1)
+    if job.started_at and job.finished_at:
+        timings["run_ms"] = round((job.finished_at - job.started_at).total_seconds() * 1000, 1)
+    return timings
+
+
+# ============== CLAIMING ==============
+
+def _claimable(now):
+    return AnalysisJob.objects.filter(
+        Q(status=AnalysisJob.QUEUED, locked_until__isnull=True)
+        | Q(status=AnalysisJob.QUEUED, locked_until__lte=now)
+        | Q(status=AnalysisJob.RUNNING, locked_until__lte=now, attempts__lt=F("max_attempts"))
+    ).order_by("id")
+
+
+def _claim_fields(worker_id, now):
+    return {
+        "status": AnalysisJob.RUNNING,
+        "locked_by": worker_id,
+        "locked_until": now + timedelta(seconds=get_setting('VISIBILITY_TIMEOUT')),
+        "attempts": F("attempts") + 1,
+        "started_at": now,
+    }
+
+
+def claim(worker_id):
+    """Claim the oldest runnable job for `worker_id`; returns it or None."""
+    now = timezone.now()
+    claim_fields = _claim_fields(worker_id, now)
+
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            job = _claimable(now).select_for_update(skip_locked=True).first()
+            if job is None:
+                return None
+            AnalysisJob.objects.filter(pk=job.pk).update(**claim_fields)
+        job.refresh_from_db()
+        return job
+
+    # Without SKIP LOCKED, race on a conditional UPDATE: it only matches if
+    # no other worker changed the row since we read it.
+    for job in _claimable(now)[:10]:
+        won = AnalysisJob.objects.filter(
+            pk=job.pk, status=job.status, locked_until=job.locked_until, attempts=job.attempts,
+        ).update(**claim_fields)
+        if won:
+            job.refresh_from_db()
+            return job
+    return None
+
+
+def fail_abandoned(now=None):
+    """Mark running jobs whose claim expired on their last attempt as failed; returns how many."""
+    now = now or timezone.now()
+    return AnalysisJob.objects.filter(
+        status=AnalysisJob.RUNNING, locked_until__lte=now, attempts__gte=F("max_attempts"),
+    ).update(
+        status=AnalysisJob.FAILED,
+        locked_until=None,
+        error="Claim expired on the last attempt (worker died or stalled)",
+        finished_at=now,
+    )
+
+
+# ============== RUNNING ==============
+
+def run_job(job):
+    """Run a claimed job to completion, recording partial results on the way."""
+    from .views import analyze_query
+
+    # A job started by a progressive request arrives with its local stage
+    partial = dict(job.partial)
+    local = None
+    if partial.get("stage") == "local":
+        from .views import LOCAL_FIELDS
+        local = {field: partial.get(field) for field in LOCAL_FIELDS}
+    visibility = timedelta(seconds=get_setting('VISIBILITY_TIMEOUT'))
+
+    def on_partial(stage, fields):
+        partial.update(fields)
+        partial["stage"] = stage
+        # Progress also extends the claim
+        AnalysisJob.objects.filter(pk=job.pk, locked_by=job.locked_by).update(
+            partial=partial, locked_until=timezone.now() + visibility,
+        )
+
+    try:
+        with routing.request_key(f"job:{job.pk}"):
+            response_data = analyze_query(
+                job.query, profile=job.options.get("profile", False), on_partial=on_partial, local=local,
+            )
+    except Exception as e:
+        print(f"Job {job.pk} error: {e}")
+        retry = job.attempts < job.max_attempts
+        AnalysisJob.objects.filter(pk=job.pk, locked_by=job.locked_by).update(
+            status=AnalysisJob.QUEUED if retry else AnalysisJob.FAILED,
+            locked_until=timezone.now() + timedelta(seconds=get_setting('RETRY_DELAY')) if retry else None,
+            error=f"{type(e).__name__}: {e}",
+            finished_at=None if retry else timezone.now(),
+        )
+        return False
+
+    key = results.analysis_key(job.query, job.options)
+    results.store_result(key, job.query, job.options, response_data)
+    AnalysisJob.objects.filter(pk=job.pk, locked_by=job.locked_by).update(
+        status=AnalysisJob.DONE,
+        result=response_data,
+        partial=partial,
+        locked_until=None,
+        error="",
+        finished_at=timezone.now(),
+    )
+    return True
+
+
+_inline_executor = None
+_inline_lock = threading.Lock()
+
+
+def start(job, reservation=None):
+    """
+    Run a just-enqueued job in this process rather than waiting for a
+    worker, in `reservation` (an admission.Reservation) if given. If this
+    process dies, queue workers pick the job up once its claim expires.
+    """
+    global _inline_executor
+    if _inline_executor is None:
+        with _inline_lock:
+            if _inline_executor is None:
+                _inline_executor = ThreadPoolExecutor(
+                    max_workers=get_setting('INLINE_WORKERS'), thread_name_prefix="job-inline",
+                )
+    _inline_executor.submit(_run_inline, job.pk, reservation)
+
+
+def _run_inline(pk, reservation=None):
+    close_old_connections()
+    try:
+        with reservation or contextlib.nullcontext():
+            worker_id = f"{socket.gethostname()}:{os.getpid()}:inline"
+            won = AnalysisJob.objects.filter(pk=pk, status=AnalysisJob.QUEUED, locked_until__isnull=True).update(
+                **_claim_fields(worker_id, timezone.now())
+            )
+            if won:
+                run_job(AnalysisJob.objects.get(pk=pk))
+    finally:
+        connection.close()
+
+
+def work(worker_id, stop_event, once=False):
+    """Claim and run jobs until `stop_event` is set (or the queue is empty with `once`)."""
+    next_sweep = 0
+    try:
+        while not stop_event.is_set():
+            close_old_connections()
+            if time.monotonic() >= next_sweep:
+                fail_abandoned()
+                next_sweep = time.monotonic() + get_setting('SWEEP_INTERVAL')
+            job = claim(worker_id)
+            if job is None:
+                if once:
+                    return
+                stop_event.wait(get_setting('POLL_INTERVAL'))
+                continue
+            run_job(job)
+    finally:
+        connection.close()
+
+
+def run_workers(workers=None, once=False, stop_event=None):
+    """Run a pool of worker threads in this process; blocks until they stop."""
+    workers = workers or get_setting('WORKERS')
+    stop_event = stop_event or threading.Event()
+    prefix = f"{socket.gethostname()}:{os.getpid()}"
+    threads = [
+        threading.Thread(target=work, args=(f"{prefix}:{n}", stop_event, once), name=f"job-worker-{n}")
+        for n in range(workers)
+    ]
+    for thread in threads:
+        thread.start()
+    try:
+        while any(thread.is_alive() for thread in threads):
+            for thread in threads:
+                thread.join(timeout=0.5)
+    except KeyboardInterrupt:
+        stop_event.set()
+        for thread in threads:
+            thread.join()
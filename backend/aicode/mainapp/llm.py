@@ -0,0 +1,325 @@
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from pathlib import Path
+
+from django.conf import settings
+
+
+DEFAULT_MODEL = 'gemini-1.5-flash'
+
+
+class LLMError(Exception):
+    """Raised when a provider cannot produce a completion."""
+
+
+class ImproperlyConfiguredProvider(LLMError):
+    """Raised when `LLM_PROVIDER` names an unknown backend."""
+
+
+class LLMTimeout(LLMError):
+    """Raised when a completion takes longer than the configured timeout."""
+
+
+# ============== PROVIDERS ==============
+
+class LLMProvider:
+    """Base class for LLM backends. Subclasses implement `generate`."""
+
+    name = "base"
+
+    def is_available(self):
+        """Return True if the provider can serve requests."""
+        return True
+
+    def generate(self, prompt, model=None, config=None):
+        """
+        Return the raw completion text for `prompt`.
+
+        `config` holds generation settings: "max_output_tokens",
+        "temperature", "timeout" (seconds) and "response_schema" (a JSON
+        schema the reply must follow), all optional.
+        """
+        raise NotImplementedError
+
+
+class GeminiProvider(LLMProvider):
+    """
+    Google Gemini through the `google.generativeai` SDK.
+
+    The SDK is slow to import, so it is imported and configured on the first
+    call rather than at module import (or explicitly via `load_sdk`).
+    """
+
+    name = "gemini"
+
+    def __init__(self, api_key=None):
+        self.api_key = api_key if api_key is not None else os.environ.get('GEMINI_API_KEY', '')
+        self._genai = None
+        self._lock = threading.Lock()
+
+    def is_available(self):
+        return bool(self.api_key)
+
+    def load_sdk(self):
+        """Import and configure the SDK once; returns the `genai` module."""
+        if self._genai is None:
+            with self._lock:
+                if self._genai is None:
+                    import google.generativeai as genai
+                    genai.configure(api_key=self.api_key)
+                    self._genai = genai
+        return self._genai
+
+    def generate(self, prompt, model=None, config=None):
+        if not self.api_key:
+            raise LLMError("GEMINI_API_KEY is not set")
+        genai = self.load_sdk()
+        config = config or {}
+        generation_config = {
+            key: config[key] for key in ("max_output_tokens", "temperature") if config.get(key) is not None
+        }
+        if config.get("response_schema"):
+            generation_config["response_mime_type"] = "application/json"
+            generation_config["response_schema"] = config["response_schema"]
+        request_options = {"timeout": config["timeout"]} if config.get("timeout") else None
+        try:
+            response = genai.GenerativeModel(model or DEFAULT_MODEL).generate_content(
+                prompt, generation_config=generation_config or None, request_options=request_options,
+            )
+        except Exception as e:
+            # google.api_core raises DeadlineExceeded, the transport its own timeouts
+            if isinstance(e, TimeoutError) or type(e).__name__ in ("DeadlineExceeded", "ReadTimeout", "Timeout"):
+                raise LLMTimeout(str(e)) from e
+            raise
+        return response.text
+
+
+class FakeProvider(LLMProvider):
+    """
+    Deterministic offline provider for load tests, benchmarks and CI.
+
+    Latency is drawn from a log-normal distribution around `latency_ms`
+    (spread controlled by `latency_sigma`) and a call fails with probability
+    `error_rate`. Both are seeded from `seed` and the prompt, so the same
+    prompt always gets the same latency and outcome regardless of call order.
+    `model_latency_ms` overrides `latency_ms` per model name, and a call whose
+    latency exceeds the configured timeout raises LLMTimeout at the timeout.
+    """
+
+    name = "fake"
+
+    def __init__(self, latency_ms=0, latency_sigma=0.0, error_rate=0.0, seed=0, response=None,
+                 model_latency_ms=None):
+        self.latency_ms = latency_ms
+        self.model_latency_ms = model_latency_ms or {}
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.seed = seed
+        self.response = response or "This is a simulated answer."
+
+    def _rng(self, prompt, model):
+        digest = hashlib.sha256(f"{self.seed}:{model}:{prompt}".encode()).digest()
+        return random.Random(int.from_bytes(digest[:8], 'big'))
+
+    def sample_latency(self, rng, model=None):
+        latency_ms = self.model_latency_ms.get(model, self.latency_ms)
+        if not latency_ms:
+            return 0.0
+        return latency_ms / 1000 * rng.lognormvariate(0, self.latency_sigma)
+
+    def generate(self, prompt, model=None, config=None):
+        rng = self._rng(prompt, model)
+        latency = self.sample_latency(rng, model)
+        timeout = (config or {}).get("timeout")
+        if timeout and latency > timeout:
+            time.sleep(timeout)
+            raise LLMTimeout(f"Simulated timeout after {timeout}s")
+        time.sleep(latency)
+        if rng.random() < self.error_rate:
+            raise LLMError("Simulated provider error")
+        if (config or {}).get("response_schema"):
+            return json.dumps(self.build_structured_payload(prompt, config["response_schema"]))
+        return json.dumps(self.build_payload(prompt))
+
+    def build_payload(self, prompt):
+        """Build a JSON answer that satisfies every handler's prompt format."""
+        code = _extract_code_block(prompt) or "print('Hello, World!')"
+        questions = _BATCH_QUESTION_RE.findall(prompt)
+        if questions:
+            # A micro-batched prompt (see mainapp/batching.py)
+            return {"answers": [
+                {"id": int(i), "response": self.response, "example_code": "", "best_practices": []}
+                for i in questions
+            ]}
+        return {
+            "response": self.response,
+            "example_code": "",
+            "best_practices": [],
+            "code": code,
+            "explanation": self.response,
+            "is_valid": True,
+            "error": None,
+            "corrected_code": code,
+            "improvements": [
+                {"version": 1, "code": code, "explanation": "Original code"},
+                {"version": 2, "code": code, "explanation": "More Pythonic version"},
+                {"version": 3, "code": code, "explanation": "Optimized version"},
+            ],
+            "best_version": 2,
+        }
+
+    def build_structured_payload(self, prompt, schema):
+        """Answer a structured-output prompt (see mainapp/structured.py) with the fields of `schema`."""
+        payload = self.build_payload(prompt)
+        fields = schema.get("properties", {})
+        if "fix" in fields:
+            # A code review: no fix, and improvements as (empty) edit hunks
+            payload["fix"] = []
+            payload["improvements"] = [
+                {"version": item["version"], "explanation": item["explanation"], "edits": []}
+                for item in payload["improvements"]
+            ]
+        return {name: payload[name] for name in fields if name in payload}
+
+
+class RecordReplayProvider(LLMProvider):
+    """
+    Capture completions from another provider to disk and play them back.
+
+    Modes:
+      - "record": always call the inner provider and save the response.
+      - "replay": only serve saved responses; a missing recording is an error.
+      - "auto":   replay when a recording exists, otherwise record it.
+
+    Each recording is one JSON file named after a hash of the model and
+    prompt, holding the prompt, the response text and the observed latency.
+    With `simulate_latency` the recorded latency is slept on playback so
+    offline runs keep realistic timing.
+    """
+
+    name = "replay"
+
+    def __init__(self, inner=None, directory=None, mode="auto", simulate_latency=True):
+        if mode not in ("record", "replay", "auto"):
+            raise ValueError(f"Unknown record/replay mode: {mode}")
+        self.inner = inner
+        self.directory = Path(directory or Path(settings.BASE_DIR) / 'llm_recordings')
+        self.mode = mode
+        self.simulate_latency = simulate_latency
+        self._lock = threading.Lock()
+
+    def is_available(self):
+        if self.mode == "replay":
+            return True
+        return self.inner is not None and self.inner.is_available()
+
+    def recording_path(self, prompt, model=None):
+        key = hashlib.sha256(f"{model or DEFAULT_MODEL}\n{prompt}".encode()).hexdigest()
+        return self.directory / f"{key}.json"
+
+    def generate(self, prompt, model=None, config=None):
+        path = self.recording_path(prompt, model)
+        if self.mode != "record" and path.exists():
+            with open(path, encoding='utf-8') as f:
+                recording = json.load(f)
+            if self.simulate_latency:
+                time.sleep(recording.get("latency", 0))
+            return recording["response"]
+
+        if self.mode == "replay":
+            raise LLMError(f"No recording for prompt ({path.name})")
+        if self.inner is None:
+            raise LLMError("Record mode needs an inner provider")
+
+        started = time.perf_counter()
+        text = self.inner.generate(prompt, model=model, config=config)
+        recording = {
+            "model": model or DEFAULT_MODEL,
+            "prompt": prompt,
+            "response": text,
+            "latency": round(time.perf_counter() - started, 4),
+        }
+        with self._lock:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_suffix('.tmp')
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(recording, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, path)
+        return text
+
+
+_BATCH_QUESTION_RE = re.compile(r"^### Question (\d+)$", re.MULTILINE)
+
+
+def _extract_code_block(prompt):
+    """Return the first fenced code block in `prompt`, if any."""
+    start = prompt.find("```")
+    if start < 0:
+        return ""
+    start = prompt.find("\n", start) + 1
+    end = prompt.find("```", start)
+    if start <= 0 or end < 0:
+        return ""
+    return prompt[start:end].strip("\n")
+
+
+# ============== PROVIDER SELECTION ==============
+
+PROVIDER_BACKENDS = {
+    "gemini": GeminiProvider,
+    "fake": FakeProvider,
+    "replay": RecordReplayProvider,
+}
+
+_provider = None
+_provider_lock = threading.Lock()
+
+
+def build_provider(config):
+    """
+    Build a provider from a settings dict such as::
+
+        {"BACKEND": "replay", "OPTIONS": {"mode": "auto", "inner": {"BACKEND": "gemini"}}}
+    """
+    backend = config.get("BACKEND", "gemini")
+    try:
+        provider_class = PROVIDER_BACKENDS[backend]
+    except KeyError:
+        raise ImproperlyConfiguredProvider(f"Unknown LLM provider backend: {backend}")
+
+    options = dict(config.get("OPTIONS", {}))
+    if "inner" in options:
+        options["inner"] = build_provider(options["inner"])
+    return provider_class(**options)
+
+
+def get_provider():
+    """Return the process-wide provider configured by `settings.LLM_PROVIDER`."""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = build_provider(getattr(settings, 'LLM_PROVIDER', {}))
+    return _provider
+
+
+def set_provider(provider):
+    """Replace the process-wide provider (used by benchmarks and tooling)."""
+    global _provider
+    with _provider_lock:
+        _provider = provider
+
+
+def is_available():
+    """Return True if the configured provider can serve requests."""
+    return get_provider().is_available()
+
+
+def generate(prompt, model=None, config=None):
+    """Send `prompt` to the configured provider and return the completion text."""
+    return get_provider().generate(prompt, model=model, config=config)
@@ -0,0 +1,31 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from mainapp.retention import archive_reviews, database_size, get_setting, vacuum
+
+
+class Command(BaseCommand):
+    help = "Move old CodeReview rows to the compressed archive and report the bytes reclaimed."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--older-than', type=int, default=None,
+            help=f"Age in days (default: RETENTION['REVIEW_AGE_DAYS'], currently {get_setting('REVIEW_AGE_DAYS')}).",
+        )
+        parser.add_argument('--batch-size', type=int, default=None, help="Rows moved per transaction.")
+        parser.add_argument('--dry-run', action='store_true', help="Only count what would be archived.")
+        parser.add_argument('--vacuum', action='store_true', help="VACUUM the SQLite database afterwards.")
+
+    def handle(self, *args, **options):
+        size_before = database_size()
+        report = archive_reviews(
+            older_than_days=options['older_than'], batch_size=options['batch_size'],
+            dry_run=options['dry_run'], log=self.stdout.write,
+        )
+        if options['vacuum'] and not options['dry_run']:
+            vacuum()
+            if size_before is not None:
+                report["database_bytes_before"] = size_before
+                report["database_bytes_after"] = database_size()
+        self.stdout.write(json.dumps(report))
@@ -0,0 +1,43 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mainapp.benchmarks import SCENARIOS
+
+
+class Command(BaseCommand):
+    help = "Run a performance benchmark scenario and print its results."
+
+    def add_arguments(self, parser):
+        parser.add_argument('scenario', choices=sorted(SCENARIOS))
+        parser.add_argument('--runs', type=int, default=5, help="Repetitions per measurement.")
+        parser.add_argument('--json', action='store_true', help="Print one JSON object per result row.")
+        parser.add_argument(
+            '--fail-above', action='append', default=[], metavar='METRIC=VALUE',
+            help="Exit with an error if any row reports METRIC above VALUE (repeatable).",
+        )
+
+    def handle(self, *args, **options):
+        limits = {}
+        for item in options['fail_above']:
+            metric, _, value = item.partition('=')
+            try:
+                limits[metric] = float(value)
+            except ValueError:
+                raise CommandError(f"Invalid --fail-above value: {item}")
+
+        rows = SCENARIOS[options['scenario']](runs=options['runs'])
+
+        for row in rows:
+            if options['json']:
+                self.stdout.write(json.dumps(row))
+            else:
+                self.stdout.write("  ".join(f"{key}={value}" for key, value in row.items()))
+
+        failures = [
+            f"{metric}={row[metric]} > {limit}"
+            for row in rows for metric, limit in limits.items()
+            if isinstance(row.get(metric), (int, float)) and row[metric] > limit
+        ]
+        if failures:
+            raise CommandError("Benchmark regression: " + ", ".join(failures))
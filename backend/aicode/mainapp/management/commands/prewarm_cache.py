@@ -0,0 +1,38 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from mainapp.prewarm import get_setting, prewarm, run_forever
+
+
+class Command(BaseCommand):
+    help = "Precompute stored answers for the most popular queries and report the hit-rate uplift."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top', type=int, default=None,
+            help=f"Number of popular queries (default: PREWARM['TOP_N'], currently {get_setting('TOP_N')}).",
+        )
+        parser.add_argument('--rate', type=float, default=None, help="Pipeline runs per minute.")
+        parser.add_argument(
+            '--refresh-age', type=int, default=None,
+            help="Recompute answers older than this many seconds (default: PREWARM['REFRESH_AGE']).",
+        )
+        parser.add_argument('--dry-run', action='store_true', help="Only list what would be computed.")
+        parser.add_argument(
+            '--every', type=int, default=None, metavar='SECONDS',
+            help="Keep running, prewarming every SECONDS (0: PREWARM['INTERVAL']).",
+        )
+
+    def handle(self, *args, **options):
+        kwargs = {
+            "limit": options['top'],
+            "rate_per_minute": options['rate'],
+            "refresh_age": options['refresh_age'],
+            "dry_run": options['dry_run'],
+            "log": self.stdout.write,
+        }
+        if options['every'] is not None:
+            run_forever(every=options['every'], **kwargs)
+            return
+        self.stdout.write(json.dumps(prewarm(**kwargs)))
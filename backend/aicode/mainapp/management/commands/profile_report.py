@@ -0,0 +1,69 @@
+import json
+import pstats
+import time
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from mainapp.profiling import get_setting, load_profiles
+
+
+class Command(BaseCommand):
+    help = "Aggregate the hottest functions across profiled requests (see mainapp/profiling.py)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=25, help="Functions to show.")
+        parser.add_argument('--sort', choices=('tottime', 'cumtime', 'ncalls'), default='tottime')
+        parser.add_argument('--input-type', default=None, help="Only requests tagged with this input type.")
+        parser.add_argument('--path', default=None, help="Only requests whose path starts with this.")
+        parser.add_argument('--min-latency-ms', type=float, default=0, help="Only requests at least this slow.")
+        parser.add_argument('--hours', type=float, default=None, help="Only profiles from the last N hours.")
+        parser.add_argument('--directory', default=None, help=f"Profile store (default: {get_setting('DIRECTORY')}).")
+        parser.add_argument('--json', action='store_true', help="Print one JSON object per row.")
+
+    def handle(self, *args, **options):
+        since = time.time() - options['hours'] * 3600 if options['hours'] else 0
+        paths, latencies, allocations = [], [], defaultdict(int)
+        for path, meta in load_profiles(options['directory']):
+            if meta.get("at", 0) < since or meta.get("latency_ms", 0) < options['min_latency_ms']:
+                continue
+            if options['input_type'] and meta.get("tags", {}).get("input_type") != options['input_type']:
+                continue
+            if options['path'] and not meta.get("path", "").startswith(options['path']):
+                continue
+            paths.append(path)
+            latencies.append(meta.get("latency_ms", 0))
+            for allocation in meta.get("memory", {}).get("top_allocations", []):
+                allocations[allocation["location"]] += allocation["bytes"]
+
+        if not paths:
+            self.stdout.write("No matching profiles.")
+            return
+
+        stats = pstats.Stats(*paths)
+        rows = []
+        for (filename, line, function), (_, ncalls, tottime, cumtime, _) in stats.stats.items():
+            rows.append({
+                "function": f"{filename}:{line}({function})", "ncalls": ncalls,
+                "tottime": round(tottime, 4), "cumtime": round(cumtime, 4),
+                "tottime_per_request_ms": round(tottime * 1000 / len(paths), 2),
+            })
+        rows.sort(key=lambda row: row[options['sort']], reverse=True)
+
+        latencies.sort()
+        summary = {
+            "requests": len(paths),
+            "p50_ms": latencies[len(latencies) // 2],
+            "max_ms": latencies[-1],
+        }
+        self._write(summary, options)
+        for row in rows[:options['limit']]:
+            self._write(row, options)
+        for location, size in sorted(allocations.items(), key=lambda item: item[1], reverse=True)[:options['limit']]:
+            self._write({"allocated_at": location, "bytes": size}, options)
+
+    def _write(self, row, options):
+        if options['json']:
+            self.stdout.write(json.dumps(row))
+        else:
+            self.stdout.write("  ".join(f"{key}={value}" for key, value in row.items()))
@@ -0,0 +1,29 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from mainapp.backfill import get_setting, reanalyze_reviews
+
+
+class Command(BaseCommand):
+    help = "Recompute stored CodeReview reviews in throttled, resumable chunks."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size', type=int, default=None,
+            help=f"Rows per chunk (default: BACKFILL['CHUNK_SIZE'], currently {get_setting('CHUNK_SIZE')}).",
+        )
+        parser.add_argument('--workers', type=int, default=None, help="Worker processes.")
+        parser.add_argument('--max-rate', type=float, default=None, help="Rows per second (0: no limit).")
+        parser.add_argument('--duty-cycle', type=float, default=None, help="Fraction of time spent working.")
+        parser.add_argument('--checkpoint', default=None, help="Checkpoint file.")
+        parser.add_argument('--restart', action='store_true', help="Ignore the checkpoint and start over.")
+        parser.add_argument('--limit', type=int, default=None, help="Stop after this many rows.")
+
+    def handle(self, *args, **options):
+        totals = reanalyze_reviews(
+            chunk_size=options['chunk_size'], workers=options['workers'], max_rate=options['max_rate'],
+            duty_cycle=options['duty_cycle'], checkpoint=options['checkpoint'], restart=options['restart'],
+            limit=options['limit'], log=self.stdout.write,
+        )
+        self.stdout.write(json.dumps(totals))
@@ -0,0 +1,35 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from mainapp.repo_review import get_setting, review_repo
+
+
+class Command(BaseCommand):
+    help = "Review every changed Python file in a repository; writes an NDJSON report."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Repository root.")
+        parser.add_argument('--report', default='-', help="NDJSON report file ('-' for stdout).")
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help=f"Worker processes (default: REPO_REVIEW['WORKERS'], currently {get_setting('WORKERS')}).",
+        )
+        parser.add_argument('--no-llm', action='store_true', help="Local rules only.")
+        parser.add_argument('--force', action='store_true', help="Review every file, changed or not.")
+
+    def handle(self, *args, **options):
+        report = sys.stdout if options['report'] == '-' else open(options['report'], 'a', encoding='utf-8')
+        try:
+            counts = review_repo(
+                options['path'], report=report, workers=options['workers'],
+                use_llm=False if options['no_llm'] else None, force=options['force'],
+                log=self.stderr.write,
+            )
+        except FileNotFoundError as e:
+            raise CommandError(str(e))
+        finally:
+            if report is not sys.stdout:
+                report.close()
+        self.stderr.write(json.dumps(counts))
@@ -0,0 +1,42 @@
+import json
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Avg, Count, Max, Q, Sum
+from django.utils import timezone
+
+from mainapp.models import LLMCallLog
+
+
+class Command(BaseCommand):
+    help = "Summarise routed LLM calls per kind, tier and reason, for tuning the routing policy."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hours', type=float, default=24, help="Only calls from the last N hours.")
+        parser.add_argument('--json', action='store_true', help="Print one JSON object per row.")
+
+    def handle(self, *args, **options):
+        since = timezone.now() - timedelta(hours=options['hours'])
+        rows = (
+            LLMCallLog.objects.filter(created_at__gte=since)
+            .values('kind', 'tier', 'model', 'reason')
+            .annotate(
+                calls=Count('id'),
+                timeouts=Count('id', filter=Q(status='timeout')),
+                errors=Count('id', filter=Q(status='error')),
+                discarded=Count('id', filter=Q(status='discarded')),
+                avg_latency_ms=Avg('latency_ms'),
+                max_latency_ms=Max('latency_ms'),
+                input_tokens=Sum('input_tokens'),
+                output_tokens=Sum('output_tokens'),
+                cost=Sum('cost'),
+            )
+            .order_by('kind', 'tier', 'reason')
+        )
+        for row in rows:
+            row['avg_latency_ms'] = round(row['avg_latency_ms'] or 0)
+            row['cost'] = round(row['cost'] or 0, 6)
+            if options['json']:
+                self.stdout.write(json.dumps(row))
+            else:
+                self.stdout.write("  ".join(f"{key}={value}" for key, value in row.items()))
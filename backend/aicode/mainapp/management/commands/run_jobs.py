@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from mainapp.jobs import get_setting, run_workers
+
+
+class Command(BaseCommand):
+    help = "Run analysis job workers that take jobs from the database queue."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help=f"Worker threads (default: JOBS['WORKERS'], currently {get_setting('WORKERS')}).",
+        )
+        parser.add_argument('--once', action='store_true', help="Exit once the queue is empty.")
+
+    def handle(self, *args, **options):
+        workers = options['workers'] or get_setting('WORKERS')
+        self.stdout.write(f"Starting {workers} job worker(s)")
+        run_workers(workers=workers, once=options['once'])
@@ -0,0 +1,32 @@
+"""
+In-process counters for performance bookkeeping.
+
+Counters are per worker process and reset on restart; they are meant for
+quick inspection through GET /api/v2/metrics/ and benchmark runs, not as
+a replacement for a metrics backend.
+"""
+import threading
+
+
+_counters = {}
+_lock = threading.Lock()
+
+
+def increment(name, value=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def get(name, default=0):
+    return _counters.get(name, default)
+
+
+def snapshot():
+    """Return a copy of every counter."""
+    with _lock:
+        return dict(_counters)
+
+
+def reset():
+    with _lock:
+        _counters.clear()
@@ -0,0 +1,165 @@
+import gzip
+import hashlib
+
+from django.conf import settings
+from django.http import HttpResponseNotModified
+from django.utils.cache import patch_vary_headers
+from django.utils.http import parse_etags
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+
+COMPRESSION_DEFAULTS = {
+    'MIN_SIZE': 512,          # bytes; smaller bodies are sent as-is
+    'GZIP_LEVEL': 6,
+    'BROTLI_QUALITY': 5,
+    'CONTENT_TYPES': ('application/json',),
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'COMPRESSION', {}).get(name, COMPRESSION_DEFAULTS[name])
+
+
+# ============== CONTENT NEGOTIATION ==============
+
+def accepted_encodings(header):
+    """Parse an Accept-Encoding header into {coding: qvalue}."""
+    encodings = {}
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name.strip().lower() == 'q':
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        encodings[coding] = q
+    return encodings
+
+
+def choose_encoding(header):
+    """Return "br", "gzip" or None for the given Accept-Encoding value."""
+    encodings = accepted_encodings(header)
+    wildcard = encodings.get('*', 0.0)
+    candidates = ['br', 'gzip'] if brotli is not None else ['gzip']
+    best, best_q = None, 0.0
+    for coding in candidates:
+        q = encodings.get(coding, wildcard)
+        if q > best_q:
+            best, best_q = coding, q
+    return best
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=get_setting('BROTLI_QUALITY'))
+    # mtime=0 keeps the output (and so the ETag) deterministic
+    return gzip.compress(body, compresslevel=get_setting('GZIP_LEVEL'), mtime=0)
+
+
+def content_etag(body):
+    """Strong ETag for the identity-encoded body."""
+    return f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+
+
+def _encoded_etag(etag, encoding):
+    # Each representation needs its own strong validator, so the coding is
+    # appended the same way Apache's mod_deflate does.
+    return f'{etag[:-1]}-{encoding}"'
+
+
+def _etag_matches(etag, if_none_match):
+    tags = parse_etags(if_none_match)
+    if tags == ['*']:
+        return True
+    opaque = etag.removeprefix('W/')
+    for tag in tags:
+        tag = tag.removeprefix('W/')
+        # A client may echo the validator of any encoding it received
+        for suffix in ('-gzip"', '-br"'):
+            if tag.endswith(suffix):
+                tag = tag[:-len(suffix)] + '"'
+                break
+        if tag == opaque:
+            return True
+    return False
+
+
+# ============== MIDDLEWARE ==============
+
+class CompressionMiddleware:
+    """
+    Strong ETags, conditional requests and negotiated compression.
+
+    Every successful GET/HEAD response gets an ETag hashed from its
+    uncompressed body; a matching If-None-Match turns it into a bodiless
+    304. Other methods never get a 304 (RFC 9110, section 13.1.2). JSON bodies of at least
+    MIN_SIZE bytes are then compressed with brotli (if installed) or gzip,
+    whichever the client prefers.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if response.streaming or response.status_code != 200:
+            return response
+
+        conditional = request.method in ('GET', 'HEAD')
+        if conditional and not response.has_header('ETag'):
+            response['ETag'] = content_etag(response.content)
+        etag = response.get('ETag')
+
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if conditional and etag and if_none_match and _etag_matches(etag, if_none_match):
+            return self._not_modified(request, response)
+
+        return self._compress(request, response)
+
+    def _not_modified(self, request, response):
+        not_modified = HttpResponseNotModified()
+        for header in ('Cache-Control', 'Content-Location', 'Date', 'ETag', 'Expires', 'Vary'):
+            if response.has_header(header):
+                not_modified[header] = response[header]
+        # Mirror the validator the full response would have carried
+        if self._compressible(response):
+            patch_vary_headers(not_modified, ('Accept-Encoding',))
+            encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+            if encoding:
+                not_modified['ETag'] = _encoded_etag(not_modified['ETag'], encoding)
+        not_modified.cookies = response.cookies
+        return not_modified
+
+    def _compressible(self, response):
+        content_type = response.get('Content-Type', '').split(';')[0].strip().lower()
+        return (
+            content_type in get_setting('CONTENT_TYPES')
+            and not response.has_header('Content-Encoding')
+            and len(response.content) >= get_setting('MIN_SIZE')
+        )
+
+    def _compress(self, request, response):
+        if not self._compressible(response):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        encoding = choose_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding is None:
+            return response
+
+        compressed = compress(response.content, encoding)
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        if response.has_header('ETag'):
+            response['ETag'] = _encoded_etag(response['ETag'], encoding)
+        return response
@@ -0,0 +1,27 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0006_analysisresult_hits'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RepoFileReview',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('repo', models.CharField(max_length=500)),
+                ('path', models.CharField(max_length=500)),
+                ('content_hash', models.CharField(max_length=64)),
+                ('size', models.PositiveBigIntegerField(default=0)),
+                ('mtime_ns', models.BigIntegerField(default=0)),
+                ('result', models.JSONField(default=dict)),
+                ('reviewed_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('repo', 'path'), name='unique_repo_file')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0007_repofilereview'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='codereview',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, db_index=True),
+        ),
+        migrations.CreateModel(
+            name='ArchivedReview',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_id', models.BigIntegerField(unique=True)),
+                ('created_at', models.DateTimeField(db_index=True)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('codec', models.CharField(max_length=10)),
+                ('code_blob', models.BinaryField()),
+                ('review_blob', models.BinaryField(null=True)),
+                ('raw_bytes', models.PositiveIntegerField(default=0)),
+                ('stored_bytes', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReviewDailyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('reviews', models.PositiveIntegerField(default=0)),
+                ('syntax_errors', models.PositiveIntegerField(default=0)),
+                ('code_bytes', models.PositiveBigIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,46 @@
+import hashlib
+
+from django.db import migrations, models
+
+
+def _hash(query):
+    # results.query_hash as of this migration
+    return hashlib.sha256(query.replace('\r\n', '\n').strip().encode()).hexdigest()
+
+
+def fill_hashes(apps, schema_editor):
+    for model_name, text_field, hash_field in (
+        ('AnalysisResult', 'query', 'query_hash'),
+        ('CodeReview', 'code', 'code_hash'),
+    ):
+        model = apps.get_model('mainapp', model_name)
+        batch = []
+        for row in model.objects.only('pk', text_field).iterator(chunk_size=1000):
+            setattr(row, hash_field, _hash(getattr(row, text_field)))
+            batch.append(row)
+            if len(batch) == 1000:
+                model.objects.bulk_update(batch, [hash_field])
+                batch = []
+        if batch:
+            model.objects.bulk_update(batch, [hash_field])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('mainapp', '0008_review_retention'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='analysisresult',
+            name='query_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.AddField(
+            model_name='codereview',
+            name='code_hash',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=64),
+        ),
+        migrations.RunPython(fill_hashes, migrations.RunPython.noop),
+    ]
@@ -1,3 +1,5 @@
+import uuid
+
 from django.db import models
 
 # Create your models here.
@@ -5,7 +7,155 @@ from django.db import models
 class CodeReview(models.Model):
     code = models.TextField(max_length=1000)
     review = models.TextField(blank=True, null=True)
-    created_at = models.DateTimeField(auto_now_add=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    code_hash = models.CharField(max_length=64, blank=True, default="", db_index=True)  # results.query_hash
     
     def __str__(self):
-        return f"Review {self.id}"
\ No newline at end of file
+        return f"Review {self.id}"
+
+
+class ArchivedReview(models.Model):
+    """A CodeReview moved out of the hot table by `manage.py archive_reviews`."""
+    original_id = models.BigIntegerField(unique=True)
+    created_at = models.DateTimeField(db_index=True)
+    archived_at = models.DateTimeField(auto_now_add=True)
+    codec = models.CharField(max_length=10)
+    code_blob = models.BinaryField()
+    review_blob = models.BinaryField(null=True)
+    raw_bytes = models.PositiveIntegerField(default=0)
+    stored_bytes = models.PositiveIntegerField(default=0)
+
+    @property
+    def code(self):
+        from .retention import decompress
+        return decompress(self.codec, self.code_blob)
+
+    @property
+    def review(self):
+        from .retention import decompress
+        return None if self.review_blob is None else decompress(self.codec, self.review_blob)
+
+    def __str__(self):
+        return f"Archived review {self.original_id}"
+
+
+class ReviewDailyStats(models.Model):
+    """Per-day totals of archived reviews, kept for analytics."""
+    day = models.DateField(unique=True)
+    reviews = models.PositiveIntegerField(default=0)
+    syntax_errors = models.PositiveIntegerField(default=0)
+    code_bytes = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.day}: {self.reviews} reviews"
+
+
+class AnalysisResult(models.Model):
+    """A stored /api/v2/analyze/ response, addressed by a hash of its input."""
+    key = models.CharField(max_length=64, unique=True)
+    input_type = models.CharField(max_length=20)
+    query = models.TextField()
+    query_hash = models.CharField(max_length=64, blank=True, default="", db_index=True)  # results.query_hash
+    options = models.JSONField(default=dict)
+    response = models.JSONField()
+    hits = models.PositiveIntegerField(default=0)  # repeat requests served from the store
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Analysis {self.key[:12]}"
+
+
+class IdempotencyRecord(models.Model):
+    """The first response to a POST sent with an Idempotency-Key header."""
+    PENDING = "pending"
+    DONE = "done"
+    STATUS_CHOICES = [(PENDING, "Pending"), (DONE, "Done")]
+
+    key = models.CharField(max_length=255, unique=True)
+    request_hash = models.CharField(max_length=64)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    response = models.JSONField(null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Idempotency key {self.key}"
+
+
+class AnalysisJob(models.Model):
+    """A queued analysis, run by `manage.py run_jobs` workers."""
+    QUEUED = "queued"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = [(QUEUED, "Queued"), (RUNNING, "Running"), (DONE, "Done"), (FAILED, "Failed")]
+
+    query = models.TextField()
+    options = models.JSONField(default=dict)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    # While running: when the claim expires. While queued: not before (retry delay).
+    locked_until = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=100, blank=True)
+    partial = models.JSONField(default=dict)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "locked_until"])]
+
+    def __str__(self):
+        return f"Job {self.id} ({self.status})"
+
+
+class ChatSession(models.Model):
+    """Server-side state of a WebSocket chat: a summary plus recent turns."""
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    summary = models.TextField(blank=True)
+    turns = models.JSONField(default=list)
+    turn_count = models.PositiveIntegerField(default=0)
+    dropped_turns = models.PositiveIntegerField(default=0)
+    token_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Chat {self.id}"
+
+
+class LLMCallLog(models.Model):
+    """One routed LLM call: the tier chosen, why, and what it cost."""
+    request_key = models.CharField(max_length=64, blank=True, db_index=True)
+    kind = models.CharField(max_length=20)
+    tier = models.CharField(max_length=20)
+    model = models.CharField(max_length=100)
+    reason = models.CharField(max_length=50)
+    status = models.CharField(max_length=10)
+    input_tokens = models.PositiveIntegerField(default=0)
+    output_tokens = models.PositiveIntegerField(default=0)
+    latency_ms = models.PositiveIntegerField(default=0)
+    cost = models.FloatField(default=0.0)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.kind} -> {self.model} ({self.status})"
+
+
+class RepoFileReview(models.Model):
+    """Manifest entry and latest review of one file reviewed by `manage.py review_repo`."""
+    repo = models.CharField(max_length=500)
+    path = models.CharField(max_length=500)
+    content_hash = models.CharField(max_length=64)
+    size = models.PositiveBigIntegerField(default=0)
+    mtime_ns = models.BigIntegerField(default=0)
+    result = models.JSONField(default=dict)
+    reviewed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["repo", "path"], name="unique_repo_file")]
+
+    def __str__(self):
+        return f"{self.path} ({self.content_hash[:12]})"
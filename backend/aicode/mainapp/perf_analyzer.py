@@ -0,0 +1,360 @@
+import ast
+import builtins
+
+
+MEMOIZE_DECORATORS = {'lru_cache', 'cache', 'cached', 'memoize', 'memoized', 'cached_property'}
+SORT_FUNCTIONS = {'sorted'}
+BUILTIN_NAMES = frozenset(dir(builtins))
+
+
+def analyze_performance(source):
+    """
+    Flag common performance anti-patterns in Python source.
+
+    Accepts source text or an already parsed `ast.Module` and walks the tree
+    once. Returns a list of findings ordered by line, each a dict with
+    "line", "rule", "message" and "complexity" (an estimated cost class).
+    Unparseable code yields no findings.
+    """
+    if isinstance(source, ast.AST):
+        tree = source
+    else:
+        try:
+            tree = ast.parse(source)
+        except (SyntaxError, ValueError):
+            return []
+    visitor = PerformanceVisitor()
+    visitor.visit(tree)
+    visitor.finish()
+    return sorted(visitor.findings, key=lambda f: f["line"])
+
+
+def _expr_key(node):
+    """Return a cheap structural key for simple expressions, else None."""
+    if isinstance(node, ast.Name):
+        return node.id
+    if isinstance(node, ast.Attribute):
+        base = _expr_key(node.value)
+        return f"{base}.{node.attr}" if base else None
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in ('range', 'enumerate'):
+        keys = [_expr_key(arg) for arg in node.args]
+        if node.func.id == 'range' and len(node.args) == 1 and isinstance(node.args[0], ast.Call):
+            # range(len(x)) iterates the same sequence as x
+            inner = node.args[0]
+            if isinstance(inner.func, ast.Name) and inner.func.id == 'len' and len(inner.args) == 1:
+                return _expr_key(inner.args[0])
+        if keys and all(keys):
+            return keys[-1] if node.func.id == 'enumerate' else f"range({','.join(keys)})"
+    return None
+
+
+def _decorator_name(node):
+    if isinstance(node, ast.Call):
+        node = node.func
+    if isinstance(node, ast.Attribute):
+        return node.attr
+    if isinstance(node, ast.Name):
+        return node.id
+    return None
+
+
+class _Scope:
+    def __init__(self, name=None, memoized=False):
+        self.name = name
+        self.memoized = memoized
+        self.locals = set()
+        self.list_names = set()
+        self.str_names = set()
+        self.self_calls = []
+        self.loop_globals = {}
+
+
+class PerformanceVisitor(ast.NodeVisitor):
+    """Single-pass AST walk that collects performance findings."""
+
+    def __init__(self):
+        self.findings = []
+        self.loops = []
+        self.module_names = set()
+        self.imported_modules = set()
+        self.scopes = [_Scope()]
+        self.pending_globals = []
+
+    def add(self, node, rule, message, complexity):
+        self.findings.append({
+            "line": getattr(node, 'lineno', 0),
+            "rule": rule,
+            "message": message,
+            "complexity": complexity,
+        })
+
+    @property
+    def scope(self):
+        return self.scopes[-1]
+
+    @property
+    def in_function(self):
+        return len(self.scopes) > 1
+
+    # ---- scopes and bindings ----
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            name = alias.asname or alias.name.split('.')[0]
+            self._bind(name)
+            self.imported_modules.add(name)
+
+    def visit_ImportFrom(self, node):
+        for alias in node.names:
+            self._bind(alias.asname or alias.name)
+
+    def _bind(self, name, value=None):
+        scope = self.scope
+        scope.locals.add(name)
+        if not self.in_function:
+            self.module_names.add(name)
+        if value is None:
+            return
+        if isinstance(value, (ast.List, ast.ListComp)) or (
+            isinstance(value, ast.Call) and isinstance(value.func, ast.Name) and value.func.id == 'list'
+        ):
+            scope.list_names.add(name)
+        else:
+            scope.list_names.discard(name)
+        if isinstance(value, (ast.JoinedStr,)) or (
+            isinstance(value, ast.Constant) and isinstance(value.value, str)
+        ):
+            scope.str_names.add(name)
+        else:
+            scope.str_names.discard(name)
+
+    def _bind_target(self, target, value=None):
+        if isinstance(target, ast.Name):
+            self._bind(target.id, value)
+        elif isinstance(target, (ast.Tuple, ast.List)):
+            for element in target.elts:
+                self._bind_target(element)
+        elif isinstance(target, ast.Starred):
+            self._bind_target(target.value)
+
+    def visit_Assign(self, node):
+        self.visit(node.value)
+        for target in node.targets:
+            self._bind_target(target, node.value)
+            if not isinstance(target, ast.Name):
+                self.visit(target)
+
+    def visit_AnnAssign(self, node):
+        if node.value is not None:
+            self.visit(node.value)
+        self._bind_target(node.target, node.value)
+
+    def visit_AugAssign(self, node):
+        self.visit(node.value)
+        if (self.loops and isinstance(node.op, ast.Add) and isinstance(node.target, ast.Name)
+                and self._is_str_expr(node.target, node.value)):
+            self.add(node, "string-concat-in-loop",
+                     f"'{node.target.id} +=' builds a string inside a loop; each step copies it. "
+                     f"Collect parts in a list and use ''.join().",
+                     "O(n^2)")
+        if isinstance(node.target, ast.Name):
+            self.scope.locals.add(node.target.id)
+        else:
+            self.visit(node.target)
+
+    def _is_str_expr(self, target, value):
+        if target.id in self.scope.str_names:
+            return True
+        if isinstance(value, ast.JoinedStr):
+            return True
+        if isinstance(value, ast.Constant) and isinstance(value.value, str):
+            return True
+        return isinstance(value, ast.Call) and isinstance(value.func, ast.Name) and value.func.id == 'str'
+
+    def visit_FunctionDef(self, node):
+        self._bind(node.name)
+        for decorator in node.decorator_list:
+            self.visit(decorator)
+        memoized = any(_decorator_name(d) in MEMOIZE_DECORATORS for d in node.decorator_list)
+        outer_loops = self.loops
+        self.loops = []
+        self.scopes.append(_Scope(node.name, memoized))
+        args = node.args
+        for arg in args.posonlyargs + args.args + args.kwonlyargs:
+            self.scope.locals.add(arg.arg)
+        if args.vararg:
+            self.scope.locals.add(args.vararg.arg)
+        if args.kwarg:
+            self.scope.locals.add(args.kwarg.arg)
+        for statement in node.body:
+            self.visit(statement)
+        scope = self.scopes.pop()
+        self.loops = outer_loops
+        self._finish_function(node, scope)
+
+    visit_AsyncFunctionDef = visit_FunctionDef
+
+    def _finish_function(self, node, scope):
+        if scope.self_calls and not scope.memoized:
+            if len(scope.self_calls) > 1:
+                self.add(node, "unmemoized-recursion",
+                         f"'{node.name}' calls itself {len(scope.self_calls)} times per call without "
+                         f"memoization, so work repeats exponentially. Add @functools.lru_cache "
+                         f"or rewrite it iteratively.",
+                         "O(2^n)")
+            else:
+                self.add(node, "recursion",
+                         f"'{node.name}' is recursive; deep inputs cost O(n) stack frames and can hit "
+                         f"the recursion limit. An iterative loop avoids the call overhead.",
+                         "O(n) stack")
+        for name, (line, count) in scope.loop_globals.items():
+            if name.split('.')[0] not in scope.locals:
+                self.pending_globals.append((node.name, name, line, count))
+
+    def finish(self):
+        """Resolve global lookups once every module-level name is known."""
+        for function, name, line, count in self.pending_globals:
+            root = name.split('.')[0]
+            if root in self.module_names:
+                kind = "module attribute" if '.' in name else "global"
+            elif root in BUILTIN_NAMES:
+                kind = "builtin"
+            else:
+                continue
+            self.findings.append({
+                "line": line,
+                "rule": "global-lookup-in-loop",
+                "message": f"{kind} '{name}' is looked up on every iteration of a hot loop in "
+                           f"'{function}' ({count} use(s)). Bind it to a local before the loop.",
+                "complexity": "O(n) lookups",
+            })
+
+    def visit_ClassDef(self, node):
+        self._bind(node.name)
+        self.generic_visit(node)
+
+    def visit_Lambda(self, node):
+        pass
+
+    # ---- loops ----
+
+    def _visit_loop(self, node, iter_node=None):
+        key = _expr_key(iter_node) if iter_node is not None else None
+        if key:
+            for outer in self.loops:
+                if outer == key:
+                    self.add(node, "nested-loop-same-sequence",
+                             f"Nested loop iterates '{key}' again inside a loop over it. "
+                             f"Consider a set/dict lookup or sorting once.",
+                             "O(n^2)")
+                    break
+        self.loops.append(key)
+        for statement in node.body:
+            self.visit(statement)
+        self.loops.pop()
+        for statement in node.orelse:
+            self.visit(statement)
+
+    def visit_For(self, node):
+        self.visit(node.iter)
+        self._bind_target(node.target)
+        self._visit_loop(node, node.iter)
+
+    visit_AsyncFor = visit_For
+
+    def visit_While(self, node):
+        self.loops.append(None)
+        self.visit(node.test)
+        self.loops.pop()
+        self._visit_loop(node)
+
+    def visit_comprehension(self, node):
+        self.visit(node.iter)
+        self._bind_target(node.target)
+        for condition in node.ifs:
+            self.visit(condition)
+
+    def _visit_comprehension_expr(self, node, elements):
+        for generator in node.generators:
+            self.visit_comprehension(generator)
+            self.loops.append(_expr_key(generator.iter))
+        for element in elements:
+            self.visit(element)
+        for _ in node.generators:
+            self.loops.pop()
+
+    def visit_ListComp(self, node):
+        self._visit_comprehension_expr(node, [node.elt])
+
+    visit_SetComp = visit_ListComp
+    visit_GeneratorExp = visit_ListComp
+
+    def visit_DictComp(self, node):
+        self._visit_comprehension_expr(node, [node.key, node.value])
+
+    # ---- expressions ----
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+        if not self.loops:
+            return
+        for op, comparator in zip(node.ops, node.comparators):
+            if not isinstance(op, (ast.In, ast.NotIn)):
+                continue
+            if isinstance(comparator, (ast.List, ast.ListComp)) or (
+                isinstance(comparator, ast.Name) and comparator.id in self.scope.list_names
+            ):
+                self.add(node, "list-membership-in-loop",
+                         "Membership test on a list inside a loop scans the whole list each time. "
+                         "Convert it to a set once, outside the loop.",
+                         "O(n*m)")
+
+    def visit_Call(self, node):
+        self.generic_visit(node)
+        func = node.func
+        if isinstance(func, ast.Name):
+            if self.in_function and func.id == self.scope.name:
+                self.scope.self_calls.append(node)
+            if self.loops and func.id in SORT_FUNCTIONS:
+                self.add(node, "sort-in-loop",
+                         "sorted() inside a loop re-sorts on every iteration. Sort once before the loop "
+                         "or keep the data in a heap/bisect-maintained list.",
+                         "O(n^2 log n)")
+        elif isinstance(func, ast.Attribute):
+            first_arg_zero = (
+                node.args and isinstance(node.args[0], ast.Constant) and node.args[0].value == 0
+            )
+            if func.attr == 'pop' and first_arg_zero:
+                self.add(node, "list-pop-front",
+                         "list.pop(0) shifts every remaining element. Use collections.deque.popleft().",
+                         "O(n^2)" if self.loops else "O(n)")
+            elif func.attr == 'insert' and first_arg_zero:
+                self.add(node, "list-insert-front",
+                         "list.insert(0, x) shifts every element. Use collections.deque.appendleft().",
+                         "O(n^2)" if self.loops else "O(n)")
+            elif func.attr == 'sort' and self.loops:
+                self.add(node, "sort-in-loop",
+                         ".sort() inside a loop re-sorts on every iteration. Sort once before the loop.",
+                         "O(n^2 log n)")
+
+    # A loop is "hot" when nested in another loop; module attribute chains
+    # such as math.sqrt cost two lookups, so they count in any loop.
+
+    def visit_Name(self, node):
+        if self.in_function and len(self.loops) > 1 and isinstance(node.ctx, ast.Load):
+            self._record_global(node.id, node)
+
+    def visit_Attribute(self, node):
+        value = node.value
+        if (self.in_function and self.loops and isinstance(node.ctx, ast.Load)
+                and isinstance(value, ast.Name) and value.id in self.imported_modules):
+            self._record_global(f"{value.id}.{node.attr}", node)
+            return
+        self.visit(value)
+
+    def _record_global(self, name, node):
+        scope = self.scope
+        if name in scope.locals or name == scope.name:
+            return
+        line, count = scope.loop_globals.get(name, (node.lineno, 0))
+        scope.loop_globals[name] = (line, count + 1)
@@ -0,0 +1,144 @@
+"""
+Cache prewarming: answer the most popular queries before users ask them.
+
+Popularity comes from the last WINDOW_DAYS of request history: the hit
+counts of stored analyze results (across every model and prompt version
+they were stored under) and the code submitted as CodeReview rows, grouped
+by the stored hash of the normalized query. The database does the
+counting and returns only the top candidates of each table, so memory
+does not grow with the history. Each
+of the TOP_N most popular queries whose result under the current options
+(models and prompt version) is missing or older than REFRESH_AGE is run
+through the analyze pipeline and stored, at most RATE_PER_MINUTE at a time.
+
+A model or prompt version change gives every query a new key, so the next
+run recomputes them all. The returned report gives the hit rate the
+popular queries would have seen before and after the run, weighted by
+their popularity.
+"""
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from . import results, routing
+from .models import AnalysisResult, CodeReview
+
+
+PREWARM_DEFAULTS = {
+    'TOP_N': 50,
+    'RATE_PER_MINUTE': 30,        # pipeline runs (each up to a few LLM calls)
+    'REFRESH_AGE': 12 * 3600,     # seconds after which a stored answer is recomputed
+    'INTERVAL': 3600,             # seconds between runs with --every
+    'MIN_COUNT': 2,               # ignore queries seen fewer times than this
+    'WINDOW_DAYS': 30,            # only requests this recent count
+    'CANDIDATE_FACTOR': 10,       # top TOP_N * this hashes read from each table
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'PREWARM', {}).get(name, PREWARM_DEFAULTS[name])
+
+
+def popular_queries(limit, min_count=1):
+    """Return [(query, count)] for the `limit` most requested normalized queries."""
+    since = timezone.now() - timedelta(days=get_setting('WINDOW_DAYS'))
+    candidates = max(limit, 1) * get_setting('CANDIDATE_FACTOR')
+    skip = ("", results.query_hash(""))
+    counts = Counter()
+    stored = AnalysisResult.objects.filter(created_at__gte=since).exclude(query_hash__in=skip).values(
+        "query_hash",
+    ).annotate(count=Sum("hits") + Count("id"))  # each row's hits plus the request that stored it
+    for row in stored.order_by("-count")[:candidates]:
+        counts[row["query_hash"]] += row["count"]
+    reviews = CodeReview.objects.filter(created_at__gte=since).exclude(code_hash__in=skip).values(
+        "code_hash",
+    ).annotate(count=Count("id"))
+    for row in reviews.order_by("-count")[:candidates]:
+        counts[row["code_hash"]] += row["count"]
+
+    popular = []
+    for digest, count in counts.most_common(limit):
+        if count < min_count:
+            break
+        query = AnalysisResult.objects.filter(query_hash=digest).values_list("query", flat=True).first() \
+            or CodeReview.objects.filter(code_hash=digest).values_list("code", flat=True).first()
+        if query:
+            popular.append((results.normalize_query(query), count))
+    return popular
+
+
+def _is_warm(key, max_age):
+    return results.get_result(key, max_age=max_age) is not None
+
+
+def prewarm(limit=None, rate_per_minute=None, refresh_age=None, dry_run=False, log=print):
+    """Compute and store answers for popular queries; returns a report dict."""
+    from .views import analyze_query, detect_input_type
+
+    limit = limit or get_setting('TOP_N')
+    rate_per_minute = rate_per_minute or get_setting('RATE_PER_MINUTE')
+    refresh_age = get_setting('REFRESH_AGE') if refresh_age is None else refresh_age
+    ttl = results.get_setting('TTL')
+    options = results.analysis_options()
+
+    candidates = [
+        (query, count) for query, count in popular_queries(limit, get_setting('MIN_COUNT'))
+        if detect_input_type(query) not in results.UNSTORED_TYPES
+    ]
+    total = sum(count for _, count in candidates)
+    warm_before = warm_after = 0
+    computed = failed = skipped = 0
+    interval = 60.0 / rate_per_minute
+    next_call = time.monotonic()
+
+    for query, count in candidates:
+        key = results.analysis_key(query, options)
+        if _is_warm(key, ttl):
+            warm_before += count
+        if _is_warm(key, refresh_age):
+            warm_after += count
+            skipped += 1
+            continue
+        if dry_run:
+            log(f"would compute {key[:12]} (seen {count}x)")
+            continue
+
+        time.sleep(max(0.0, next_call - time.monotonic()))
+        next_call = time.monotonic() + interval
+        try:
+            with routing.request_key(key):
+                response_data = analyze_query(query, profile=options["profile"])
+        except Exception as e:
+            log(f"Prewarm error for {key[:12]}: {e}")
+            failed += 1
+            if _is_warm(key, ttl):
+                warm_after += count
+            continue
+        if results.store_result(key, query, options, response_data) is not None:
+            warm_after += count
+        computed += 1
+        log(f"computed {key[:12]} (seen {count}x)")
+
+    return {
+        "candidates": len(candidates),
+        "computed": computed,
+        "fresh": skipped,
+        "failed": failed,
+        "hit_rate_before": round(warm_before / total, 3) if total else 0.0,
+        "hit_rate_after": round(warm_after / total, 3) if total else 0.0,
+        "uplift_pct": round(100 * (warm_after - warm_before) / total, 1) if total else 0.0,
+        "finished_at": timezone.now().isoformat(),
+    }
+
+
+def run_forever(every=None, log=print, **options):
+    """Prewarm every `every` seconds; for hosts without a cron-like scheduler."""
+    every = every or get_setting('INTERVAL')
+    while True:
+        started = time.monotonic()
+        log(str(prewarm(log=log, **options)))
+        time.sleep(max(0.0, every - (time.monotonic() - started)))
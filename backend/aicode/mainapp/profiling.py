@@ -0,0 +1,169 @@
+"""
+Profiling of sampled live requests: ProfilingMiddleware and `manage.py profile_report`.
+
+With PROFILING enabled, a RATE fraction of requests under PATH_PREFIX run
+under cProfile, which costs an unsampled request one random() call. One
+request per process is profiled at a time, and work the request hands to
+other threads (hedged or batched LLM calls, jobs) shows up only as waiting.
+Sampled requests slower than MIN_LATENCY_MS are written to DIRECTORY as a
+pstats file (`<id>.prof`) and a JSON sidecar (`<id>.json`). The sidecar
+holds the path, status, latency and the tags the view set with `tag()`,
+such as the input type. Only the newest MAX_PROFILES are kept.
+
+With TRACEMALLOC set, sampled requests also trace allocations, and the
+sidecar gets the peak traced memory and the TOP_ALLOCATIONS lines that
+allocated the most. Tracing is process-wide, so allocations made by
+concurrent requests are counted too.
+"""
+import contextvars
+import cProfile
+import json
+import os
+import random
+import threading
+import time
+import tracemalloc
+import uuid
+
+from django.conf import settings
+
+
+PROFILING_DEFAULTS = {
+    'ENABLED': False,
+    'RATE': 0.01,             # fraction of requests profiled
+    'PATH_PREFIX': '/api/v2/',
+    'MIN_LATENCY_MS': 0,      # discard profiles of faster requests
+    'DIRECTORY': os.path.join(settings.BASE_DIR, 'profiles'),
+    'MAX_PROFILES': 500,      # oldest profiles are deleted beyond this
+    'TRACEMALLOC': False,
+    'TOP_ALLOCATIONS': 10,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'PROFILING', {}).get(name, PROFILING_DEFAULTS[name])
+
+
+# ============== TAGS ==============
+
+_tags = contextvars.ContextVar("profiling_tags", default=None)
+
+
+def tag(**values):
+    """Attach values (e.g. input_type) to the profile of the current request, if it is sampled."""
+    tags = _tags.get()
+    if tags is not None:
+        tags.update(values)
+
+
+# ============== TRACEMALLOC ==============
+
+def _start_tracing():
+    """Start tracemalloc; returns False when something else is already tracing."""
+    if tracemalloc.is_tracing():
+        return False
+    tracemalloc.start()
+    return True
+
+
+def _stop_tracing(started):
+    snapshot = tracemalloc.take_snapshot()
+    _, peak = tracemalloc.get_traced_memory()
+    if started:
+        tracemalloc.stop()
+    top = [
+        {"location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}", "bytes": stat.size,
+         "count": stat.count}
+        for stat in snapshot.statistics("lineno")[:get_setting('TOP_ALLOCATIONS')]
+    ]
+    return {"peak_bytes": peak, "top_allocations": top}
+
+
+# ============== STORE ==============
+
+def save_profile(profiler, meta):
+    directory = get_setting('DIRECTORY')
+    os.makedirs(directory, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+    profiler.dump_stats(os.path.join(directory, f"{name}.prof"))
+    with open(os.path.join(directory, f"{name}.json"), 'w', encoding='utf-8') as f:
+        json.dump(meta, f)
+    rotate(directory, get_setting('MAX_PROFILES'))
+
+
+def rotate(directory, keep):
+    names = sorted(entry[:-len(".json")] for entry in os.listdir(directory) if entry.endswith(".json"))
+    for name in names[:max(0, len(names) - keep)]:
+        for suffix in (".prof", ".json"):
+            try:
+                os.remove(os.path.join(directory, name + suffix))
+            except OSError:
+                pass
+
+
+def load_profiles(directory=None):
+    """Yield (pstats path, metadata) for every stored profile, oldest first."""
+    directory = directory or get_setting('DIRECTORY')
+    if not os.path.isdir(directory):
+        return
+    for entry in sorted(os.listdir(directory)):
+        if not entry.endswith(".json"):
+            continue
+        path = os.path.join(directory, entry[:-len(".json")] + ".prof")
+        try:
+            with open(os.path.join(directory, entry), encoding='utf-8') as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        if os.path.exists(path):
+            yield path, meta
+
+
+# ============== MIDDLEWARE ==============
+
+_profiling = threading.Lock()
+
+
+class ProfilingMiddleware:
+    """Profile a sampled fraction of API requests; see the module docstring."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not get_setting('ENABLED') or random.random() >= get_setting('RATE') \
+                or not request.path.startswith(get_setting('PATH_PREFIX')):
+            return self.get_response(request)
+        if not _profiling.acquire(blocking=False):
+            return self.get_response(request)
+        try:
+            return self._profile(request)
+        finally:
+            _profiling.release()
+
+    def _profile(self, request):
+        tags = {}
+        token = _tags.set(tags)
+        trace = get_setting('TRACEMALLOC')
+        started_tracing = trace and _start_tracing()
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            response = profiler.runcall(self.get_response, request)
+        finally:
+            latency_ms = (time.perf_counter() - started) * 1000
+            _tags.reset(token)
+            memory = _stop_tracing(started_tracing) if trace else None
+
+        if latency_ms >= get_setting('MIN_LATENCY_MS'):
+            meta = {
+                "path": request.path, "method": request.method, "status": response.status_code,
+                "latency_ms": round(latency_ms, 1), "at": time.time(), "tags": tags,
+            }
+            if memory:
+                meta["memory"] = memory
+            try:
+                save_profile(profiler, meta)
+            except OSError as e:
+                print(f"Profile store error: {e}")
+        return response
@@ -0,0 +1,358 @@
+"""
+Prompt preparation: token estimates, code compaction and input budgets.
+
+User input is compacted before it is embedded in an LLM prompt:
+
+- Code loses comments, trailing whitespace and runs of blank lines. String
+  literals and constant containers (lists, dicts, ... of literals) longer
+  than LITERAL_CHARS are swapped for placeholder names such as
+  `__LITERAL_0__`, and `restore_literals` puts them back into the code the
+  model returns. Docstrings and strings containing blank lines are kept
+  intact. Each compacted line remembers the source lines it came from, so
+  `PreparedInput.restore_code` applies the model's changes to the original
+  source (keeping its comments and layout) and `source_line` maps the line
+  numbers the model reports back to the user's.
+- Text has its whitespace collapsed.
+- Whatever is still over the budget for its input type is clipped to its
+  head and tail.
+
+Tokens before and after are recorded in mainapp.metrics per input type.
+"""
+import ast
+import bisect
+import io
+import re
+import tokenize
+
+from django.conf import settings
+
+from . import diffs, metrics
+
+
+PROMPT_DEFAULTS = {
+    'VERSION': 1,          # bump when prompt templates change; part of result keys
+    'LITERAL_CHARS': 200,  # literals longer than this become placeholders
+    # Token budget for the user input embedded in each kind of prompt
+    'BUDGETS': {
+        'code': 3000,
+        'code_request': 400,
+        'programming': 400,
+        'general': 300,
+    },
+}
+
+PLACEHOLDER = "__LITERAL_{}__"
+PLACEHOLDER_RE = re.compile(r"__LITERAL_(\d+)__")
+OMITTED_RE = re.compile(r"# \.\.\. \d+ lines omitted \.\.\.")
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def get_setting(name):
+    return getattr(settings, 'PROMPTS', {}).get(name, PROMPT_DEFAULTS[name])
+
+
+def estimate_tokens(text):
+    """
+    Approximate BPE token count: one per punctuation mark and one per four
+    characters of each word, which tracks real tokenizers closely for code.
+    """
+    return sum((len(m) + 3) // 4 if m[0].isalnum() or m[0] == '_' else 1 for m in _TOKEN_RE.findall(text))
+
+
+class PreparedInput:
+    """
+    Compacted input plus what is needed to undo the compaction.
+    `clipped` is set when part of the input was cut to fit the budget, so
+    the model never saw all of it. For code, `source` is the original and
+    `lines` holds the (first, last) source lines of each line of `text`.
+    """
+
+    def __init__(self, text, literals, tokens_before, tokens_after, clipped=False, source=None, lines=None):
+        self.text = text
+        self.literals = literals
+        self.tokens_before = tokens_before
+        self.tokens_after = tokens_after
+        self.clipped = clipped
+        self.source = source
+        self.lines = lines
+
+    @property
+    def tokens_saved(self):
+        return self.tokens_before - self.tokens_after
+
+    def restore(self, text):
+        return restore_literals(text, self.literals)
+
+    def _mapped(self):
+        return self.source is not None and self.lines is not None \
+            and len(self.lines) == len(diffs.split_lines(self.text + "\n"))
+
+    def source_line(self, line):
+        """The source line number of `line` (1-based) in `text`."""
+        if self._mapped() and isinstance(line, int) and 1 <= line <= len(self.lines):
+            return self.lines[line - 1][0]
+        return line
+
+    def restore_code(self, text):
+        """
+        Apply the changes the model made to `text` to the original source,
+        so lines it left alone keep their comments and layout.
+        """
+        if not text or not self._mapped():
+            return self.restore(text)
+        if not text.endswith("\n"):
+            text += "\n"
+        edits = []
+        for start, end, new_lines in diffs.edit_script(diffs.split_lines(self.text + "\n"), text):
+            if start < end:
+                first, last = self.lines[start][0] - 1, self.lines[end - 1][1]
+            else:
+                # An insertion goes right after the previous line, before any comment
+                first = last = self.lines[start - 1][1] if start else self.lines[0][0] - 1
+            edits.append([first, last, diffs.split_lines(self.restore("".join(new_lines)))])
+        source = self.source if self.source.endswith("\n") or not edits else self.source + "\n"
+        restored = diffs.apply_edits(source, edits)
+        return restored if self.source.endswith("\n") else restored.rstrip("\n")
+
+
+def prepare_input(text, kind):
+    """Compact `text` for a prompt of the given kind ("code" or an input type)."""
+    literals, source, lines = [], None, None
+    if kind == "code":
+        source = text.replace("\r\n", "\n")
+        compacted, literals, lines = compact_code(source, get_setting('LITERAL_CHARS'))
+    else:
+        compacted = compact_text(text)
+    budget = get_setting('BUDGETS').get(kind)
+    clipped = False
+    if budget and estimate_tokens(compacted) > budget:
+        unclipped = compacted
+        compacted = clip_code(compacted, budget) if kind == "code" else clip_text(compacted, budget)
+        clipped = compacted != unclipped
+        if clipped and lines is not None:
+            lines = _clipped_lines(lines, compacted)
+
+    prepared = PreparedInput(
+        compacted, literals, estimate_tokens(text), estimate_tokens(compacted), clipped, source, lines,
+    )
+    metrics.increment(f"prompt.{kind}.requests")
+    metrics.increment(f"prompt.{kind}.tokens_in", prepared.tokens_before)
+    metrics.increment(f"prompt.{kind}.tokens_saved", prepared.tokens_saved)
+    return prepared
+
+
+def restore_literals(text, literals):
+    """Replace placeholder names in model output with the original literals."""
+    if not literals or not text:
+        return text
+
+    def replace(match):
+        index = int(match.group(1))
+        return literals[index] if index < len(literals) else match.group(0)
+
+    return PLACEHOLDER_RE.sub(replace, text)
+
+
+# ============== TEXT ==============
+
+def compact_text(text):
+    text = re.sub(r"[ \t]+", " ", text.strip())
+    return re.sub(r"\n\s*\n+", "\n\n", text)
+
+
+def clip_text(text, budget):
+    """Keep the head and tail of `text` within roughly `budget` tokens."""
+    limit = budget * 4
+    if len(text) <= limit:
+        return text
+    marker = " [...] "
+    head = (limit - len(marker)) * 2 // 3
+    return text[:head] + marker + text[-(limit - len(marker) - head):]
+
+
+def clip_code(code, budget):
+    """Keep whole leading and trailing lines within `budget`, noting the gap."""
+    lines = code.splitlines()
+    head, tail = [], []
+    used = estimate_tokens("# ... 0000 lines omitted ...")
+    i, j = 0, len(lines) - 1
+    # Two thirds of the budget for the head, the rest for the tail
+    while i <= j:
+        cost = estimate_tokens(lines[i]) + 1
+        if used + cost > budget * 2 // 3:
+            break
+        head.append(lines[i])
+        used += cost
+        i += 1
+    while j >= i:
+        cost = estimate_tokens(lines[j]) + 1
+        if used + cost > budget:
+            break
+        tail.append(lines[j])
+        used += cost
+        j -= 1
+    omitted = j - i + 1
+    if omitted <= 0:
+        return code
+    indent = re.match(r"\s*", lines[i]).group(0)
+    return "\n".join(head + [f"{indent}# ... {omitted} lines omitted ..."] + tail[::-1])
+
+
+def _clipped_lines(lines, clipped):
+    """The line map of clip_code's output: head lines, the omission marker, tail lines."""
+    kept = clipped.split("\n")
+    head = next((i for i, line in enumerate(kept) if OMITTED_RE.fullmatch(line.strip())), None)
+    tail = len(kept) - (head or 0) - 1
+    if head is None or head + tail >= len(lines):
+        return None
+    return lines[:head] + [(lines[head][0], lines[-tail - 1][1])] + lines[len(lines) - tail:]
+
+
+# ============== CODE ==============
+
+def _line_offsets(source):
+    offsets = [0, 0]  # tokenize and ast lines are 1-based
+    for line in source.split("\n"):
+        offsets.append(offsets[-1] + len(line) + 1)
+    return offsets
+
+
+def _is_constant_display(node):
+    if isinstance(node, ast.Constant):
+        return True
+    if isinstance(node, ast.UnaryOp) and isinstance(node.operand, ast.Constant):
+        return True
+    if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+        return all(_is_constant_display(element) for element in node.elts)
+    if isinstance(node, ast.Dict):
+        return all(key is not None and _is_constant_display(key) for key in node.keys) and all(
+            _is_constant_display(value) for value in node.values
+        )
+    return False
+
+
+def _docstring_nodes(tree):
+    nodes = set()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Module, ast.ClassDef, ast.FunctionDef, ast.AsyncFunctionDef)):
+            body = node.body
+            if body and isinstance(body[0], ast.Expr) and isinstance(body[0].value, ast.Constant) \
+                    and isinstance(body[0].value.value, str):
+                nodes.add(id(body[0].value))
+    return nodes
+
+
+def _literal_spans(source, tree, offsets, limit):
+    """Character spans of large literals, outermost first and non-overlapping."""
+    docstrings = _docstring_nodes(tree)
+    lines = source.split("\n")
+    spans = []
+
+    def char_offset(lineno, col_offset):
+        # ast columns count UTF-8 bytes
+        return offsets[lineno] + len(lines[lineno - 1].encode()[:col_offset].decode(errors="ignore"))
+
+    def visit(node):
+        if isinstance(node, (ast.List, ast.Tuple, ast.Set, ast.Dict, ast.Constant)) \
+                and id(node) not in docstrings and _is_constant_display(node) \
+                and getattr(node, 'end_lineno', None) is not None:
+            start = char_offset(node.lineno, node.col_offset)
+            end = char_offset(node.end_lineno, node.end_col_offset)
+            segment = source[start:end]
+            # A tuple without parentheses cannot be swapped for a name safely
+            bare_tuple = isinstance(node, ast.Tuple) and not segment.startswith("(")
+            if end - start > limit and not bare_tuple and not re.search(r"\n\s*\n", segment):
+                spans.append((start, end))
+                return
+        for child in ast.iter_child_nodes(node):
+            visit(child)
+
+    visit(tree)
+    return spans
+
+
+def compact_code(source, literal_chars=200):
+    """
+    Return `(compacted_source, literals, lines)`, where `lines` holds the
+    (first, last) source line numbers of each compacted line.
+
+    Source that does not parse (the code under review may have syntax
+    errors) only gets comment and whitespace stripping, as far as the
+    tokenizer can follow it.
+    """
+    source = source.replace("\r\n", "\n")
+    offsets = _line_offsets(source)
+    edits = []       # (start, end, replacement)
+    protected = set()  # lines inside multi-line strings: keep verbatim
+
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        tree = None
+    if tree is not None:
+        edits = [(start, end, None) for start, end in _literal_spans(source, tree, offsets, literal_chars)]
+
+    try:
+        for token in tokenize.generate_tokens(io.StringIO(source).readline):
+            if token.type == tokenize.COMMENT:
+                start = offsets[token.start[0]] + token.start[1]
+                edits.append((start, offsets[token.end[0]] + token.end[1], ""))
+            elif token.type == tokenize.STRING or tokenize.tok_name[token.type].startswith("FSTRING"):
+                protected.update(range(token.start[0] + 1, token.end[0] + 1))
+    except (tokenize.TokenError, SyntaxError, IndentationError):
+        pass
+
+    # Apply edits back to front; comments inside a replaced literal vanish with it
+    literals = []
+    edits.sort(key=lambda edit: edit[0])
+    kept = []
+    for edit in edits:
+        if kept and edit[0] < kept[-1][1]:
+            continue
+        kept.append(edit)
+    pieces, origins, ends, position = [], [1], [], 0
+    for start, end, replacement in kept + [(len(source), len(source), "")]:
+        segment = source[position:start]
+        pieces.append(segment)
+        # Remember which source lines each output line starts and ends on
+        newline = segment.find("\n")
+        while newline >= 0:
+            ends.append(bisect.bisect_right(offsets, position + newline) - 1)
+            origins.append(ends[-1] + 1)
+            newline = segment.find("\n", newline + 1)
+        if replacement is None:
+            replacement = PLACEHOLDER.format(len(literals))
+            literals.append(source[start:end])
+        pieces.append(replacement)
+        position = end
+    compacted = "".join(pieces)
+
+    # Whitespace cleanup that never touches the inside of a string
+    out, lines, blank = [], [], False
+    source_lines = source.split("\n")
+    ends.append(len(source_lines))
+    for line, origin, last in zip(compacted.split("\n"), origins, ends):
+        if origin in protected:
+            out.append(line)
+            lines.append((origin, last))
+            blank = False
+            continue
+        line = line.rstrip()
+        if not line:
+            # Lines emptied by comment removal go; real blank lines collapse to one
+            emptied = origin <= len(source_lines) and source_lines[origin - 1].strip()
+            if blank or emptied:
+                continue
+            blank = True
+        else:
+            blank = False
+        out.append(line)
+        lines.append((origin, last))
+    while out and not out[-1]:
+        out.pop()
+        lines.pop()
+    while out and not out[0]:
+        out.pop(0)
+        lines.pop(0)
+    return "\n".join(out), literals, lines
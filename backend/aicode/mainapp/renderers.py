@@ -0,0 +1,208 @@
+import functools
+import json
+import threading
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.utils.http import parse_header_parameters
+from rest_framework import serializers
+from rest_framework.renderers import BaseRenderer
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+
+from .serializers import AnalyzeOutputSerializer
+
+try:
+    import orjson
+except ImportError:  # optional speed-up
+    orjson = None
+
+
+FAST_RENDER_DEFAULTS = {
+    'ENABLED': True,
+    'ORJSON': True,
+    'MAX_STATIC': 256,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'FAST_RENDER', {}).get(name, FAST_RENDER_DEFAULTS[name])
+
+
+# ============== FIELD LAYOUTS ==============
+#
+# A layout is the serializer's field list flattened once into
+# (name, source, required, kind, converter) tuples. Walking it reproduces
+# Serializer.to_representation for dict input without the per-field method
+# dispatch, so the output is the same dict DRF would build.
+
+_BOOL_TRUE = serializers.BooleanField.TRUE_VALUES
+_BOOL_FALSE = serializers.BooleanField.FALSE_VALUES
+
+SCALAR, FLOAT, NESTED, MANY = range(4)
+
+
+def _to_bool(value):
+    if value in _BOOL_TRUE:
+        return True
+    if value in _BOOL_FALSE:
+        return False
+    return bool(value)
+
+
+class UnsupportedLayout(Exception):
+    """The serializer uses a feature the fast path does not reproduce."""
+
+
+def compile_layout(serializer):
+    layout = []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        if field.default is not serializers.empty or field.allow_null or '.' in field.source or field.source == '*':
+            raise UnsupportedLayout(f"{type(serializer).__name__}.{name}")
+        if isinstance(field, serializers.ListSerializer):
+            kind, converter = MANY, compile_layout(field.child)
+        elif isinstance(field, serializers.Serializer):
+            kind, converter = NESTED, compile_layout(field)
+        elif isinstance(field, serializers.FloatField):
+            kind, converter = FLOAT, float
+        elif isinstance(field, serializers.BooleanField):
+            kind, converter = SCALAR, _to_bool
+        elif isinstance(field, serializers.IntegerField):
+            kind, converter = SCALAR, int
+        elif isinstance(field, serializers.CharField):
+            kind, converter = SCALAR, str
+        else:
+            kind, converter = SCALAR, field.to_representation
+        layout.append((name, field.source, field.required, kind, converter))
+    return tuple(layout)
+
+
+def apply_layout(layout, data, flags):
+    """Build the representation of `data`; sets flags["float"] if any float is emitted."""
+    ret = {}
+    for name, source, required, kind, converter in layout:
+        try:
+            value = data[source]
+        except KeyError:
+            if required:
+                raise
+            continue
+        if value is None:
+            ret[name] = None
+        elif kind == SCALAR:
+            ret[name] = converter(value)
+        elif kind == FLOAT:
+            flags["float"] = True
+            ret[name] = float(value)
+        elif kind == NESTED:
+            ret[name] = apply_layout(converter, value, flags)
+        else:
+            ret[name] = [apply_layout(converter, item, flags) for item in value]
+    return ret
+
+
+@functools.lru_cache(maxsize=None)
+def get_layout():
+    """Compile the AnalyzeOutputSerializer layout; None if it is unsupported."""
+    try:
+        return compile_layout(AnalyzeOutputSerializer())
+    except UnsupportedLayout:
+        return None
+
+
+# ============== ENCODING ==============
+
+def _encode_json(primitive):
+    # Same arguments as rest_framework.renderers.JSONRenderer with the default
+    # UNICODE_JSON, COMPACT_JSON and STRICT_JSON settings.
+    text = json.dumps(primitive, ensure_ascii=False, allow_nan=False, separators=(',', ':'))
+    return text.replace('\u2028', '\\u2028').replace('\u2029', '\\u2029').encode()
+
+
+def _encode_orjson(primitive):
+    body = orjson.dumps(primitive)
+    if b'\xe2\x80\xa8' in body or b'\xe2\x80\xa9' in body:
+        body = body.replace(b'\xe2\x80\xa8', b'\\u2028').replace(b'\xe2\x80\xa9', b'\\u2029')
+    return body
+
+
+def render_analysis(data):
+    """
+    Encode an analyze response to the exact bytes DRF would produce.
+
+    orjson, when installed and enabled, is only used for payloads without
+    floats, since it formats floats differently from json.dumps.
+    """
+    flags = {"float": False}
+    primitive = apply_layout(get_layout(), data, flags)
+    if orjson is not None and get_setting('ORJSON') and not flags["float"]:
+        return _encode_orjson(primitive)
+    return _encode_json(primitive)
+
+
+_static_bodies = {}
+_static_lock = threading.Lock()
+
+
+def render_static(key, data):
+    """Return pre-encoded bytes for a response that never changes for `key`."""
+    body = _static_bodies.get(key)
+    if body is None:
+        body = render_analysis(data)
+        with _static_lock:
+            if len(_static_bodies) < get_setting('MAX_STATIC'):
+                _static_bodies[key] = body
+    return body
+
+
+# ============== RESPONSES ==============
+
+def _wants_plain_json(request):
+    renderer = getattr(request, 'accepted_renderer', None)
+    if renderer is None or renderer.format != 'json':
+        return False
+    # The encoders above mirror JSONRenderer's default output only
+    if not (api_settings.UNICODE_JSON and api_settings.COMPACT_JSON and api_settings.STRICT_JSON):
+        return False
+    _, params = parse_header_parameters(getattr(request, 'accepted_media_type', '') or '')
+    return 'indent' not in params
+
+
+def analysis_response(request, data, static_key=None):
+    """
+    Return the analyze response, bypassing the serializer and renderer when
+    the client negotiated plain JSON. `static_key` marks responses whose
+    body is fully determined by the key, so their bytes are cached.
+    """
+    if not get_setting('ENABLED') or get_layout() is None or not _wants_plain_json(request):
+        return Response(AnalyzeOutputSerializer(data).data)
+    if static_key is not None:
+        body = render_static(static_key, data)
+    else:
+        body = render_analysis(data)
+    return HttpResponse(body, content_type='application/json')
+
+
+# ============== SERVER-SENT EVENTS ==============
+
+def sse_event(event, data):
+    """Encode one Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n".encode()
+
+
+class EventStreamRenderer(BaseRenderer):
+    """
+    Lets `Accept: text/event-stream` requests through content negotiation.
+    Views stream their own events; anything rendered here (e.g. a
+    validation error) is sent as a single "error" event.
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        return sse_event("error", data)
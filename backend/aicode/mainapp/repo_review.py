@@ -0,0 +1,210 @@
+"""
+Repository-scale review: `manage.py review_repo <path>`.
+
+The tree is walked as a stream. A file whose size and mtime match its
+RepoFileReview manifest row is skipped without being read, so a rerun on
+an unchanged repository costs one stat() per file. Other files go to a
+process pool, which hashes them, skips them if the content hash is
+unchanged, and otherwise runs the syntax check and the performance
+detector. Repository files are never executed.
+
+With the LLM enabled, locally reviewed files are then queued for an LLM
+review on a few threads. At most LLM_QUEUE_DEPTH files wait for the
+model, and the walk pauses while the queue is full. Each finished file is
+saved to its manifest row and appended to the NDJSON report straight
+away, so an interrupted run keeps what it finished.
+"""
+import ast
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import close_old_connections, connection
+
+from .perf_analyzer import analyze_performance
+
+
+REPO_REVIEW_DEFAULTS = {
+    'EXTENSIONS': ('.py',),
+    'SKIP_DIRS': ('.git', '.hg', '.svn', '__pycache__', 'node_modules', '.venv', 'venv', '.tox', 'build', 'dist'),
+    'MAX_FILE_BYTES': 512 * 1024,
+    'WORKERS': os.cpu_count() or 2,   # processes for hashing and local rules
+    'LLM_WORKERS': 4,                 # concurrent LLM reviews
+    'LLM_QUEUE_DEPTH': 16,            # files waiting for an LLM review
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'REPO_REVIEW', {}).get(name, REPO_REVIEW_DEFAULTS[name])
+
+
+def iter_source_files(root, extensions, skip_dirs, max_bytes):
+    """Yield (relative path, absolute path, stat) for reviewable files, lazily."""
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            entries = sorted(os.scandir(directory), key=lambda entry: entry.name)
+        except OSError:
+            continue
+        subdirectories = []
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name not in skip_dirs:
+                    subdirectories.append(entry.path)
+            elif entry.is_file(follow_symlinks=False) and entry.name.endswith(extensions):
+                stat = entry.stat()
+                if stat.st_size <= max_bytes:
+                    yield os.path.relpath(entry.path, root).replace(os.sep, "/"), entry.path, stat
+        stack.extend(reversed(subdirectories))
+
+
+# ============== LOCAL REVIEW (worker processes) ==============
+
+def review_file(path, known_hash=""):
+    """
+    Hash and locally review one file; runs in a worker process. Returns
+    {"hash", "unchanged": True} when the content matches `known_hash`.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    content_hash = hashlib.sha256(data).hexdigest()
+    if content_hash == known_hash:
+        return {"hash": content_hash, "unchanged": True}
+
+    source = data.decode("utf-8", errors="replace")
+    result = {"hash": content_hash, "lines": source.count("\n") + 1, "is_valid": True, "error": None}
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError) as e:
+        result["is_valid"] = False
+        result["error"] = {"message": getattr(e, "msg", str(e)), "line": getattr(e, "lineno", None)}
+        result["performance_hints"] = []
+    else:
+        result["performance_hints"] = analyze_performance(tree)
+    return result
+
+
+# ============== LLM REVIEW (threads) ==============
+
+def llm_review(path, local):
+    """Ask the model for corrections and improvements of a file that was reviewed locally."""
+    from . import routing
+    from .views import analyze_code_with_gemini
+
+    with open(path, encoding="utf-8", errors="replace") as f:
+        source = f.read()
+    # Hand over the local result, and fail rather than fall back to the
+    # local analysis, so that the file is never executed. A failed review
+    # is not saved and is retried on the next run.
+    checked = {"is_valid": local["is_valid"], "error": local["error"], "corrected_code": source, "output": ""}
+    # Routing logs the call from this pool thread; close its connection after
+    close_old_connections()
+    try:
+        with routing.request_key(local["hash"]):
+            analysis = analyze_code_with_gemini(source, local=checked, fallback=False)
+    finally:
+        connection.close()
+    return {
+        "corrected_code": analysis.get("corrected_code", source),
+        "improvements": analysis.get("improvements", []),
+        "best_version": analysis.get("best_version"),
+        "clipped": analysis.get("clipped", False),
+    }
+
+
+# ============== DRIVER ==============
+
+def review_repo(root, report=None, workers=None, use_llm=None, force=False, log=print):
+    """Review every changed file under `root`; returns counts and timing."""
+    from . import llm
+    from .models import RepoFileReview
+
+    root = os.path.abspath(root)
+    if not os.path.isdir(root):
+        raise FileNotFoundError(f"No such directory: {root}")
+    use_llm = llm.is_available() if use_llm is None else use_llm
+    workers = workers or get_setting('WORKERS')
+    queue_depth = get_setting('LLM_QUEUE_DEPTH')
+    started = time.perf_counter()
+    counts = {"files": 0, "unchanged": 0, "reviewed": 0, "failed": 0, "removed": 0}
+
+    manifest = {
+        path: (size, mtime_ns, content_hash)
+        for path, size, mtime_ns, content_hash in RepoFileReview.objects.filter(repo=root).values_list(
+            "path", "size", "mtime_ns", "content_hash",
+        ).iterator(chunk_size=2000)
+    }
+    seen = set()
+    pending = {}  # future -> (stage, relative path, absolute path, stat, local result)
+
+    def save(rel, stat, local, review=None):
+        result = dict(local)
+        if review is not None:
+            result["review"] = review
+        RepoFileReview.objects.update_or_create(repo=root, path=rel, defaults={
+            "content_hash": local["hash"], "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "result": result,
+        })
+        counts["reviewed"] += 1
+        if report is not None:
+            report.write(json.dumps({"path": rel, **result}, ensure_ascii=False) + "\n")
+            report.flush()
+
+    def handle(future):
+        stage, rel, path, stat, local = pending.pop(future)
+        try:
+            value = future.result()
+        except Exception as e:
+            log(f"{rel}: {stage} review failed: {e}")
+            counts["failed"] += 1
+            return
+        if stage == "local":
+            if value.get("unchanged"):
+                RepoFileReview.objects.filter(repo=root, path=rel).update(size=stat.st_size, mtime_ns=stat.st_mtime_ns)
+                counts["unchanged"] += 1
+            elif use_llm:
+                # Backpressure: wait for room in the LLM queue before adding to it
+                while sum(1 for entry in pending.values() if entry[0] == "llm") >= queue_depth:
+                    drain(llm_only=True)
+                pending[llm_pool.submit(llm_review, path, value)] = ("llm", rel, path, stat, value)
+            else:
+                save(rel, stat, value)
+        else:
+            save(rel, stat, local, review=value)
+
+    def drain(llm_only=False):
+        futures = [f for f, entry in pending.items() if not llm_only or entry[0] == "llm"]
+        done, _ = wait(futures, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future in pending:  # a nested drain may have handled it
+                handle(future)
+
+    with ProcessPoolExecutor(max_workers=workers) as pool, \
+            ThreadPoolExecutor(max_workers=get_setting('LLM_WORKERS'), thread_name_prefix="repo-llm") as llm_pool:
+        for rel, path, stat in iter_source_files(
+            root, tuple(get_setting('EXTENSIONS')), set(get_setting('SKIP_DIRS')), get_setting('MAX_FILE_BYTES'),
+        ):
+            counts["files"] += 1
+            seen.add(rel)
+            known = manifest.get(rel)
+            if known and not force and known[:2] == (stat.st_size, stat.st_mtime_ns):
+                counts["unchanged"] += 1
+                continue
+            pending[pool.submit(review_file, path, "" if force or not known else known[2])] = (
+                "local", rel, path, stat, None,
+            )
+            # Keep the walk only a little ahead of the workers
+            while len(pending) >= workers * 4:
+                drain()
+        while pending:
+            drain()
+
+    removed = [path for path in manifest if path not in seen]
+    for start in range(0, len(removed), 500):
+        counts["removed"] += RepoFileReview.objects.filter(repo=root, path__in=removed[start:start + 500]).delete()[0]
+
+    counts["seconds"] = round(time.perf_counter() - started, 3)
+    return counts
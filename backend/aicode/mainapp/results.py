@@ -0,0 +1,148 @@
+import hashlib
+import json
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from . import llm, prompts, routing, structured
+from .models import AnalysisResult, IdempotencyRecord
+
+
+RESULT_STORE_DEFAULTS = {
+    'TTL': 24 * 3600,                 # seconds a stored analysis answers repeat POSTs
+    'MAX_AGE': 3600,                  # Cache-Control max-age for GET by hash
+    'IDEMPOTENCY_WINDOW': 24 * 3600,  # seconds an Idempotency-Key is remembered
+    'IDEMPOTENCY_WAIT': 30,           # seconds a retry waits for the first attempt
+    'POLL_INTERVAL': 0.1,
+}
+
+# Responses that are cheap or deliberately varied are not stored
+UNSTORED_TYPES = frozenset(["greeting"])
+
+
+def get_setting(name):
+    return getattr(settings, 'ANALYSIS_STORE', {}).get(name, RESULT_STORE_DEFAULTS[name])
+
+
+# ============== STORED RESULTS ==============
+
+def normalize_query(query):
+    return query.replace('\r\n', '\n').strip()
+
+
+def query_hash(query):
+    """sha256 of the normalized query alone; groups requests for prewarming."""
+    return hashlib.sha256(normalize_query(query).encode()).hexdigest()
+
+
+def analysis_options(profile=False):
+    """Everything besides the query that changes the analysis."""
+    # Local fallbacks must not be served once a model is configured
+    options = {
+        "profile": bool(profile),
+        "model": routing.models_key() if llm.is_available() else "local",
+        "prompt_version": prompts.get_setting('VERSION'),
+    }
+    if structured.is_enabled():
+        options["output"] = "structured"
+    return options
+
+
+def analysis_key(query, options):
+    """sha256 of the normalized query and options; the resource id of a result."""
+    payload = json.dumps({"query": normalize_query(query), "options": options}, sort_keys=True)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def get_result(key, max_age=None):
+    """Return the stored AnalysisResult for `key`, optionally only if fresher than `max_age` seconds."""
+    results = AnalysisResult.objects.filter(key=key)
+    if max_age is not None:
+        results = results.filter(created_at__gte=timezone.now() - timedelta(seconds=max_age))
+    return results.first()
+
+
+def record_hit(result):
+    """Count a request answered from the store; prewarming ranks queries by it."""
+    AnalysisResult.objects.filter(pk=result.pk).update(hits=F("hits") + 1)
+
+
+def store_result(key, query, options, response):
+    """Save `response` under `key`; returns the AnalysisResult or None if not stored."""
+    if response.get("type") in UNSTORED_TYPES:
+        return None
+    result, _ = AnalysisResult.objects.update_or_create(
+        key=key,
+        defaults={
+            "input_type": response.get("type", ""),
+            "query": query,
+            "query_hash": query_hash(query),
+            "options": options,
+            "response": response,
+            "created_at": timezone.now(),
+        },
+    )
+    return result
+
+
+# ============== IDEMPOTENCY KEYS ==============
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = "This Idempotency-Key was already used with a different request."
+    default_code = "idempotency_key_reused"
+
+
+class IdempotencyInProgress(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = "A request with this Idempotency-Key is still being processed."
+    default_code = "idempotency_in_progress"
+
+
+def begin_idempotent(key, request_hash):
+    """
+    Claim an Idempotency-Key before doing the work.
+
+    Returns None when this call owns the key and should compute the response
+    (then call `finish_idempotent` or `release_idempotent`). If the key was
+    already completed, returns the stored response. If another attempt is
+    still running, waits up to IDEMPOTENCY_WAIT seconds for it to finish.
+    """
+    deadline = time.monotonic() + get_setting('IDEMPOTENCY_WAIT')
+    while True:
+        try:
+            with transaction.atomic():
+                IdempotencyRecord.objects.create(key=key, request_hash=request_hash)
+            return None
+        except IntegrityError:
+            pass
+
+        record = IdempotencyRecord.objects.filter(key=key).first()
+        if record is None:
+            continue  # the first attempt failed and released the key
+        expired = record.created_at < timezone.now() - timedelta(seconds=get_setting('IDEMPOTENCY_WINDOW'))
+        if expired:
+            IdempotencyRecord.objects.filter(pk=record.pk, created_at=record.created_at).delete()
+            continue
+        if record.request_hash != request_hash:
+            raise IdempotencyKeyReused()
+        if record.status == IdempotencyRecord.DONE:
+            return record.response
+        if time.monotonic() >= deadline:
+            raise IdempotencyInProgress()
+        time.sleep(get_setting('POLL_INTERVAL'))
+
+
+def finish_idempotent(key, response):
+    IdempotencyRecord.objects.filter(key=key).update(status=IdempotencyRecord.DONE, response=response)
+
+
+def release_idempotent(key):
+    """Forget a claimed key after a failure so a retry can run again."""
+    IdempotencyRecord.objects.filter(key=key, status=IdempotencyRecord.PENDING).delete()
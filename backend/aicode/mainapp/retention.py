@@ -0,0 +1,158 @@
+"""
+Retention tiering for review history: `manage.py archive_reviews`.
+
+CodeReview rows older than REVIEW_AGE_DAYS move to ArchivedReview, with
+their code and review compressed (zstd when the `zstandard` package is
+installed, zlib otherwise). ArchivedReview.code and .review decompress on
+read, and GET /api/v2/aicode/<id>/ still finds an archived review.
+
+Before a row leaves the hot table its counts are added to
+ReviewDailyStats, so per-day totals survive archiving. Rows move in
+batches of BATCH_SIZE, each in its own transaction, so the hot table is
+never locked for long and only holds recent rows, which keeps its queries
+fast however large the archive grows.
+"""
+import os
+import zlib
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Length
+from django.utils import timezone
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+RETENTION_DEFAULTS = {
+    'REVIEW_AGE_DAYS': 90,       # reviews older than this move to the archive
+    'BATCH_SIZE': 500,           # rows moved per transaction
+    'CODEC': 'auto',             # 'zstd', 'zlib' or 'auto' (zstd when installed)
+    'ZLIB_LEVEL': 9,
+    'ZSTD_LEVEL': 19,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'RETENTION', {}).get(name, RETENTION_DEFAULTS[name])
+
+
+# ============== COMPRESSION ==============
+
+def default_codec():
+    codec = get_setting('CODEC')
+    if codec == 'auto':
+        return 'zstd' if zstandard is not None else 'zlib'
+    if codec == 'zstd' and zstandard is None:
+        raise ValueError("RETENTION['CODEC'] is 'zstd' but the zstandard package is not installed")
+    return codec
+
+
+def compress(codec, text):
+    data = text.encode('utf-8')
+    if codec == 'zstd':
+        return zstandard.ZstdCompressor(level=get_setting('ZSTD_LEVEL')).compress(data)
+    return zlib.compress(data, get_setting('ZLIB_LEVEL'))
+
+
+def decompress(codec, blob):
+    blob = bytes(blob)
+    if codec == 'zstd':
+        if zstandard is None:
+            raise ValueError("Archived data is zstd-compressed but the zstandard package is not installed")
+        return zstandard.ZstdDecompressor().decompress(blob).decode('utf-8')
+    return zlib.decompress(blob).decode('utf-8')
+
+
+# ============== ARCHIVING ==============
+
+def _archive_batch(rows, codec):
+    from .models import ArchivedReview, ReviewDailyStats
+
+    archived, days = [], {}
+    raw = stored = 0
+    for row in rows:
+        code_blob = compress(codec, row.code)
+        review_blob = None if row.review is None else compress(codec, row.review)
+        row_raw = len(row.code.encode('utf-8')) + len((row.review or '').encode('utf-8'))
+        row_stored = len(code_blob) + len(review_blob or b'')
+        archived.append(ArchivedReview(
+            original_id=row.id, created_at=row.created_at, codec=codec, code_blob=code_blob,
+            review_blob=review_blob, raw_bytes=row_raw, stored_bytes=row_stored,
+        ))
+        day = days.setdefault(timezone.localdate(row.created_at), {"reviews": 0, "syntax_errors": 0, "code_bytes": 0})
+        day["reviews"] += 1
+        day["syntax_errors"] += (row.review or '').startswith("❌")
+        day["code_bytes"] += len(row.code.encode('utf-8'))
+        raw += row_raw
+        stored += row_stored
+
+    with transaction.atomic():
+        ArchivedReview.objects.bulk_create(archived, ignore_conflicts=True)
+        for day, totals in days.items():
+            ReviewDailyStats.objects.get_or_create(day=day)
+            ReviewDailyStats.objects.filter(day=day).update(
+                **{field: F(field) + value for field, value in totals.items()}
+            )
+        type(rows[0]).objects.filter(id__in=[row.id for row in rows]).delete()
+    return raw, stored
+
+
+def archive_reviews(older_than_days=None, batch_size=None, dry_run=False, log=print):
+    """Move old CodeReview rows to the compressed archive; returns a byte report."""
+    from .models import CodeReview
+
+    older_than_days = get_setting('REVIEW_AGE_DAYS') if older_than_days is None else older_than_days
+    batch_size = batch_size or get_setting('BATCH_SIZE')
+    cutoff = timezone.now() - timedelta(days=older_than_days)
+    old = CodeReview.objects.filter(created_at__lt=cutoff)
+    codec = default_codec()
+    report = {"codec": codec, "cutoff": cutoff.isoformat(), "archived": 0, "raw_bytes": 0, "stored_bytes": 0}
+
+    if dry_run:
+        sizes = old.aggregate(count=Count('id'), code=Sum(Length('code')), review=Sum(Length('review')))
+        report["archived"] = sizes["count"]
+        report["raw_bytes"] = (sizes["code"] or 0) + (sizes["review"] or 0)  # characters, roughly bytes
+        log(f"would archive {report['archived']} reviews created before {cutoff:%Y-%m-%d}")
+        return report
+
+    # Always take the oldest remaining batch: rows are deleted as they move
+    while True:
+        rows = list(old.order_by("id")[:batch_size])
+        if not rows:
+            break
+        raw, stored = _archive_batch(rows, codec)
+        report["archived"] += len(rows)
+        report["raw_bytes"] += raw
+        report["stored_bytes"] += stored
+        log(f"archived {report['archived']} reviews ({raw} -> {stored} bytes in this batch)")
+
+    report["bytes_reclaimed"] = report["raw_bytes"] - report["stored_bytes"]
+    report["compression_ratio"] = (
+        round(report["raw_bytes"] / report["stored_bytes"], 2) if report["stored_bytes"] else 0.0
+    )
+    return report
+
+
+# ============== STORAGE ==============
+
+def database_size():
+    """Bytes used by the database file, or None when it is not SQLite."""
+    if connection.vendor != 'sqlite':
+        return None
+    name = connection.settings_dict['NAME']
+    try:
+        return os.path.getsize(name)
+    except (OSError, TypeError):
+        return None
+
+
+def vacuum():
+    """Give the space freed by deleted rows back to the filesystem (SQLite)."""
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute("VACUUM")
@@ -0,0 +1,204 @@
+"""
+Model routing: which model tier, with which generation settings, serves a prompt.
+
+The tier comes from POLICY by prompt kind (the input type, or "code" for a
+review), moves up to LARGE_TIER when the input exceeds LARGE_INPUT_TOKENS,
+and moves to the tier's FALLBACK while the tier's recent median latency is
+above SLOW_AFTER of its TIMEOUT. A call that times out is retried once on
+the FALLBACK tier. With HEDGING enabled, a slow call is raced against a
+second identical call (see mainapp/hedging.py).
+
+Every call is recorded as an LLMCallLog row (tier, model, reason, tokens,
+latency, estimated cost) under the key of the request that made it, and
+`manage.py routing_report` summarises them for tuning the policy. A hedge
+is logged as a call of its own with reason "hedge", and whichever of the
+pair answered second has status "discarded".
+"""
+import contextvars
+import logging
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from . import hedging, llm, metrics
+from .prompts import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+
+ROUTING_DEFAULTS = {
+    # COST_INPUT / COST_OUTPUT are USD per million tokens
+    'TIERS': {
+        'small': {
+            'MODEL': 'gemini-1.5-flash-8b', 'MAX_OUTPUT_TOKENS': 1024, 'TEMPERATURE': 0.4,
+            'TIMEOUT': 15, 'COST_INPUT': 0.0375, 'COST_OUTPUT': 0.15, 'FALLBACK': 'standard',
+        },
+        'standard': {
+            'MODEL': 'gemini-1.5-flash', 'MAX_OUTPUT_TOKENS': 4096, 'TEMPERATURE': 0.2,
+            'TIMEOUT': 30, 'COST_INPUT': 0.075, 'COST_OUTPUT': 0.30, 'FALLBACK': 'small',
+        },
+        'large': {
+            'MODEL': 'gemini-1.5-pro', 'MAX_OUTPUT_TOKENS': 8192, 'TEMPERATURE': 0.2,
+            'TIMEOUT': 60, 'COST_INPUT': 1.25, 'COST_OUTPUT': 5.0, 'FALLBACK': 'standard',
+        },
+    },
+    'POLICY': {
+        'general': 'small',
+        'programming': 'small',
+        'code_request': 'standard',
+        'code': 'standard',
+    },
+    'DEFAULT_TIER': 'standard',
+    'LARGE_INPUT_TOKENS': 1500,
+    'LARGE_TIER': 'large',
+    'SLOW_AFTER': 0.8,       # fraction of TIMEOUT that marks a tier as slow
+    'LATENCY_WINDOW': 50,    # recent calls per tier used for the median
+    'MIN_SAMPLES': 5,
+    'LOG_CALLS': True,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'ROUTING', {}).get(name, ROUTING_DEFAULTS[name])
+
+
+def get_tier(name):
+    return get_setting('TIERS')[name]
+
+
+def models_key():
+    """The configured models, for keying stored results."""
+    return ",".join(sorted(tier['MODEL'] for tier in get_setting('TIERS').values()))
+
+
+# ============== OBSERVED LATENCY ==============
+
+_latencies = {}
+_latencies_lock = threading.Lock()
+
+
+def observe(tier, seconds):
+    with _latencies_lock:
+        window = _latencies.get(tier)
+        if window is None or window.maxlen != get_setting('LATENCY_WINDOW'):
+            window = _latencies[tier] = deque(window or (), maxlen=get_setting('LATENCY_WINDOW'))
+        window.append(seconds)
+
+
+def is_slow(tier):
+    with _latencies_lock:
+        samples = list(_latencies.get(tier, ()))
+    if len(samples) < get_setting('MIN_SAMPLES'):
+        return False
+    return statistics.median(samples) >= get_setting('SLOW_AFTER') * get_tier(tier)['TIMEOUT']
+
+
+def reset_latencies():
+    with _latencies_lock:
+        _latencies.clear()
+
+
+# ============== ROUTING ==============
+
+_request_key = contextvars.ContextVar("routing_request_key", default="")
+
+
+@contextmanager
+def request_key(key):
+    """Attribute the LLM calls made inside the block to `key` in the call log."""
+    token = _request_key.set(key)
+    try:
+        yield
+    finally:
+        _request_key.reset(token)
+
+
+def choose(kind, input_tokens):
+    """Return `(tier, reason)` for a prompt of `kind` with `input_tokens` of user input."""
+    tier = get_setting('POLICY').get(kind, get_setting('DEFAULT_TIER'))
+    reason = "policy"
+    if input_tokens > get_setting('LARGE_INPUT_TOKENS'):
+        tier, reason = get_setting('LARGE_TIER'), "large_input"
+    fallback = get_tier(tier).get('FALLBACK')
+    if fallback and is_slow(tier) and not is_slow(fallback):
+        tier, reason = fallback, f"slow:{tier}"
+    return tier, reason
+
+
+def generate(prompt, kind, input_tokens=None, schema=None):
+    """
+    Route `prompt` to a model tier and return the completion text. A timeout
+    is retried once on the tier's fallback; other errors propagate. `schema`
+    asks the provider for JSON matching it (see mainapp/structured.py).
+    """
+    prompt_tokens = estimate_tokens(prompt)
+    tier, reason = choose(kind, prompt_tokens if input_tokens is None else input_tokens)
+    try:
+        return _call(prompt, kind, tier, reason, prompt_tokens, schema)
+    except llm.LLMTimeout:
+        fallback = get_tier(tier).get('FALLBACK')
+        if not fallback:
+            raise
+        return _call(prompt, kind, fallback, f"timeout:{tier}", prompt_tokens, schema)
+
+
+def _call(prompt, kind, tier, reason, prompt_tokens, schema=None):
+    config = get_tier(tier)
+    generation = {
+        "max_output_tokens": config.get('MAX_OUTPUT_TOKENS'),
+        "temperature": config.get('TEMPERATURE'),
+        "timeout": config.get('TIMEOUT'),
+        "response_schema": schema,
+    }
+    # Hedged calls run on other threads, which do not see the context
+    request_key = _request_key.get()
+    answered = []
+    answered_lock = threading.Lock()
+
+    def attempt(hedge):
+        # Each upstream call, the hedge too, is logged with its own outcome;
+        # a reply that arrives after the other call answered is "discarded"
+        status, text = "error", ""
+        started = time.perf_counter()
+        try:
+            text = llm.generate(prompt, model=config['MODEL'], config=generation)
+            with answered_lock:
+                status = "discarded" if answered else "ok"
+                answered.append(hedge)
+            return text
+        except llm.LLMTimeout:
+            status = "timeout"
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            observe(tier, elapsed)
+            metrics.increment(f"llm.{tier}.calls")
+            if status in ("error", "timeout"):
+                metrics.increment(f"llm.{tier}.{status}s")
+            _log_call(
+                kind, tier, config, "hedge" if hedge else reason, status, prompt_tokens, estimate_tokens(text),
+                elapsed, request_key,
+            )
+
+    return hedging.call(kind, attempt)
+
+
+def _log_call(kind, tier, config, reason, status, input_tokens, output_tokens, elapsed, request_key=""):
+    if not get_setting('LOG_CALLS'):
+        return
+    from .models import LLMCallLog
+
+    cost = (input_tokens * config.get('COST_INPUT', 0) + output_tokens * config.get('COST_OUTPUT', 0)) / 1e6
+    try:
+        LLMCallLog.objects.create(
+            request_key=request_key, kind=kind, tier=tier, model=config['MODEL'], reason=reason,
+            status=status, input_tokens=input_tokens, output_tokens=output_tokens,
+            latency_ms=round(elapsed * 1000), cost=cost,
+        )
+    except Exception:
+        # The call itself succeeded or failed already; losing its log row must not change that
+        logger.warning("Could not log an LLM call", exc_info=True)
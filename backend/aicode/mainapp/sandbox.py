@@ -0,0 +1,439 @@
+import codecs
+import collections
+import json
+import os
+import selectors
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+
+SANDBOX_DEFAULTS = {
+    'TIMEOUT': 5,          # seconds per sandbox process
+    'MAX_WORKERS': 4,      # sandbox processes running at once
+    'REPEAT': 5,           # timing repeats per snippet (like timeit.repeat)
+    'MIN_RUN_TIME': 0.05,  # seconds each repeat should last at least
+    'MAX_NUMBER': 1000,    # cap on executions per repeat
+    'PROFILE_TOP_FUNCTIONS': 15,
+    'PROFILE_TOP_ALLOCATIONS': 10,
+    'OUTPUT_HEAD': 4000,         # characters of output kept from the start...
+    'OUTPUT_TAIL': 4000,         # ...and from the end
+    'STREAM_MAX_CHARS': 1000000,  # output forwarded to a streaming client
+    'STREAM_FLUSH_INTERVAL': 0.05,  # seconds between flushes of the child's stdout
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'SANDBOX', {}).get(name, SANDBOX_DEFAULTS[name])
+
+
+# Runs inside the child interpreter. The snippet arrives on stdin, the result
+# is written as JSON to the file named in argv so that anything the snippet
+# prints cannot corrupt it.
+HARNESS = r'''
+import collections, contextlib, hashlib, io, json, sys, time
+
+class _Null(io.TextIOBase):
+    def write(self, s):
+        return len(s)
+
+class _Capture(io.TextIOBase):
+    # The first `head` and last `tail` characters of the output, plus a
+    # hash of all of it, so any amount of output is compared in bounded memory
+    def __init__(self, head, tail):
+        self.head_limit, self.tail_limit = head, tail
+        self.head, self.head_size = [], 0
+        self.tail, self.tail_size = collections.deque(), 0
+        self.total = 0
+        self.hash = hashlib.sha256()
+        self.pending, self.pending_size = [], 0
+
+    def write(self, s):
+        # Small writes are batched; hashing each print() separately is slow
+        self.pending.append(s)
+        self.pending_size += len(s)
+        if self.pending_size >= 65536:
+            self._consume()
+        return len(s)
+
+    def _consume(self):
+        text = "".join(self.pending)
+        self.pending, self.pending_size = [], 0
+        self.hash.update(text.encode("utf-8", "surrogatepass"))
+        self.total += len(text)
+        room = self.head_limit - self.head_size
+        if room > 0:
+            self.head.append(text[:room])
+            self.head_size += len(self.head[-1])
+            text = text[room:]
+        if text and self.tail_limit:
+            self.tail.append(text)
+            self.tail_size += len(text)
+            while self.tail_size - len(self.tail[0]) >= self.tail_limit:
+                self.tail_size -= len(self.tail.popleft())
+
+    def result(self):
+        self._consume()
+        head = "".join(self.head)
+        tail = "".join(self.tail)[-self.tail_limit:] if self.tail_limit else ""
+        omitted = self.total - len(head) - len(tail)
+        output = f"{head}\n... [{omitted} characters truncated] ...\n{tail}" if omitted else head + tail
+        return {"output": output, "output_hash": self.hash.hexdigest(), "truncated": bool(omitted)}
+
+def _clip(text, limit=200):
+    return text if len(text) <= limit else "..." + text[-(limit - 3):]
+
+def _profile(code, params, result):
+    import cProfile, pstats, tracemalloc
+    profiler = cProfile.Profile()
+    tracemalloc.start()
+    error = None
+    with contextlib.redirect_stdout(_Null()):
+        profiler.enable()
+        try:
+            exec(code, {"__name__": "__main__"})
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+        profiler.disable()
+    snapshot = tracemalloc.take_snapshot()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    stats = pstats.Stats(profiler).stats
+    # Drop the harness's own frames (the -c script is "<string>")
+    rows = [
+        (func, row) for func, row in stats.items()
+        if func[0] != "<string>"
+        and func[2] != "<built-in method builtins.exec>"
+        and not func[2].startswith("<method 'disable' of '_lsprof")
+    ]
+    rows.sort(key=lambda item: item[1][3], reverse=True)
+    functions = []
+    for (filename, line, name), (cc, nc, tt, ct, _) in rows[:params["top_functions"]]:
+        functions.append({
+            "function": _clip(name, 100),
+            "location": _clip(f"{filename}:{line}" if line else filename),
+            "ncalls": nc,
+            "primitive_calls": cc,
+            "tottime_ms": round(tt * 1000, 4),
+            "cumtime_ms": round(ct * 1000, 4),
+        })
+
+    snapshot = snapshot.filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "<string>"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*>"),
+    ])
+    allocations = [
+        {"location": _clip(f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}"),
+         "size_bytes": stat.size, "count": stat.count}
+        for stat in snapshot.statistics("lineno")[:params["top_allocations"]]
+    ]
+
+    result["success"] = error is None
+    if error:
+        result["error"] = error
+    result["profile"] = {
+        "total_calls": sum(row[1] for row in stats.values()),
+        "total_time_ms": round(sum(row[2] for row in stats.values()) * 1000, 4),
+        "peak_memory_bytes": peak,
+        "functions": functions,
+        "allocations": allocations,
+        "truncated": len(rows) > len(functions),
+    }
+
+mode, result_path, params = sys.argv[1], sys.argv[2], json.loads(sys.argv[3])
+result = {"success": False}
+try:
+    code = compile(sys.stdin.read(), "<snippet>", "exec")
+    if mode == "profile":
+        _profile(code, params, result)
+        raise SystemExit
+    if mode == "stream":
+        # stdout is the parent's pipe. It stays block-buffered for speed and
+        # a timer flushes it so the parent still sees output as it happens.
+        import threading
+        def _flush():
+            while True:
+                time.sleep(params["flush_interval"])
+                try:
+                    sys.stdout.flush()
+                except Exception:
+                    pass
+        threading.Thread(target=_flush, daemon=True).start()
+        try:
+            exec(code, {"__name__": "__main__"})
+        finally:
+            sys.stdout.flush()
+        result["success"] = True
+        raise SystemExit
+    capture = _Capture(params["output_head"], params["output_tail"])
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(capture):
+        exec(code, {"__name__": "__main__"})
+    first_run = time.perf_counter() - started
+    result.update(capture.result())
+
+    if mode == "time":
+        number = max(1, min(params["max_number"], int(params["min_run_time"] / max(first_run, 1e-9))))
+        deadline = time.perf_counter() + params["budget"]
+        times = []
+        with contextlib.redirect_stdout(_Null()):
+            for _ in range(params["repeat"]):
+                if times and time.perf_counter() > deadline:
+                    break
+                started = time.perf_counter()
+                for _ in range(number):
+                    exec(code, {"__name__": "__main__"})
+                times.append((time.perf_counter() - started) / number)
+        result["number"] = number
+        result["times"] = times
+    result["success"] = True
+except SystemExit:
+    pass
+except BaseException as e:
+    result["error"] = f"{type(e).__name__}: {e}"
+
+with open(result_path, "w", encoding="utf-8") as f:
+    json.dump(result, f)
+'''
+
+
+def run(code, mode="run", params=None, timeout=None):
+    """
+    Execute `code` in a fresh, isolated Python process.
+
+    Returns a dict with "success", plus "output" on success or "error" on
+    failure. The output is kept to its OUTPUT_HEAD and OUTPUT_TAIL
+    characters ("truncated" says whether anything was cut) and
+    "output_hash" is the SHA-256 of all of it. In "time" mode the snippet is
+    also re-run `REPEAT` times and the per-execution durations are returned
+    in "times".
+    """
+    timeout = timeout or get_setting('TIMEOUT')
+    params = {'output_head': get_setting('OUTPUT_HEAD'), 'output_tail': get_setting('OUTPUT_TAIL'), **(params or {})}
+    fd, result_path = tempfile.mkstemp(prefix='sandbox-', suffix='.json')
+    os.close(fd)
+    try:
+        subprocess.run(
+            [sys.executable, '-I', '-c', HARNESS, mode, result_path, json.dumps(params)],
+            input=code,
+            text=True,
+            encoding='utf-8',
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            timeout=timeout,
+        )
+        with open(result_path, encoding='utf-8') as f:
+            content = f.read()
+        if not content:
+            return {"success": False, "error": "Sandbox process exited without a result"}
+        return json.loads(content)
+    except subprocess.TimeoutExpired:
+        return {"success": False, "error": f"Timed out after {timeout}s"}
+    finally:
+        os.unlink(result_path)
+
+
+# ============== STREAMING ==============
+
+class OutputBuffer:
+    """
+    Bounded record of a stream of text: the first `head` and the last
+    `tail` characters are kept, everything in between is only counted.
+    """
+
+    def __init__(self, head=None, tail=None):
+        self.head_limit = head if head is not None else get_setting('OUTPUT_HEAD')
+        self.tail_limit = tail if tail is not None else get_setting('OUTPUT_TAIL')
+        self.head = []
+        self.head_size = 0
+        self.tail = collections.deque()
+        self.tail_size = 0
+        self.total = 0
+
+    def write(self, text):
+        self.total += len(text)
+        room = self.head_limit - self.head_size
+        if room > 0:
+            self.head.append(text[:room])
+            self.head_size += len(self.head[-1])
+            text = text[room:]
+        if not text or not self.tail_limit:
+            return
+        self.tail.append(text)
+        self.tail_size += len(text)
+        while self.tail_size - len(self.tail[0]) >= self.tail_limit:
+            self.tail_size -= len(self.tail.popleft())
+
+    @property
+    def truncated(self):
+        return self.total > self.head_size + min(self.tail_size, self.tail_limit)
+
+    def getvalue(self):
+        head = "".join(self.head)
+        tail = "".join(self.tail)[-self.tail_limit:] if self.tail_limit else ""
+        if not self.truncated:
+            return head + tail
+        omitted = self.total - len(head) - len(tail)
+        return f"{head}\n... [{omitted} characters truncated] ...\n{tail}"
+
+
+class StreamingRun:
+    """
+    Run `code` in the sandbox and iterate over its stdout as it is printed.
+
+    Iterating yields decoded text chunks; afterwards `result` holds the
+    usual sandbox result dict and `output` the bounded OutputBuffer. The
+    child is killed on timeout or when iteration is abandoned.
+    """
+
+    def __init__(self, code, timeout=None):
+        self.code = code
+        self.timeout = timeout or get_setting('TIMEOUT')
+        self.output = OutputBuffer()
+        self.result = None
+
+    def __iter__(self):
+        fd, result_path = tempfile.mkstemp(prefix='sandbox-', suffix='.json')
+        os.close(fd)
+        process = subprocess.Popen(
+            [sys.executable, '-I', '-c', HARNESS, 'stream', result_path,
+             json.dumps({'flush_interval': get_setting('STREAM_FLUSH_INTERVAL')})],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+        deadline = time.monotonic() + self.timeout
+        timed_out = False
+        try:
+            process.stdin.write(self.code.encode('utf-8'))
+            process.stdin.close()
+            with selectors.DefaultSelector() as selector:
+                selector.register(process.stdout, selectors.EVENT_READ)
+                while True:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        timed_out = True
+                        break
+                    if not selector.select(timeout=remaining):
+                        continue
+                    data = os.read(process.stdout.fileno(), 65536)
+                    if not data:
+                        break
+                    text = decoder.decode(data)
+                    if text:
+                        self.output.write(text)
+                        yield text
+            text = decoder.decode(b'', final=True)
+            if text:
+                self.output.write(text)
+                yield text
+            if timed_out:
+                self.result = {"success": False, "error": f"Timed out after {self.timeout}s"}
+            else:
+                process.wait(timeout=max(deadline - time.monotonic(), 0.1))
+                with open(result_path, encoding='utf-8') as f:
+                    content = f.read()
+                self.result = json.loads(content) if content else {
+                    "success": False, "error": "Sandbox process exited without a result"
+                }
+        except subprocess.TimeoutExpired:
+            self.result = {"success": False, "error": f"Timed out after {self.timeout}s"}
+        finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+            process.stdout.close()
+            os.unlink(result_path)
+            if self.result is None:
+                self.result = {"success": False, "error": "Run was cancelled"}
+
+
+def execute(code, timeout=None):
+    """Run `code` to completion; like `run` but with bounded, head/tail output."""
+    streaming = StreamingRun(code, timeout=timeout)
+    for _ in streaming:
+        pass
+    result = dict(streaming.result)
+    result["output"] = streaming.output.getvalue()
+    result["truncated"] = streaming.output.truncated
+    return result
+
+
+def time_code(code, timeout=None):
+    """Run `code` once for its output, then time it with repeated runs."""
+    timeout = timeout or get_setting('TIMEOUT')
+    params = {
+        'budget': timeout / 2,
+        'repeat': get_setting('REPEAT'),
+        'min_run_time': get_setting('MIN_RUN_TIME'),
+        'max_number': get_setting('MAX_NUMBER'),
+    }
+    return run(code, mode="time", params=params, timeout=timeout)
+
+
+def profile_code(code, timeout=None):
+    """
+    Run `code` under cProfile and tracemalloc.
+
+    Returns a size-capped report: the top functions by cumulative time with
+    their call counts, the peak traced memory and the top allocation sites.
+    If the snippet raised or timed out the report also carries an "error".
+    """
+    params = {
+        'top_functions': get_setting('PROFILE_TOP_FUNCTIONS'),
+        'top_allocations': get_setting('PROFILE_TOP_ALLOCATIONS'),
+    }
+    result = run(code, mode="profile", params=params, timeout=timeout)
+    profile = result.get("profile") or {
+        "total_calls": 0,
+        "total_time_ms": 0.0,
+        "peak_memory_bytes": 0,
+        "functions": [],
+        "allocations": [],
+        "truncated": False,
+    }
+    if result.get("error"):
+        profile["error"] = result["error"]
+    return profile
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def _reset_executor_after_fork():
+    # Threads do not survive fork(); a pool warmed up before a pre-forking
+    # server forks its workers must be rebuilt in each child.
+    global _executor, _executor_lock
+    _executor = None
+    _executor_lock = threading.Lock()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_executor_after_fork)
+
+
+def get_executor():
+    """Return the thread pool used to drive sandbox processes in parallel."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=get_setting('MAX_WORKERS'), thread_name_prefix='sandbox'
+            )
+    return _executor
+
+
+def warm_pool():
+    """Start every pool thread and run one trivial snippet on each."""
+    executor = get_executor()
+    futures = [executor.submit(run, "pass") for _ in range(get_setting('MAX_WORKERS'))]
+    return [future.result() for future in futures]
@@ -1,15 +1,18 @@
 from rest_framework import serializers
-from .models import CodeReview
+from .models import AnalysisJob, CodeReview
 
 
 class CodeReviewSerializer(serializers.ModelSerializer):
     class Meta:
         model = CodeReview
-        fields = "__all__"
+        exclude = ["code_hash"]
 
 
 class AnalyzeInputSerializer(serializers.Serializer):
     query = serializers.CharField(required=True)
+    profile = serializers.BooleanField(required=False, default=False)
+    compact = serializers.BooleanField(required=False, default=False)
+    progressive = serializers.BooleanField(required=False, default=False)
 
 
 class ImprovedVersionSerializer(serializers.Serializer):
@@ -18,6 +21,48 @@ class ImprovedVersionSerializer(serializers.Serializer):
     explanation = serializers.CharField()
 
 
+class VersionTimingSerializer(serializers.Serializer):
+    version = serializers.IntegerField()
+    success = serializers.BooleanField()
+    matches_original = serializers.BooleanField()
+    best_ms = serializers.FloatField(required=False)
+    mean_ms = serializers.FloatField(required=False)
+    runs = serializers.IntegerField(required=False)
+    error = serializers.CharField(required=False)
+
+
+class ProfileFunctionSerializer(serializers.Serializer):
+    function = serializers.CharField()
+    location = serializers.CharField()
+    ncalls = serializers.IntegerField()
+    primitive_calls = serializers.IntegerField()
+    tottime_ms = serializers.FloatField()
+    cumtime_ms = serializers.FloatField()
+
+
+class AllocationSiteSerializer(serializers.Serializer):
+    location = serializers.CharField()
+    size_bytes = serializers.IntegerField()
+    count = serializers.IntegerField()
+
+
+class ProfileSerializer(serializers.Serializer):
+    total_calls = serializers.IntegerField()
+    total_time_ms = serializers.FloatField()
+    peak_memory_bytes = serializers.IntegerField()
+    functions = ProfileFunctionSerializer(many=True)
+    allocations = AllocationSiteSerializer(many=True)
+    truncated = serializers.BooleanField()
+    error = serializers.CharField(required=False)
+
+
+class PerformanceHintSerializer(serializers.Serializer):
+    line = serializers.IntegerField()
+    rule = serializers.CharField()
+    message = serializers.CharField()
+    complexity = serializers.CharField()
+
+
 class ErrorInfoSerializer(serializers.Serializer):
     message = serializers.CharField(required=False)
     line = serializers.IntegerField(required=False)
@@ -27,6 +72,13 @@ class ErrorInfoSerializer(serializers.Serializer):
     fix_message = serializers.CharField(required=False)
 
 
+class PendingJobSerializer(serializers.Serializer):
+    job = serializers.IntegerField()
+    status = serializers.CharField()
+    poll = serializers.CharField()
+    events = serializers.CharField()
+
+
 class AnalyzeOutputSerializer(serializers.Serializer):
     type = serializers.CharField()
     is_valid = serializers.BooleanField()
@@ -34,7 +86,28 @@ class AnalyzeOutputSerializer(serializers.Serializer):
     corrected_code = serializers.CharField(required=False, allow_blank=True)
     improved_versions = ImprovedVersionSerializer(many=True, required=False)
     best_version = serializers.IntegerField(required=False)
+    timings = VersionTimingSerializer(many=True, required=False)
     answer = serializers.CharField(required=False, allow_blank=True)
     example_code = serializers.CharField(required=False, allow_blank=True)
     documentation = serializers.CharField(required=False, allow_blank=True)
     output = serializers.CharField(required=False, allow_blank=True)
+    profile = ProfileSerializer(required=False)
+    performance_hints = PerformanceHintSerializer(many=True, required=False)
+    # Compact format only (see mainapp/diffs.py)
+    code_base = serializers.CharField(required=False, allow_blank=True)
+    code_patches = serializers.DictField(required=False)
+    # Progressive responses only: the job finishing the review
+    pending = PendingJobSerializer(required=False)
+
+
+class AnalysisJobSerializer(serializers.ModelSerializer):
+    timings = serializers.SerializerMethodField()
+
+    class Meta:
+        model = AnalysisJob
+        fields = ["id", "status", "attempts", "max_attempts", "partial", "result", "error",
+                  "created_at", "started_at", "finished_at", "timings"]
+
+    def get_timings(self, job):
+        from .jobs import job_timings
+        return job_timings(job)
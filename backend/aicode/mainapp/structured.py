@@ -0,0 +1,285 @@
+"""
+Structured output mode: schema-constrained, compact LLM answers.
+
+The regular prompts ask for JSON somewhere in the reply, and a code review
+gets the corrected code plus three improved versions, each a full copy of
+the source. With STRUCTURED_OUTPUT enabled, each handler instead declares
+a response schema in SCHEMAS. The provider is asked for JSON only (Gemini
+gets the schema as `response_schema`), and the reply is validated against
+it before use.
+
+Code reviews show the code with line numbers and ask for changes as edit
+hunks, {"from": first line, "to": last line, "code": new text}, instead of
+copies. `to` = `from` - 1 inserts before line `from`. The fix applies to
+the submitted code, and each improvement applies to the fixed code.
+`generate` applies the hunks and returns the same dict the regular prompt
+would have produced, so the handlers work unchanged from there. It returns
+None when the reply is not valid, and the handler then falls back to its
+regular prompt.
+
+Counters: structured.<kind>.calls, .invalid and .output_tokens.
+`manage.py benchmark structured` compares output tokens and estimated
+latency with the regular format on recorded responses.
+"""
+import json
+
+from django.conf import settings
+
+from . import diffs, metrics, routing
+from .prompts import estimate_tokens
+
+
+STRUCTURED_DEFAULTS = {
+    'ENABLED': False,
+    'KINDS': ('general', 'programming', 'code_request', 'code'),
+    'MAX_IMPROVEMENTS': 3,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'STRUCTURED_OUTPUT', {}).get(name, STRUCTURED_DEFAULTS[name])
+
+
+def is_enabled(kind=None):
+    return get_setting('ENABLED') and (kind is None or kind in get_setting('KINDS'))
+
+
+class SchemaError(ValueError):
+    """Raised when a reply does not match its schema."""
+
+
+# ============== SCHEMAS ==============
+
+STRING = {"type": "string"}
+INTEGER = {"type": "integer"}
+
+HUNK = {
+    "type": "object",
+    "properties": {"from": INTEGER, "to": INTEGER, "code": STRING},
+    "required": ["from", "to", "code"],
+}
+HUNKS = {"type": "array", "items": HUNK}
+
+SCHEMAS = {
+    "general": {
+        "type": "object",
+        "properties": {"response": STRING},
+        "required": ["response"],
+    },
+    "programming": {
+        "type": "object",
+        "properties": {
+            "response": STRING,
+            "example_code": STRING,
+            "best_practices": {"type": "array", "items": STRING, "maxItems": 3},
+        },
+        "required": ["response", "example_code", "best_practices"],
+    },
+    "code_request": {
+        "type": "object",
+        "properties": {"code": STRING, "explanation": STRING},
+        "required": ["code", "explanation"],
+    },
+    "code": {
+        "type": "object",
+        "properties": {
+            "is_valid": {"type": "boolean"},
+            "error": {
+                "type": "object",
+                "properties": {"message": STRING, "line": {"type": "integer", "nullable": True}},
+                "required": ["message", "line"],
+                "nullable": True,
+            },
+            "fix": HUNKS,
+            "improvements": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {"version": INTEGER, "explanation": STRING, "edits": HUNKS},
+                    "required": ["version", "explanation", "edits"],
+                },
+                "maxItems": 3,
+            },
+            "best_version": INTEGER,
+        },
+        "required": ["is_valid", "error", "fix", "improvements", "best_version"],
+    },
+}
+
+INSTRUCTIONS = {
+    "general": "You are a helpful AI assistant. Answer this question naturally and clearly. "
+               "Include a small code example only if it really helps.",
+    "programming": "You are a programming expert. Answer this question with a clear explanation, "
+                   "a short code example if relevant (else an empty string) and at most 3 best practices.",
+    "code_request": "You are a Python expert. Write clean, complete, working Python code with brief "
+                    "comments for this request, and explain it in one sentence.",
+    "code": "Review this Python code. Say whether it is valid and give the error, if any. Give up to "
+            "3 improved versions (version 1, 2, 3) and the number of the best one.\n"
+            "Never repeat unchanged code: describe every change as edit hunks "
+            '{"from": first line, "to": last line, "code": replacement lines}, using the line '
+            'numbers shown. "to" = "from" - 1 inserts before line "from"; an empty "code" deletes. '
+            '"fix" corrects the code as shown (empty when it is valid); each improvement\'s '
+            '"edits" apply to the code after "fix". Keep explanations to one short sentence.',
+}
+
+_TYPES = {
+    "object": dict, "array": list, "string": str, "integer": int, "boolean": bool,
+}
+
+
+def validate(value, schema, path="$"):
+    """Check `value` against a schema in the SCHEMAS subset; raises SchemaError."""
+    if value is None:
+        if schema.get("nullable"):
+            return
+        raise SchemaError(f"{path}: null is not allowed")
+    expected = _TYPES[schema["type"]]
+    # bool is an int subclass; an integer field must not accept true/false
+    if not isinstance(value, expected) or (expected is int and isinstance(value, bool)):
+        raise SchemaError(f"{path}: expected {schema['type']}")
+    if expected is dict:
+        for name in schema.get("required", ()):
+            if name not in value:
+                raise SchemaError(f"{path}: missing {name}")
+        for name, subschema in schema.get("properties", {}).items():
+            if name in value:
+                validate(value[name], subschema, f"{path}.{name}")
+    elif expected is list:
+        if len(value) > schema.get("maxItems", len(value)):
+            raise SchemaError(f"{path}: more than {schema['maxItems']} items")
+        for index, item in enumerate(value):
+            validate(item, schema["items"], f"{path}[{index}]")
+
+
+def provider_schema(schema):
+    """The schema without the keywords Gemini's response_schema does not take."""
+    if not isinstance(schema, dict):
+        return schema
+    return {
+        key: ({name: provider_schema(sub) for name, sub in value.items()} if key == "properties"
+              else provider_schema(value))
+        for key, value in schema.items() if key != "maxItems"
+    }
+
+
+# ============== PROMPTS ==============
+
+def number_lines(code):
+    lines = code.split("\n")
+    width = len(str(len(lines)))
+    return "\n".join(f"{number:>{width}}| {line}" for number, line in enumerate(lines, 1))
+
+
+def build_prompt(kind, text):
+    if kind == "code":
+        body = f"```\n{number_lines(text)}\n```"
+    elif kind == "code_request":
+        body = f"Request: {text}"
+    else:
+        body = text
+    return f"{INSTRUCTIONS[kind]}\n\n{body}\n\nReply with JSON only."
+
+
+# ============== HUNKS ==============
+
+def apply_hunks(code, hunks):
+    """Apply line hunks (1-based, inclusive) to `code`; raises SchemaError if they overlap or are out of range."""
+    lines = diffs.split_lines(code)
+    edits = []
+    previous_end = 0
+    for hunk in sorted(hunks, key=lambda h: (h["from"], h["to"])):
+        start, end = hunk["from"] - 1, hunk["to"]
+        if start < previous_end or end < start or end > len(lines):
+            raise SchemaError(f"hunk {hunk['from']}-{hunk['to']} does not fit {len(lines)} lines")
+        replacement = hunk["code"]
+        if replacement and not replacement.endswith("\n") and end < len(lines):
+            replacement += "\n"
+        if replacement and start == len(lines) and lines and not lines[-1].endswith("\n"):
+            replacement = "\n" + replacement  # appending after a last line without a line feed
+        edits.append([start, end, diffs.split_lines(replacement)])
+        previous_end = end
+    return diffs.apply_edits(code, edits)
+
+
+def to_hunks(base, text):
+    """Express `text` as hunks against `base` (the inverse of apply_hunks)."""
+    return [
+        {"from": start + 1, "to": end, "code": "".join(lines)}
+        for start, end, lines in diffs.edit_script(diffs.split_lines(base), text)
+    ]
+
+
+# ============== CALLS ==============
+
+def expand(kind, reply, text):
+    """Turn a validated reply into the dict the regular prompt of `kind` returns."""
+    if kind != "code":
+        return reply
+    corrected = apply_hunks(text, reply["fix"])
+    improvements = [
+        {
+            "version": item["version"],
+            "code": apply_hunks(corrected, item["edits"]),
+            "explanation": item["explanation"],
+        }
+        for item in reply["improvements"][:get_setting('MAX_IMPROVEMENTS')]
+    ]
+    return {
+        "is_valid": reply["is_valid"],
+        "error": reply["error"],
+        "corrected_code": corrected,
+        "improvements": improvements,
+        "best_version": reply["best_version"],
+    }
+
+
+def parse(kind, reply_text, text):
+    """Validate and expand a reply; raises SchemaError (or ValueError for bad JSON)."""
+    start = reply_text.find('{')
+    end = reply_text.rfind('}') + 1
+    if start < 0 or end <= start:
+        raise SchemaError("no JSON object in the reply")
+    reply = json.loads(reply_text[start:end])
+    validate(reply, SCHEMAS[kind])
+    return expand(kind, reply, text)
+
+
+def generate(kind, prepared, context=""):
+    """
+    Ask for a structured answer to `prepared` (a prompts.PreparedInput).
+    Returns the handler's usual result dict, or None to use the regular prompt.
+    """
+    prompt = build_prompt(kind, prepared.text)
+    if context:
+        prompt = f"{context}\n\n{prompt}"
+    metrics.increment(f"structured.{kind}.calls")
+    reply_text = routing.generate(prompt, kind, prepared.tokens_after, schema=provider_schema(SCHEMAS[kind]))
+    metrics.increment(f"structured.{kind}.output_tokens", estimate_tokens(reply_text))
+    try:
+        return parse(kind, reply_text, prepared.text)
+    except ValueError as e:
+        metrics.increment(f"structured.{kind}.invalid")
+        print(f"Structured output error ({kind}): {e}")
+        return None
+
+
+def from_regular(kind, result, text):
+    """The structured reply equivalent to a regular-format `result`, for measuring."""
+    if kind != "code":
+        return {name: result.get(name, [] if name == "best_practices" else "") for name in SCHEMAS[kind]["required"]}
+    corrected = result.get("corrected_code") or text
+    error = result.get("error")
+    return {
+        "is_valid": bool(result.get("is_valid", True)),
+        "error": {"message": error.get("message", ""), "line": error.get("line")} if isinstance(error, dict) else None,
+        "fix": to_hunks(text, corrected),
+        "improvements": [
+            {
+                "version": item.get("version", index + 1),
+                "explanation": item.get("explanation", ""),
+                "edits": to_hunks(corrected, item.get("code") or corrected),
+            }
+            for index, item in enumerate((result.get("improvements") or [])[:get_setting('MAX_IMPROVEMENTS')])
+        ],
+        "best_version": result.get("best_version") or 0,
+    }
@@ -1,3 +1,1581 @@
-from django.test import TestCase
+import hashlib
+import io
+import json
+import re
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from asgiref.testing import ApplicationCommunicator
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from . import admission, backfill, batching, chat, diffs, hedging, jobs, llm, prewarm, profiling, prompts, renderers, repo_review, results, retention, routing, sandbox, structured, throttling, verification
+from .perf_analyzer import analyze_performance
+from .serializers import AnalyzeOutputSerializer
+from .models import (
+    AnalysisJob, AnalysisResult, ArchivedReview, ChatSession, CodeReview, IdempotencyRecord, LLMCallLog,
+    RepoFileReview, ReviewDailyStats,
+)
+
+
+class ProviderTestMixin:
+    def use_provider(self, provider):
+        previous = llm.get_provider()
+        llm.set_provider(provider)
+        self.addCleanup(llm.set_provider, previous)
+
+
+class ReplyProvider(llm.LLMProvider):
+    """Answers every prompt with the same reply text."""
+
+    def __init__(self, reply):
+        self.reply = reply
+
+    def generate(self, prompt, model=None, config=None):
+        return self.reply
+
+
+# ============== JOBS ==============
+
+class JobQueueTests(TestCase):
+    def make_job(self, **fields):
+        fields.setdefault("query", "print(1)")
+        fields.setdefault("options", {"profile": False})
+        fields.setdefault("max_attempts", 3)
+        return AnalysisJob.objects.create(**fields)
+
+    def expired(self):
+        return timezone.now() - timedelta(seconds=1)
+
+    def test_claim_takes_oldest_queued_job(self):
+        first, second = self.make_job(), self.make_job()
+
+        job = jobs.claim("worker-a")
+
+        self.assertEqual(job.pk, first.pk)
+        self.assertEqual(job.status, AnalysisJob.RUNNING)
+        self.assertEqual(job.locked_by, "worker-a")
+        self.assertEqual(job.attempts, 1)
+        self.assertGreater(job.locked_until, timezone.now())
+        self.assertEqual(jobs.claim("worker-b").pk, second.pk)
+        self.assertIsNone(jobs.claim("worker-c"))
+
+    def test_queued_job_waits_out_its_retry_delay(self):
+        self.make_job(locked_until=timezone.now() + timedelta(seconds=60))
+
+        self.assertIsNone(jobs.claim("worker-a"))
+
+    def test_expired_claim_is_reclaimed(self):
+        job = self.make_job(status=AnalysisJob.RUNNING, locked_by="dead", locked_until=self.expired(), attempts=1)
+
+        claimed = jobs.claim("worker-a")
+
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertEqual(claimed.locked_by, "worker-a")
+        self.assertEqual(claimed.attempts, 2)
+
+    def test_live_claim_is_not_reclaimed(self):
+        self.make_job(
+            status=AnalysisJob.RUNNING, locked_by="alive", locked_until=timezone.now() + timedelta(seconds=60),
+            attempts=1,
+        )
+
+        self.assertIsNone(jobs.claim("worker-a"))
+
+    def test_expired_claim_on_last_attempt_is_not_reclaimed_but_failed(self):
+        job = self.make_job(status=AnalysisJob.RUNNING, locked_by="dead", locked_until=self.expired(), attempts=3)
+
+        self.assertIsNone(jobs.claim("worker-a"))
+        self.assertEqual(jobs.fail_abandoned(), 1)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, AnalysisJob.FAILED)
+        self.assertIsNone(job.locked_until)
+        self.assertIsNotNone(job.finished_at)
+        self.assertTrue(job.error)
+
+    def test_sweep_leaves_retryable_and_live_jobs_alone(self):
+        self.make_job(status=AnalysisJob.RUNNING, locked_until=self.expired(), attempts=1)
+        self.make_job(status=AnalysisJob.RUNNING, locked_until=timezone.now() + timedelta(seconds=60), attempts=3)
+
+        self.assertEqual(jobs.fail_abandoned(), 0)
+
+    @override_settings(JOBS={'RETRY_DELAY': 5})
+    def test_failed_attempt_is_retried_until_max_attempts(self):
+        job = self.make_job(max_attempts=2)
+
+        with mock.patch("mainapp.views.analyze_query", side_effect=RuntimeError("boom")):
+            self.assertFalse(jobs.run_job(jobs.claim("worker-a")))
+            job.refresh_from_db()
+            self.assertEqual(job.status, AnalysisJob.QUEUED)
+            self.assertGreater(job.locked_until, timezone.now())
+            self.assertIn("boom", job.error)
+
+            AnalysisJob.objects.filter(pk=job.pk).update(locked_until=self.expired())
+            self.assertFalse(jobs.run_job(jobs.claim("worker-a")))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, AnalysisJob.FAILED)
+        self.assertEqual(job.attempts, 2)
+        self.assertIsNone(jobs.claim("worker-a"))
+
+    def test_finished_job_stores_its_result(self):
+        job = self.make_job(query="hello")
+        response = {"type": "general", "answer": "hi"}
+
+        with mock.patch("mainapp.views.analyze_query", return_value=response):
+            self.assertTrue(jobs.run_job(jobs.claim("worker-a")))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, AnalysisJob.DONE)
+        self.assertEqual(job.result, response)
+        self.assertIsNone(job.locked_until)
+        self.assertTrue(AnalysisResult.objects.filter(query="hello").exists())
+
+    def test_result_of_a_lost_claim_is_not_written(self):
+        job = self.make_job()
+        claimed = jobs.claim("worker-a")
+        # The claim expired and another worker took the job over
+        AnalysisJob.objects.filter(pk=job.pk).update(locked_by="worker-b")
+
+        with mock.patch("mainapp.views.analyze_query", return_value={"type": "general"}):
+            jobs.run_job(claimed)
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, AnalysisJob.RUNNING)
+        self.assertEqual(job.locked_by, "worker-b")
+
+
+class JobEventStreamTests(TestCase):
+    def setUp(self):
+        admission.reset_lanes()
+        self.addCleanup(admission.reset_lanes)
+        self.client = APIClient()
+
+    def url(self, job):
+        return reverse("job-events", kwargs={"pk": job.pk})
+
+    def test_finished_job_streams_its_result_and_frees_the_place(self):
+        job = AnalysisJob.objects.create(
+            query="print(1)", status=AnalysisJob.DONE, partial={"stage": "local"}, result={"type": "code"},
+        )
+
+        response = self.client.get(self.url(job))
+        body = b"".join(response.streaming_content).decode()
+        response.close()
+
+        self.assertIn("event: partial", body)
+        self.assertIn("event: done", body)
+        self.assertEqual(admission.get_lanes()[admission.STREAM].in_flight, 0)
+
+    @override_settings(ADMISSION={'STREAM_CONCURRENCY': 1, 'RETRY_AFTER': 7})
+    def test_streams_beyond_the_limit_are_turned_away(self):
+        job = AnalysisJob.objects.create(query="print(1)")
+        admission.reset_lanes()
+
+        first = self.client.get(self.url(job))
+        second = self.client.get(self.url(job))
+        self.assertEqual(second.status_code, 503)
+        self.assertEqual(second["Retry-After"], "7")
+
+        # A stream closed before it started gives its place back
+        first.close()
+        third = self.client.get(self.url(job))
+        self.assertEqual(third.status_code, 200)
+        third.close()
+
+
+# ============== RATE LIMITS ==============
+
+class RateLimitTestMixin:
+    def use_ratelimit(self, **overrides):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        override = override_settings(RATELIMIT={'SHARED_FILE': f"{directory}/ratelimit", **overrides})
+        override.enable()
+        self.addCleanup(override.disable)
+
+
+class GCRATests(RateLimitTestMixin, TestCase):
+    def setUp(self):
+        self.use_ratelimit()
+
+    def test_allows_a_burst_then_denies(self):
+        remaining = [throttling.check("k", "3/min", now=1000).remaining for _ in range(3)]
+        denied = throttling.check("k", "3/min", now=1000)
+
+        self.assertEqual(remaining, [2, 1, 0])
+        self.assertFalse(denied.allowed)
+        self.assertEqual(denied.remaining, 0)
+        self.assertEqual(denied.retry_after, 20)  # one request refills every 20s
+        self.assertEqual(denied.reset, 60)
+
+    def test_denied_requests_do_not_use_up_the_bucket(self):
+        for _ in range(3):
+            throttling.check("k", "3/min", now=1000)
+        for _ in range(5):
+            self.assertFalse(throttling.check("k", "3/min", now=1000).allowed)
+
+        self.assertTrue(throttling.check("k", "3/min", now=1020).allowed)
+        self.assertFalse(throttling.check("k", "3/min", now=1020).allowed)
+
+    def test_idle_bucket_refills_to_the_full_burst(self):
+        for _ in range(3):
+            throttling.check("k", "3/min", now=1000)
+
+        self.assertEqual(throttling.check("k", "3/min", now=2000).remaining, 2)
+
+    def test_buckets_are_independent(self):
+        throttling.check("a", "1/min", now=1000)
+
+        self.assertFalse(throttling.check("a", "1/min", now=1000).allowed)
+        self.assertTrue(throttling.check("b", "1/min", now=1000).allowed)
+
+    def test_full_table_takes_over_the_slot_closest_to_expiry(self):
+        self.use_ratelimit(SHARED_SLOTS=1)
+        throttling.check("a", "1/min", now=1000)
+
+        self.assertTrue(throttling.check("b", "1/min", now=1000).allowed)
+        self.assertFalse(throttling.check("b", "1/min", now=1000).allowed)
+
+    def test_concurrent_checks_never_exceed_the_limit(self):
+        for store in ("shared", "cache"):
+            with self.subTest(store=store):
+                self.use_ratelimit(STORE=store, CACHE="default")
+                allowed = []
+
+                def hammer():
+                    allowed.append(sum(throttling.check(f"race:{store}", "100/h").allowed for _ in range(50)))
+
+                threads = [threading.Thread(target=hammer) for _ in range(8)]
+                for thread in threads:
+                    thread.start()
+                for thread in threads:
+                    thread.join()
+                self.assertEqual(sum(allowed), 100)
+
+    def test_cache_store(self):
+        self.use_ratelimit(STORE="cache", CACHE="default")
+
+        results = [throttling.check("cached", "2/min", now=1000).allowed for _ in range(3)]
+
+        self.assertEqual(results, [True, True, False])
+
+
+class RateLimitedViewTests(RateLimitTestMixin, TestCase):
+    url = "/api/v2/aicode/"
+
+    def setUp(self):
+        self.use_ratelimit(RATES={'llm': '2/min', 'local': '2/min'}, CLIENT_RATES={'good-key': {'local': '5/min'}})
+        self.client = APIClient()
+
+    def test_headers_and_429(self):
+        first = self.client.get(self.url)
+        self.client.get(self.url)
+        throttled = self.client.get(self.url)
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(first["RateLimit-Limit"], "2")
+        self.assertEqual(first["RateLimit-Remaining"], "1")
+        self.assertEqual(first["RateLimit-Policy"], "2;w=60")
+        self.assertEqual(first["RateLimit-Reset"], "30")
+        self.assertEqual(throttled.status_code, 429)
+        self.assertEqual(throttled["Retry-After"], "30")
+        self.assertEqual(throttled["RateLimit-Remaining"], "0")
+
+    def test_forged_forwarded_for_does_not_get_a_fresh_bucket(self):
+        statuses = [
+            self.client.get(self.url, HTTP_X_FORWARDED_FOR=f"10.0.0.{n}").status_code for n in range(3)
+        ]
+
+        self.assertEqual(statuses, [200, 200, 429])
+
+    def test_known_api_key_has_its_own_bucket_and_rates(self):
+        self.client.get(self.url)
+        self.client.get(self.url)
+
+        response = self.client.get(self.url, HTTP_X_API_KEY="good-key")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["RateLimit-Limit"], "5")
+
+    def test_unknown_api_key_shares_the_ip_bucket(self):
+        self.client.get(self.url)
+        self.client.get(self.url)
+
+        self.assertEqual(self.client.get(self.url, HTTP_X_API_KEY="made-up").status_code, 429)
+
+    def test_disabled(self):
+        self.use_ratelimit(ENABLED=False, RATES={'llm': '1/min', 'local': '1/min'})
+
+        statuses = [self.client.get(self.url).status_code for _ in range(3)]
+
+        self.assertEqual(statuses, [200, 200, 200])
+
+
+# ============== CONDITIONAL REQUESTS ==============
+
+@override_settings(RATELIMIT={'ENABLED': False})
+class ConditionalRequestTests(TestCase):
+    url = "/api/v2/aicode/"
+
+    def setUp(self):
+        self.client = APIClient()
+        for n in range(5):
+            CodeReview.objects.create(code=f"def f{n}():\n    return {n}\n" * 5, review="Looks fine.")
+
+    def test_matching_etag_gets_304(self):
+        response = self.client.get(self.url)
+        etag = response["ETag"]
+
+        not_modified = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.content, b"")
+        self.assertEqual(not_modified["ETag"], etag)
+
+    def test_head_gets_304(self):
+        etag = self.client.get(self.url)["ETag"]
+
+        self.assertEqual(self.client.head(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_changed_content_gets_200(self):
+        etag = self.client.get(self.url)["ETag"]
+        CodeReview.objects.create(code="print(1)")
+
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_compressed_representation_has_its_own_etag(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip")
+        etag = response["ETag"]
+
+        not_modified = self.client.get(self.url, HTTP_ACCEPT_ENCODING="gzip", HTTP_IF_NONE_MATCH=etag)
+        identity = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response["Content-Encoding"], "gzip")
+        self.assertTrue(etag.endswith('-gzip"'))
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified["ETag"], etag)
+        self.assertEqual(identity.status_code, 304)  # same content, other encoding
+        self.assertNotEqual(identity["ETag"], etag)
+
+    def test_post_is_never_answered_with_304(self):
+        response = self.client.post("/api/v2/analyze/", {"query": "hello"}, format="json", HTTP_IF_NONE_MATCH="*")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.has_header("ETag"))
+
+
+# ============== IDEMPOTENCY ==============
+
+ANSWER = {
+    "type": "general", "is_valid": True, "error": None, "corrected_code": "", "improved_versions": [],
+    "best_version": 0, "answer": "An answer.", "example_code": "", "documentation": "", "output": "",
+}
+
+
+@override_settings(RATELIMIT={'ENABLED': False})
+class IdempotencyTests(TestCase):
+    url = "/api/v2/analyze/"
+    query = "what is the capital of france"
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def post(self, query=None, key="key-1"):
+        return self.client.post(self.url, {"query": query or self.query}, format="json", HTTP_IDEMPOTENCY_KEY=key)
+
+    def request_hash(self, query=None):
+        return results.analysis_key(query or self.query, results.analysis_options())
+
+    def test_retry_replays_the_first_response(self):
+        with mock.patch("mainapp.views.analyze_query", return_value=dict(ANSWER)) as analyze:
+            first = self.post()
+            AnalysisResult.objects.all().delete()  # the replay must not come from the result store
+            retry = self.post()
+
+        self.assertEqual(analyze.call_count, 1)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(retry.status_code, 200)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertFalse(first.has_header("Idempotent-Replayed"))
+        self.assertEqual(retry.json(), first.json())
+
+    def test_key_reused_for_another_request_is_rejected(self):
+        with mock.patch("mainapp.views.analyze_query", return_value=dict(ANSWER)):
+            self.post()
+            response = self.post(query="what is the capital of spain")
+
+        self.assertEqual(response.status_code, 422)
+
+    def test_failed_attempt_releases_the_key(self):
+        with mock.patch("mainapp.views.analyze_query", side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                self.post()
+        self.assertFalse(IdempotencyRecord.objects.filter(key="key-1").exists())
+
+        with mock.patch("mainapp.views.analyze_query", return_value=dict(ANSWER)):
+            retry = self.post()
+
+        self.assertEqual(retry.status_code, 200)
+        self.assertFalse(retry.has_header("Idempotent-Replayed"))
+
+    @override_settings(ANALYSIS_STORE={'IDEMPOTENCY_WAIT': 0})
+    def test_retry_while_first_attempt_runs_gets_409(self):
+        IdempotencyRecord.objects.create(key="key-1", request_hash=self.request_hash())
+
+        with mock.patch("mainapp.views.analyze_query", return_value=dict(ANSWER)) as analyze:
+            response = self.post()
+
+        self.assertEqual(response.status_code, 409)
+        analyze.assert_not_called()
+
+    def test_expired_key_can_be_used_again(self):
+        IdempotencyRecord.objects.create(
+            key="key-1", request_hash=self.request_hash("something else"), status=IdempotencyRecord.DONE, response={},
+        )
+        IdempotencyRecord.objects.update(created_at=timezone.now() - timedelta(days=2))
+
+        with mock.patch("mainapp.views.analyze_query", return_value=dict(ANSWER)):
+            response = self.post()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(IdempotencyRecord.objects.get(key="key-1").request_hash, self.request_hash())
+
+
+# ============== ADMISSION ==============
+
+class LaneTests(TestCase):
+    def test_full_lane_rejects(self):
+        lane = admission.Lane("llm", 1, queue_depth=1, max_wait=1)
+        lane.enter()
+        lane.enter()
+
+        with self.assertRaises(admission.Overloaded) as rejected:
+            lane.enter()
+        self.assertEqual(rejected.exception.wait, admission.get_setting('RETRY_AFTER'))
+        self.assertEqual(lane.in_flight, 2)
+
+    def test_admit_gives_the_slot_back(self):
+        lane = admission.Lane("llm", 1, queue_depth=0, max_wait=1)
+
+        with lane.admit():
+            self.assertEqual(lane.in_flight, 1)
+
+        self.assertEqual(lane.in_flight, 0)
+        self.assertGreater(lane.service_time, 0)
+
+    def test_wait_for_a_slot_times_out(self):
+        lane = admission.Lane("llm", 1, queue_depth=1, max_wait=0.01)
+
+        with lane.admit():
+            with self.assertRaises(admission.Overloaded):
+                with lane.admit():
+                    pass
+            self.assertEqual(lane.in_flight, 1)
+
+    def test_slow_lane_rejects_before_queueing(self):
+        lane = admission.Lane("llm", 1, queue_depth=5, max_wait=1)
+        lane.enter()
+        lane.service_time = 10.0
+
+        with self.assertRaises(admission.Overloaded):
+            lane.enter()
+
+    def test_reservation_holds_a_place_until_run_or_cancelled(self):
+        lane = admission.Lane("llm", 1, queue_depth=1, max_wait=1)
+        lane.enter()
+        cancelled = admission.Reservation(lane)
+        lane.enter()
+        used = admission.Reservation(lane)
+
+        cancelled.cancel()
+        self.assertEqual(lane.in_flight, 1)
+        with used:
+            used.cancel()  # too late: the work is running
+            self.assertEqual(lane.in_flight, 1)
+        self.assertEqual(lane.in_flight, 0)
+
+
+@override_settings(
+    RATELIMIT={'ENABLED': False},
+    ADMISSION={'LLM_CONCURRENCY': 1, 'LLM_QUEUE_DEPTH': 0, 'RETRY_AFTER': 7},
+)
+class ProgressiveAdmissionTests(ProviderTestMixin, TestCase):
+    query = "def add(a, b):\n    return a + b\n"
+
+    def setUp(self):
+        self.use_provider(llm.FakeProvider())
+        admission.reset_lanes()
+        self.addCleanup(admission.reset_lanes)
+        self.client = APIClient()
+
+    def post(self):
+        return self.client.post("/api/v2/analyze/", {"query": self.query, "progressive": True}, format="json")
+
+    def test_job_takes_a_place_in_the_llm_lane(self):
+        with mock.patch("mainapp.jobs.start") as start:
+            response = self.post()
+
+        self.assertEqual(response.status_code, 202)
+        job, reservation = start.call_args.args
+        self.assertEqual(response.json()["pending"]["job"], job.pk)
+        self.assertEqual(admission.get_lanes()[admission.LLM].in_flight, 1)
+        reservation.cancel()
+        self.assertEqual(admission.get_lanes()[admission.LLM].in_flight, 0)
+
+    def test_full_llm_lane_turns_progressive_requests_away(self):
+        admission.reserve(admission.LLM)
+
+        with mock.patch("mainapp.jobs.start") as start:
+            response = self.post()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response["Retry-After"], "7")
+        start.assert_not_called()
+        self.assertFalse(AnalysisJob.objects.exists())
+
+
+# ============== REPO REVIEW ==============
+
+class RepoReviewTests(ProviderTestMixin, TransactionTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        self.marker = os.path.join(self.root, "executed")
+        with open(os.path.join(self.root, "module.py"), "w", encoding="utf-8") as f:
+            f.write(f"open({self.marker!r}, 'w').close()\n")
+
+    def review(self):
+        return repo_review.review_repo(self.root, workers=1, use_llm=True, log=lambda message: None)
+
+    def test_failed_llm_review_never_runs_the_file(self):
+        self.use_provider(llm.FakeProvider(error_rate=1.0))
+
+        counts = self.review()
+
+        self.assertEqual(counts["failed"], 1)
+        self.assertEqual(counts["reviewed"], 0)
+        self.assertFalse(os.path.exists(self.marker))
+        self.assertFalse(RepoFileReview.objects.exists())
+
+    def test_unchanged_files_are_skipped_on_the_next_run(self):
+        self.use_provider(llm.FakeProvider(response='{"corrected_code": "", "improvements": []}'))
+
+        self.assertEqual(self.review()["reviewed"], 1)
+        counts = self.review()
+
+        self.assertEqual(counts["reviewed"], 0)
+        self.assertEqual(counts["unchanged"], 1)
+        self.assertFalse(os.path.exists(self.marker))
+
+
+# ============== BACKFILL ==============
+
+class BackfillTests(TestCase):
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory, ignore_errors=True)
+        self.checkpoint = os.path.join(directory, "checkpoint.json")
+        self.reviews = [CodeReview.objects.create(code=f"x = {n}", review="stale") for n in range(3)]
+
+    def run_backfill(self, **options):
+        return backfill.reanalyze_reviews(
+            chunk_size=1, workers=1, max_rate=0, duty_cycle=1, checkpoint=self.checkpoint,
+            log=lambda message: None, **options,
+        )
+
+    def test_interrupted_pass_resumes_after_the_checkpoint(self):
+        first = self.run_backfill(limit=2)
+
+        self.assertFalse(first["complete"])
+        self.assertEqual(backfill.load_checkpoint(self.checkpoint)["last_id"], self.reviews[1].pk)
+
+        second = self.run_backfill()
+
+        self.assertTrue(second["complete"])
+        self.assertEqual(second["this_run"], 1)
+        self.assertEqual(second["processed"], 3)
+        self.assertEqual(second["updated"], 3)
+        self.assertFalse(os.path.exists(self.checkpoint))
+        self.assertFalse(CodeReview.objects.filter(review="stale").exists())
+
+    def test_restart_ignores_the_checkpoint(self):
+        self.run_backfill(limit=2)
+
+        self.assertEqual(self.run_backfill(restart=True)["this_run"], 3)
+
+
+class ProfileCodeTests(TestCase):
+    def test_profile_reports_calls_and_memory(self):
+        profile = sandbox.profile_code("def fib(n):\n    return n if n < 2 else fib(n - 1) + fib(n - 2)\n\nfib(15)\n")
+
+        functions = {row["function"]: row for row in profile["functions"]}
+        self.assertEqual(functions["fib"]["ncalls"], 1973)
+        self.assertEqual(functions["fib"]["primitive_calls"], 1)
+        self.assertGreaterEqual(profile["total_calls"], 1973)
+        self.assertGreater(profile["peak_memory_bytes"], 0)
+        self.assertTrue(profile["allocations"])
+        self.assertNotIn("error", profile)
+
+    def test_failing_snippet_keeps_its_partial_profile(self):
+        profile = sandbox.profile_code("x = [1, 2]\nraise ValueError('boom')\n")
+
+        self.assertEqual(profile["error"], "ValueError: boom")
+        self.assertEqual(profile["functions"][0]["function"], "<module>")
+
+
+# ============== PROMPTS ==============
+
+@override_settings(PROMPTS={'BUDGETS': {'code': 40}})
+class ClippedReviewTests(ProviderTestMixin, TestCase):
+    code = "".join(f"value_{n} = compute_something({n})\n" for n in range(40))
+
+    def analyze(self):
+        from .views import analyze_code_with_gemini
+
+        local = {"is_valid": True, "error": None, "corrected_code": self.code, "output": ""}
+        return analyze_code_with_gemini(self.code, local=local, fallback=False)
+
+    def test_clipped_code_is_not_rewritten(self):
+        # The model only saw part of the code; its rewrite would lose the rest
+        reply = '{"is_valid": true, "corrected_code": "value_0 = 1\\n# ...", ' \
+                '"improvements": [{"version": 1, "code": "# ...", "explanation": ""}], "best_version": 1}'
+        self.use_provider(ReplyProvider(reply))
+
+        result = self.analyze()
+
+        self.assertTrue(result["clipped"])
+        self.assertEqual(result["corrected_code"], self.code)
+        self.assertEqual(result["improvements"], [])
+
+
+class CommentedReviewTests(ProviderTestMixin, TestCase):
+    code = "# compute totals\ndef total(xs):\n    # add them up\n    return sum(xs)  # builtin\n\n\nprint(total([1, 2, 3]))\n"
+
+    def analyze(self, reply):
+        from .views import analyze_code_with_gemini
+
+        self.use_provider(ReplyProvider(json.dumps(reply)))
+        local = {"is_valid": True, "error": None, "corrected_code": self.code, "output": ""}
+        return analyze_code_with_gemini(self.code, local=local, fallback=False)
+
+    def test_comments_survive_the_review(self):
+        prepared = prompts.prepare_input(self.code, "code")
+        self.assertNotIn("#", prepared.text)
+        improved = prepared.text.replace("def total(xs):", "def total(xs: list) -> int:")
+
+        result = self.analyze({
+            "is_valid": True, "error": None, "corrected_code": prepared.text,
+            "improvements": [{"version": 1, "code": improved, "explanation": "Type hints"}], "best_version": 1,
+        })
+
+        self.assertEqual(result["corrected_code"], self.code)
+        self.assertEqual(
+            result["improvements"][0]["code"],
+            self.code.replace("def total(xs):", "def total(xs: list) -> int:"),
+        )
+
+    def test_error_line_counts_source_lines(self):
+        # Line 4 of the compacted code is `print(...)`, line 7 of the source
+        result = self.analyze({
+            "is_valid": False, "error": {"message": "boom", "line": 4}, "corrected_code": "",
+            "improvements": [], "best_version": 0,
+        })
+
+        self.assertEqual(result["error"]["line"], 7)
+
+
+# ============== REVIEWS ==============
+
+@override_settings(RATELIMIT={'ENABLED': False})
+class ReviewRetrieveTests(TestCase):
+    def test_non_integer_pk_is_not_found(self):
+        response = APIClient().get("/api/v2/aicode/not-a-number/")
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_archived_review_is_served(self):
+        from .models import ArchivedReview
+        from .retention import compress
+
+        ArchivedReview.objects.create(
+            original_id=9001, created_at=timezone.now(), codec="zlib",
+            code_blob=compress("zlib", "x = 1"), review_blob=compress("zlib", "ok"),
+        )
+
+        response = APIClient().get("/api/v2/aicode/9001/")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["code"], "x = 1")
+
+
+# ============== HEDGING ==============
+
+class SlowFirstProvider(llm.LLMProvider):
+    """Answers every call at once except the first, which takes `delay` seconds."""
+
+    def __init__(self, delay):
+        self.delay = delay
+        self.calls = 0
+        self.lock = threading.Lock()
+
+    def generate(self, prompt, model=None, config=None):
+        with self.lock:
+            self.calls += 1
+            first = self.calls == 1
+        if first:
+            time.sleep(self.delay)
+        return "answer"
+
+
+@override_settings(HEDGING={'ENABLED': True, 'MIN_SAMPLES': 1, 'MIN_DELAY': 0.01, 'BUDGET_PCT': 100})
+class HedgingTests(ProviderTestMixin, TransactionTestCase):
+    def setUp(self):
+        hedging.reset()
+        self.addCleanup(hedging.reset)
+        hedging.observe("general", 0.0)
+
+    def test_both_calls_of_a_hedged_pair_are_logged(self):
+        self.use_provider(SlowFirstProvider(delay=0.2))
+
+        self.assertEqual(routing.generate("Hello there", "general"), "answer")
+
+        # The slow first call logs once it returns, after the hedge answered
+        deadline = time.monotonic() + 2
+        while LLMCallLog.objects.count() < 2 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        calls = list(LLMCallLog.objects.order_by("id").values_list("reason", "status"))
+        self.assertEqual(calls[0], ("hedge", "ok"))
+        self.assertEqual(calls[1][1], "discarded")
+        self.assertNotEqual(calls[1][0], "hedge")
+
+
+# ============== PREWARM ==============
+
+@override_settings(PREWARM={'WINDOW_DAYS': 30})
+class PopularQueriesTests(TestCase):
+    def store(self, query, key, hits=0, age_days=0):
+        row = AnalysisResult.objects.create(
+            key=key, input_type="general", query=query, query_hash=results.query_hash(query),
+            response={}, hits=hits,
+        )
+        if age_days:
+            AnalysisResult.objects.filter(pk=row.pk).update(created_at=timezone.now() - timedelta(days=age_days))
+
+    def test_counts_group_by_normalized_query_within_the_window(self):
+        self.store("what is a list", "a", hits=2)
+        self.store("what is a list\r\n", "b")
+        self.store("what is a tuple", "c", hits=10, age_days=60)
+        CodeReview.objects.create(code="x = 1", code_hash=results.query_hash("x = 1"))
+
+        self.assertEqual(prewarm.popular_queries(5), [("what is a list", 4), ("x = 1", 1)])
+        self.assertEqual(prewarm.popular_queries(5, min_count=2), [("what is a list", 4)])
+
+
+# ============== SANDBOX ==============
+
+@override_settings(SANDBOX={'OUTPUT_HEAD': 20, 'OUTPUT_TAIL': 20, 'REPEAT': 1, 'MIN_RUN_TIME': 0.001})
+class SandboxOutputTests(TestCase):
+    code = "for n in range(10000):\n    print(n)\n"
+    full_output = "".join(f"{n}\n" for n in range(10000))
+
+    def test_timed_run_keeps_head_and_tail_of_the_output(self):
+        result = sandbox.time_code(self.code)
+
+        self.assertTrue(result["success"])
+        self.assertTrue(result["truncated"])
+        self.assertTrue(result["output"].startswith(self.full_output[:20]))
+        self.assertTrue(result["output"].endswith(self.full_output[-20:]))
+        self.assertLess(len(result["output"]), 100)
+        self.assertEqual(result["output_hash"], hashlib.sha256(self.full_output.encode()).hexdigest())
+        self.assertEqual(len(result["times"]), 1)
+
+    def test_short_output_is_kept_whole(self):
+        result = sandbox.run("print('hello')")
+
+        self.assertFalse(result["truncated"])
+        self.assertEqual(result["output"], "hello\n")
+
+
+# ============== CHAT ==============
+
+CHAT_ANSWER = {
+    "type": "programming",
+    "answer": "Use a list comprehension.",
+    "example_code": "squares = [n * n for n in range(10)]",
+}
+
+
+class ChatSessionTests(TestCase):
+    def test_unknown_session_id_starts_a_new_session(self):
+        session = chat.get_or_create_session(uuid.uuid4())
+
+        self.assertEqual(session.turn_count, 0)
+        self.assertEqual(chat.get_or_create_session(session.pk), session)
+        self.assertEqual(ChatSession.objects.count(), 1)
+
+    def test_follow_up_turns_get_the_earlier_turns_as_context(self):
+        session = chat.get_or_create_session()
+
+        with mock.patch("mainapp.views.analyze_query", return_value=CHAT_ANSWER) as analyze:
+            chat.respond(session.pk, "how do I square numbers?")
+            chat.respond(session.pk, "now only the even ones")
+
+        first, second = (call.kwargs["context"] for call in analyze.call_args_list)
+        self.assertEqual(first, "")
+        self.assertIn("User: how do I square numbers?", second)
+        self.assertIn("squares = [n * n for n in range(10)]", second)
+        session.refresh_from_db()
+        self.assertEqual(session.turn_count, 4)
+
+    @override_settings(CHAT={'CONTEXT_TOKENS': 60, 'SUMMARY_TOKENS': 30, 'MIN_RECENT_TURNS': 2})
+    def test_long_history_is_folded_into_a_bounded_summary(self):
+        turns = [chat.user_turn(f"question number {n} about sorting lists") for n in range(20)]
+        session = ChatSession(turns=turns)
+
+        chat.compact(session)
+
+        self.assertEqual(session.turns[-2:], turns[-2:])
+        self.assertLess(len(session.turns), len(turns))
+        self.assertIn("- User asked: question number", session.summary)
+        self.assertGreater(session.dropped_turns, 0)
+        self.assertLessEqual(session.token_count, 60)
+
+
+class ChatSocketTests(RateLimitTestMixin, ProviderTestMixin, TransactionTestCase):
+    query = "how do I sort a list?"
+
+    def setUp(self):
+        self.use_provider(llm.FakeProvider())
+        self.use_ratelimit()
+        admission.reset_lanes()
+        self.addCleanup(admission.reset_lanes)
+        patcher = mock.patch("mainapp.views.analyze_query", return_value=CHAT_ANSWER)
+        self.analyze = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def converse(self, messages, path="/ws/chat/"):
+        """Connect, send `messages` and return every frame received."""
+        from aicode.asgi import application
+
+        scope = {"type": "websocket", "path": path, "headers": [], "client": ("10.0.0.1", 50000)}
+        communicator = ApplicationCommunicator(application, scope)
+        await communicator.send_input({"type": "websocket.connect"})
+        self.assertEqual((await communicator.receive_output(1))["type"], "websocket.accept")
+        frames = [json.loads((await communicator.receive_output(1))["text"])]
+        for message in messages:
+            await communicator.send_input({"type": "websocket.receive", "text": json.dumps(message)})
+            frames.append(json.loads((await communicator.receive_output(5))["text"]))
+        await communicator.send_input({"type": "websocket.disconnect", "code": 1000})
+        await communicator.wait(1)
+        return frames
+
+    async def test_session_is_created_and_resumed(self):
+        frames = await self.converse([{"query": self.query}])
+
+        self.assertEqual(frames[0]["type"], "session")
+        self.assertEqual(frames[1], {"type": "analysis", "data": CHAT_ANSWER})
+        resumed = await self.converse([], path=f"/ws/chat/{frames[0]['session']}/")
+        self.assertEqual(resumed[0], {"type": "session", "session": frames[0]["session"], "turns": 2})
+
+    async def test_unknown_path_is_closed(self):
+        from aicode.asgi import application
+
+        communicator = ApplicationCommunicator(application, {"type": "websocket", "path": "/ws/other/"})
+        await communicator.send_input({"type": "websocket.connect"})
+
+        self.assertEqual(await communicator.receive_output(1), {"type": "websocket.close", "code": 4404})
+
+    async def test_throttled_message_gets_an_error_frame(self):
+        self.use_ratelimit(RATES={'llm': '1/min', 'local': '1/min'})
+
+        frames = await self.converse([{"query": self.query}, {"query": self.query}])
+
+        self.assertEqual(frames[1]["type"], "analysis")
+        self.assertEqual(frames[2]["type"], "error")
+        self.assertGreater(frames[2]["retry_after"], 0)
+        self.assertEqual(self.analyze.call_count, 1)
+
+    @override_settings(ADMISSION={'LLM_CONCURRENCY': 1, 'LLM_QUEUE_DEPTH': 0, 'RETRY_AFTER': 7})
+    async def test_full_llm_lane_turns_messages_away(self):
+        admission.reset_lanes()
+        admission.reserve(admission.LLM)
+
+        frames = await self.converse([{"query": self.query}])
+
+        self.assertEqual(frames[1]["type"], "error")
+        self.assertEqual(frames[1]["retry_after"], 7)
+        self.analyze.assert_not_called()
+
+
+# ============== PERFORMANCE HINTS ==============
+
+class PerformanceAnalyzerTests(TestCase):
+    def rules(self, source):
+        return [(finding["line"], finding["rule"]) for finding in analyze_performance(source)]
+
+    def test_unmemoized_fibonacci_is_exponential(self):
+        source = "def fibonacci(n):\n    if n < 2:\n        return n\n    return fibonacci(n - 1) + fibonacci(n - 2)\n"
+
+        findings = analyze_performance(source)
+
+        self.assertEqual([(f["line"], f["rule"], f["complexity"]) for f in findings],
+                         [(1, "unmemoized-recursion", "O(2^n)")])
+
+    def test_memoized_fibonacci_is_fine(self):
+        source = "import functools\n\n@functools.lru_cache(maxsize=None)\n" \
+                 "def fibonacci(n):\n    return n if n < 2 else fibonacci(n - 1) + fibonacci(n - 2)\n"
+
+        self.assertEqual(self.rules(source), [])
+
+    def test_factorial_recursion(self):
+        source = "def factorial(n):\n    return 1 if n <= 1 else n * factorial(n - 1)\n"
+
+        self.assertEqual(self.rules(source), [(1, "recursion")])
+
+    def test_nested_loop_over_the_same_sequence(self):
+        source = "def pairs(xs):\n    out = []\n    for a in xs:\n        for b in range(len(xs)):\n            out.append((a, b))\n    return out\n"
+
+        self.assertEqual(self.rules(source), [(4, "nested-loop-same-sequence")])
+
+    def test_list_membership_in_loop(self):
+        source = "allowed = [1, 2, 3]\nfor x in range(100):\n    if x in allowed:\n        print(x)\n"
+
+        self.assertEqual(self.rules(source), [(3, "list-membership-in-loop")])
+
+    def test_list_front_operations(self):
+        source = "queue = [1, 2]\nqueue.insert(0, 0)\nwhile queue:\n    queue.pop(0)\n"
+
+        findings = analyze_performance(source)
+
+        self.assertEqual([(f["line"], f["rule"], f["complexity"]) for f in findings],
+                         [(2, "list-insert-front", "O(n)"), (4, "list-pop-front", "O(n^2)")])
+
+    def test_string_concatenation_in_loop(self):
+        source = "out = ''\nfor word in ['a', 'b']:\n    out += word\n"
+
+        self.assertEqual(self.rules(source), [(3, "string-concat-in-loop")])
+
+    def test_sorting_in_loop(self):
+        source = "for x in range(3):\n    top = sorted(data)\n    data.sort()\n"
+
+        self.assertEqual(self.rules(source), [(2, "sort-in-loop"), (3, "sort-in-loop")])
+
+    def test_global_lookups_in_hot_loop(self):
+        source = "import math\nSCALE = 2\n\ndef grid(n):\n    for i in range(n):\n" \
+                 "        for j in range(n):\n            print(math.sqrt(i * j) * SCALE)\n"
+
+        hints = {finding["message"].split("'")[1] for finding in analyze_performance(source)
+                 if finding["rule"] == "global-lookup-in-loop"}
+
+        self.assertEqual(hints, {"math.sqrt", "SCALE", "print"})
+
+    def test_clean_code_has_no_findings(self):
+        source = "def total(xs):\n    seen = set(xs)\n    result = 0\n    for x in xs:\n" \
+                 "        if x in seen:\n            result += x\n    return result\n"
+
+        self.assertEqual(analyze_performance(source), [])
+        self.assertEqual(analyze_performance("def broken(:\n"), [])
+
+    def test_typical_snippet_takes_under_a_millisecond(self):
+        source = "\n".join([
+            "import math",
+            "def fibonacci(n):",
+            "    return n if n < 2 else fibonacci(n - 1) + fibonacci(n - 2)",
+            "def process(items, allowed):",
+            "    result = ''",
+            "    for a in items:",
+            "        for b in items:",
+            "            if a in allowed:",
+            "                result += str(math.sqrt(b))",
+            "        items.pop(0)",
+            "    return result",
+        ])
+        timings = []
+        for _ in range(20):
+            started = time.perf_counter()
+            analyze_performance(source)
+            timings.append(time.perf_counter() - started)
+
+        self.assertLess(min(timings), 0.001)
+
+
+# ============== RENDERING ==============
+
+FULL_RESPONSE = {
+    "type": "code",
+    "is_valid": False,
+    "error": {"message": "invalid syntax", "line": 2, "fixed": True, "fix_message": "Added a colon"},
+    "corrected_code": "def greet(name):\n    return f'Héllo {name}'\n",
+    "improved_versions": [
+        {"version": 1, "code": "def greet(name):\n    return 'Héllo ' + name\n", "explanation": "Concatenation"},
+        {"version": 2, "code": "def greet(name: str) -> str:\n    return f'Héllo {name}'\n", "explanation": "Hints"},
+    ],
+    "best_version": 2,
+    "timings": [
+        {"version": 1, "success": True, "matches_original": True, "best_ms": 0.1, "mean_ms": 0.125, "runs": 5},
+        {"version": 2, "success": False, "matches_original": False, "error": "TypeError"},
+    ],
+    "output": "line\u2028separator",
+    "documentation": "# Notes",
+    "performance_hints": [{"line": 2, "rule": "recursion", "message": "Recursive", "complexity": "O(n) stack"}],
+}
+
+
+class FastRenderTests(TestCase):
+    def assertRendersLikeDRF(self, data):
+        expected = JSONRenderer().render(AnalyzeOutputSerializer(data).data)
+        for use_orjson in (True, False):
+            with self.subTest(orjson=use_orjson), override_settings(FAST_RENDER={'ORJSON': use_orjson}):
+                self.assertEqual(renderers.render_analysis(data), expected)
+
+    def test_full_response(self):
+        self.assertRendersLikeDRF(FULL_RESPONSE)
+
+    def test_compact_response(self):
+        compact = diffs.compact_response(FULL_RESPONSE)
+        self.assertIn("code_patches", compact)
+
+        self.assertRendersLikeDRF(compact)
+
+    def test_greeting_response(self):
+        from .views import analyze_query
+
+        greeting = analyze_query("hello")
+        self.assertEqual(greeting["type"], "greeting")
+
+        self.assertRendersLikeDRF(greeting)
+
+
+# ============== STRUCTURED OUTPUT ==============
+
+class SchemaProvider(llm.LLMProvider):
+    """Sends `structured_reply` to prompts with a response schema and `reply` to the rest."""
+
+    def __init__(self, structured_reply, reply):
+        self.structured_reply = structured_reply
+        self.reply = reply
+
+    def generate(self, prompt, model=None, config=None):
+        return self.structured_reply if (config or {}).get("response_schema") else self.reply
+
+
+class StructuredOutputTests(ProviderTestMixin, TestCase):
+    code = "def add(a, b):\n    return a - b\n\nprint(add(1, 2))\n"
+
+    def test_validate_checks_types_nulls_and_limits(self):
+        schema = structured.SCHEMAS["code"]
+        valid = {"is_valid": True, "error": None, "fix": [], "improvements": [], "best_version": 0}
+        structured.validate(valid, schema)
+
+        for invalid in (
+            {**valid, "best_version": True},  # a bool is not an integer
+            {**valid, "fix": [{"from": 1, "to": 1}]},
+            {**valid, "improvements": [{"version": n, "explanation": "", "edits": []} for n in range(4)]},
+            {key: value for key, value in valid.items() if key != "fix"},
+            {**valid, "is_valid": None},
+        ):
+            with self.subTest(invalid=invalid), self.assertRaises(structured.SchemaError):
+                structured.validate(invalid, schema)
+
+    def test_apply_hunks_replaces_inserts_and_deletes(self):
+        fixed = structured.apply_hunks(self.code, [{"from": 2, "to": 2, "code": "    return a + b"}])
+        self.assertEqual(fixed, self.code.replace("a - b", "a + b"))
+
+        inserted = structured.apply_hunks(self.code, [{"from": 1, "to": 0, "code": "import math"}])
+        self.assertEqual(inserted, "import math\n" + self.code)
+
+        deleted = structured.apply_hunks(self.code, [{"from": 3, "to": 4, "code": ""}])
+        self.assertEqual(deleted, "def add(a, b):\n    return a - b\n")
+
+    def test_apply_hunks_rejects_overlapping_and_out_of_range_hunks(self):
+        for hunks in (
+            [{"from": 1, "to": 2, "code": "x"}, {"from": 2, "to": 3, "code": "y"}],
+            [{"from": 4, "to": 9, "code": "x"}],
+            [{"from": 3, "to": 1, "code": "x"}],
+        ):
+            with self.subTest(hunks=hunks), self.assertRaises(structured.SchemaError):
+                structured.apply_hunks(self.code, hunks)
+
+    def test_expand_applies_improvements_to_the_fixed_code(self):
+        reply = {
+            "is_valid": False,
+            "error": {"message": "wrong operator", "line": 2},
+            "fix": [{"from": 2, "to": 2, "code": "    return a + b"}],
+            "improvements": [{"version": 1, "explanation": "Hints", "edits": [
+                {"from": 1, "to": 1, "code": "def add(a: int, b: int) -> int:"},
+            ]}],
+            "best_version": 1,
+        }
+
+        result = structured.expand("code", reply, self.code)
+
+        self.assertEqual(result["corrected_code"], self.code.replace("a - b", "a + b"))
+        self.assertEqual(
+            result["improvements"][0]["code"],
+            result["corrected_code"].replace("def add(a, b):", "def add(a: int, b: int) -> int:"),
+        )
+        self.assertEqual(structured.to_hunks(self.code, result["corrected_code"]),
+                         [{"from": 2, "to": 2, "code": "    return a + b\n"}])
+
+    @override_settings(STRUCTURED_OUTPUT={'ENABLED': True})
+    def test_invalid_reply_falls_back_to_the_regular_prompt(self):
+        from .views import analyze_code_with_gemini
+
+        regular = {"is_valid": True, "error": None, "corrected_code": self.code.replace("a - b", "a + b"),
+                   "improvements": [], "best_version": 0}
+        overlapping = {"is_valid": True, "error": None, "best_version": 0, "improvements": [], "fix": [
+            {"from": 1, "to": 2, "code": "x"}, {"from": 2, "to": 2, "code": "y"},
+        ]}
+        self.use_provider(SchemaProvider(json.dumps(overlapping), json.dumps(regular)))
+        prepared = prompts.prepare_input(self.code, "code")
+
+        self.assertIsNone(structured.generate("code", prepared))
+        local = {"is_valid": True, "error": None, "corrected_code": self.code, "output": ""}
+        result = analyze_code_with_gemini(self.code, local=local, fallback=False)
+        self.assertEqual(result["corrected_code"], regular["corrected_code"])
+
+
+# ============== COMPACT RESPONSES ==============
+
+class CompactResponseTests(TestCase):
+    def assertRoundTrips(self, data):
+        compact = diffs.compact_response(data)
+        self.assertEqual(diffs.expand_response(json.loads(json.dumps(compact))), data)
+        return compact
+
+    def test_versions_with_code_changes(self):
+        base = "".join(f"line_{n} = {n}\n" for n in range(30))
+        data = {
+            "type": "code",
+            "corrected_code": base,
+            "improved_versions": [
+                {"version": 1, "code": base, "explanation": "Unchanged"},
+                {"version": 2, "code": base.replace("line_3 = 3", "line_3 = 33"), "explanation": "Edit"},
+                {"version": 3, "code": base.replace("line_3 = 3", "line_3 = 33"), "explanation": "Same as 2"},
+                {"version": 4, "code": "print('rewritten')", "explanation": "Rewrite"},
+            ],
+        }
+
+        compact = self.assertRoundTrips(data)
+
+        self.assertEqual(compact["code_patches"], {
+            "corrected_code": {"same": True},
+            "improved_versions.0": {"same": True},
+            "improved_versions.1": {"edits": [[3, 4, ["line_3 = 33\n"]]]},
+            "improved_versions.2": {"ref": "improved_versions.1"},
+            "improved_versions.3": {"text": "print('rewritten')"},
+        })
+        self.assertEqual(compact["corrected_code"], "")
+
+    def test_versions_without_code_changes(self):
+        code = "print('hello')\n"
+        compact = self.assertRoundTrips({
+            "type": "code",
+            "corrected_code": code,
+            "improved_versions": [{"version": 1, "code": code, "explanation": "Already fine"}],
+        })
+
+        self.assertEqual(compact["code_base"], code)
+
+    def test_example_code_and_no_code(self):
+        self.assertRoundTrips({"type": "programming", "answer": "Use sorted().", "example_code": "sorted(xs)"})
+        greeting = {"type": "greeting", "answer": "Hi!", "corrected_code": "", "improved_versions": []}
+        self.assertIs(diffs.compact_response(greeting), greeting)
+
+
+# ============== BATCHING ==============
+
+class EchoBatchProvider(llm.LLMProvider):
+    """Answers each question of a batched prompt with the question upper-cased."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def generate(self, prompt, model=None, config=None):
+        self.calls += 1
+        questions = re.findall(r"### Question (\d+)\n(.*)", prompt)
+        return json.dumps({"answers": [{"id": int(i), "response": q.upper()} for i, q in reversed(questions)]})
+
+
+class SplitAnswersTests(TestCase):
+    def test_answers_are_placed_by_id(self):
+        text = 'Sure! {"answers": [{"id": 1, "response": "b"}, {"id": 0, "response": "a"}]}'
+
+        self.assertEqual([a["response"] for a in batching.split_answers(text, 2)], ["a", "b"])
+
+    def test_missing_malformed_and_duplicate_answers_are_none(self):
+        text = json.dumps({"answers": [
+            {"id": 0, "response": "first"},
+            {"id": 0, "response": "duplicate"},
+            {"id": 1, "response": 42},
+            {"id": 7, "response": "out of range"},
+            "not an object",
+        ]})
+
+        answers = batching.split_answers(text, 3)
+
+        self.assertEqual(answers[0]["response"], "first")
+        self.assertEqual(answers[1:], [None, None])
+
+    def test_unparseable_reply_gives_no_answers(self):
+        for text in ("no json here", '{"answers": "nope"}', '{"answers": [}'):
+            with self.subTest(text=text):
+                self.assertEqual(batching.split_answers(text, 2), [None, None])
+
+
+@override_settings(
+    BATCHING={'ENABLED': True, 'WINDOW_MS': 5000, 'MAX_SIZE': 3},
+    ADMISSION={'ENABLED': False},
+)
+class BatcherTests(ProviderTestMixin, TransactionTestCase):
+    def ask_together(self, batcher, questions):
+        answers = [None] * len(questions)
+
+        def ask(index):
+            answers[index] = batcher.ask(questions[index])
+
+        threads = [threading.Thread(target=ask, args=(i,)) for i in range(len(questions))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join(5)
+        return answers
+
+    def test_followers_receive_their_own_answers(self):
+        provider = EchoBatchProvider()
+        self.use_provider(provider)
+
+        started = time.perf_counter()
+        answers = self.ask_together(batching.Batcher("general"), ["one", "two", "three"])
+
+        self.assertEqual(sorted(answer["response"] for answer in answers), ["ONE", "THREE", "TWO"])
+        self.assertEqual(provider.calls, 1)
+        self.assertLess(time.perf_counter() - started, 2)  # a full batch does not wait out the window
+
+    def test_malformed_batch_reply_sends_everyone_back_to_their_own_call(self):
+        self.use_provider(ReplyProvider("I cannot answer in JSON."))
+
+        self.assertEqual(self.ask_together(batching.Batcher("general"), ["one", "two", "three"]), [None] * 3)
+
+    @override_settings(BATCHING={'ENABLED': True, 'WINDOW_MS': 10, 'MAX_SIZE': 3})
+    def test_batch_of_one_is_not_sent(self):
+        provider = EchoBatchProvider()
+        self.use_provider(provider)
+
+        self.assertIsNone(batching.Batcher("general").ask("alone"))
+        self.assertEqual(provider.calls, 0)
+
+    @override_settings(ADMISSION={'ENABLED': True, 'LLM_CONCURRENCY': 2})
+    def test_batches_are_capped_at_the_llm_lane_concurrency(self):
+        provider = EchoBatchProvider()
+        self.use_provider(provider)
+
+        self.assertEqual(batching.max_size(), 2)
+        started = time.perf_counter()
+        answers = self.ask_together(batching.Batcher("general"), ["one", "two"])
+
+        self.assertEqual(sorted(answer["response"] for answer in answers), ["ONE", "TWO"])
+        self.assertLess(time.perf_counter() - started, 2)
+
+
+# ============== ROUTING ==============
+
+class TimeoutOnModelProvider(llm.LLMProvider):
+    """Times out on `model` and answers "answer" on every other model."""
+
+    def __init__(self, model):
+        self.model = model
+
+    def generate(self, prompt, model=None, config=None):
+        if model == self.model:
+            raise llm.LLMTimeout("too slow")
+        return "answer"
+
+
+class RoutingTests(ProviderTestMixin, TestCase):
+    def setUp(self):
+        routing.reset_latencies()
+        self.addCleanup(routing.reset_latencies)
+
+    def test_policy_picks_the_tier_by_kind(self):
+        self.assertEqual(routing.choose("general", 10), ("small", "policy"))
+        self.assertEqual(routing.choose("code", 10), ("standard", "policy"))
+        self.assertEqual(routing.choose("unknown kind", 10), ("standard", "policy"))
+
+    def test_large_input_moves_up_a_tier(self):
+        self.assertEqual(routing.choose("general", 5000), ("large", "large_input"))
+
+    def test_slow_tier_hands_over_to_its_fallback(self):
+        for _ in range(5):
+            routing.observe("small", 14.0)  # TIMEOUT is 15s
+
+        self.assertEqual(routing.choose("general", 10), ("standard", "slow:small"))
+
+        for _ in range(5):
+            routing.observe("standard", 29.0)
+        self.assertEqual(routing.choose("general", 10), ("small", "policy"))  # both slow: keep the policy
+
+    def test_timeout_is_retried_on_the_fallback_tier(self):
+        small, standard = (routing.get_tier(name)["MODEL"] for name in ("small", "standard"))
+        self.use_provider(TimeoutOnModelProvider(small))
+
+        self.assertEqual(routing.generate("What is a tuple?", "general"), "answer")
+
+        calls = list(LLMCallLog.objects.order_by("id").values_list("tier", "model", "reason", "status"))
+        self.assertEqual(calls, [
+            ("small", small, "policy", "timeout"),
+            ("standard", standard, "timeout:small", "ok"),
+        ])
+
+    def test_timeout_without_fallback_is_raised(self):
+        tiers = {**routing.get_setting('TIERS')}
+        tiers['small'] = {**tiers['small'], 'FALLBACK': None}
+        self.use_provider(TimeoutOnModelProvider(tiers['small']['MODEL']))
+
+        with override_settings(ROUTING={'TIERS': tiers}), self.assertRaises(llm.LLMTimeout):
+            routing.generate("What is a tuple?", "general")
+
+    def test_failed_log_write_is_logged_not_raised(self):
+        self.use_provider(ReplyProvider("answer"))
+
+        with mock.patch("mainapp.models.LLMCallLog.objects.create", side_effect=RuntimeError("db down")), \
+                self.assertLogs("mainapp.routing", "WARNING"):
+            self.assertEqual(routing.generate("What is a tuple?", "general"), "answer")
+
+
+# ============== PROVIDERS ==============
+
+class FakeProviderTests(TestCase):
+    prompts = [f"question {n}" for n in range(20)]
+
+    def outcomes(self, provider, prompts):
+        results = {}
+        for prompt in prompts:
+            try:
+                results[prompt] = provider.generate(prompt)
+            except llm.LLMError:
+                results[prompt] = "error"
+        return results
+
+    def test_outcomes_depend_on_seed_and_prompt_not_call_order(self):
+        first = self.outcomes(llm.FakeProvider(error_rate=0.5, seed=7), self.prompts)
+        again = self.outcomes(llm.FakeProvider(error_rate=0.5, seed=7), reversed(self.prompts))
+        other_seed = self.outcomes(llm.FakeProvider(error_rate=0.5, seed=8), self.prompts)
+
+        self.assertEqual(first, again)
+        self.assertNotEqual(first, other_seed)
+        self.assertIn("error", first.values())
+        self.assertNotEqual(set(first.values()), {"error"})
+
+    def test_latency_is_seeded_and_per_model(self):
+        provider = llm.FakeProvider(latency_ms=100, latency_sigma=0.5, seed=1, model_latency_ms={"slow": 1000})
+
+        def latency(prompt, model=None):
+            return provider.sample_latency(provider._rng(prompt, model), model)
+
+        self.assertEqual(latency("a"), latency("a"))
+        self.assertNotEqual(latency("a"), latency("b"))
+        self.assertGreater(latency("a", "slow"), 0.2)
+
+    def test_call_slower_than_its_timeout_times_out(self):
+        provider = llm.FakeProvider(latency_ms=5000)
+
+        started = time.perf_counter()
+        with self.assertRaises(llm.LLMTimeout):
+            provider.generate("question", config={"timeout": 0.01})
+        self.assertLess(time.perf_counter() - started, 1)
+
+
+class RecordReplayProviderTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def test_recorded_answers_replay_without_the_inner_provider(self):
+        recorder = llm.RecordReplayProvider(llm.FakeProvider(response="recorded"), self.directory, mode="record")
+        text = recorder.generate("What is a list?", model="m")
+
+        player = llm.RecordReplayProvider(None, self.directory, mode="replay", simulate_latency=False)
+
+        self.assertTrue(player.is_available())
+        self.assertEqual(player.generate("What is a list?", model="m"), text)
+        self.assertIn("recorded", text)
+        with self.assertRaises(llm.LLMError):
+            player.generate("What is a list?", model="other model")
+
+    def test_auto_mode_records_once(self):
+        inner = mock.Mock(wraps=llm.FakeProvider())
+        provider = llm.RecordReplayProvider(inner, self.directory, mode="auto", simulate_latency=False)
+
+        first = provider.generate("What is a dict?")
+        second = provider.generate("What is a dict?")
+
+        self.assertEqual(first, second)
+        self.assertEqual(inner.generate.call_count, 1)
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+
+
+# ============== VERIFICATION ==============
+
+@override_settings(SANDBOX={'REPEAT': 2, 'MIN_RUN_TIME': 0.001})
+class VerifyVersionsTests(TestCase):
+    original = "total = 0\nfor i in range(200000):\n    total += i\nprint(total)\n"
+
+    def test_fastest_version_with_the_same_output_wins(self):
+        improvements = [
+            {"version": 1, "code": "print(sum(range(200000)))\n"},
+            {"version": 2, "code": "print(19999900000)\n"},
+            {"version": 3, "code": "print(19999900001)\n"},  # fastest, but wrong
+            {"version": 4, "code": "raise ValueError('broken')\n"},
+        ]
+
+        best_version, timings = verification.verify_versions(self.original, improvements)
+
+        by_version = {timing["version"]: timing for timing in timings}
+        self.assertEqual(best_version, 2)
+        self.assertTrue(by_version[0]["matches_original"])
+        self.assertTrue(by_version[1]["matches_original"])
+        self.assertFalse(by_version[3]["matches_original"])
+        self.assertTrue(by_version[3]["success"])
+        self.assertFalse(by_version[4]["success"])
+        self.assertIn("ValueError", by_version[4]["error"])
+
+    def test_nothing_verified_when_every_output_differs(self):
+        best_version, timings = verification.verify_versions(self.original, [{"version": 1, "code": "print(0)\n"}])
+
+        self.assertIsNone(best_version)
+        self.assertEqual([timing["version"] for timing in timings], [0, 1])
+
+
+# ============== WARM-UP ==============
+
+class WarmUpTests(TestCase):
+    def test_every_step_runs(self):
+        from . import views, warmup
+
+        views.get_knowledge_base.cache_clear()
+        with mock.patch("mainapp.sandbox.run", wraps=sandbox.run) as run:
+            timings = warmup.warm_up(sandbox_pool=True, llm_sdk=False)
+
+        self.assertEqual(set(timings), {"classifier", "knowledge_base", "perf_analyzer", "serializers", "sandbox_pool"})
+        self.assertEqual(views.get_knowledge_base.cache_info().currsize, 1)
+        self.assertEqual(run.call_count, sandbox.get_setting('MAX_WORKERS'))
+
+    def test_app_ready_warms_up_only_when_asked(self):
+        from django.apps import apps
+
+        config = apps.get_app_config("mainapp")
+        with mock.patch("mainapp.warmup.warm_up") as warm_up:
+            config.ready()
+            warm_up.assert_not_called()
+            with override_settings(WARM_UP={'ON_READY': True}):
+                config.ready()
+            warm_up.assert_called_once_with()
+
+
+# ============== PROFILING ==============
+
+class ProfilingTests(TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory, ignore_errors=True)
+
+    def view(self, request):
+        from django.http import HttpResponse
+
+        profiling.tag(input_type="code")
+        sum(range(1000))
+        return HttpResponse("ok")
+
+    def test_sampled_requests_are_profiled_and_reported(self):
+        from django.core.management import call_command
+        from django.test import RequestFactory
+
+        middleware = profiling.ProfilingMiddleware(self.view)
+        factory = RequestFactory()
+        draws = [0.1, 0.5, 0.2, 0.9, 0.0]  # RATE 0.25 samples the 1st, 3rd and 5th
+        paths = ["/api/v2/analyze/", "/api/v2/analyze/", "/api/v2/aicode/", "/api/v2/aicode/", "/admin/"]
+        with override_settings(PROFILING={'ENABLED': True, 'RATE': 0.25, 'DIRECTORY': self.directory}), \
+                mock.patch("mainapp.profiling.random.random", side_effect=draws):
+            for path in paths:
+                self.assertEqual(middleware(factory.get(path)).status_code, 200)
+
+        profiles = list(profiling.load_profiles(self.directory))
+        self.assertEqual(sorted(meta["path"] for _, meta in profiles), ["/api/v2/aicode/", "/api/v2/analyze/"])
+        self.assertEqual({meta["tags"]["input_type"] for _, meta in profiles}, {"code"})
+
+        out = io.StringIO()
+        call_command("profile_report", directory=self.directory, json=True, limit=50, stdout=out)
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual(rows[0]["requests"], 2)
+        self.assertTrue(any("(view)" in row.get("function", "") for row in rows[1:]))
+
+    def test_report_without_profiles(self):
+        from django.core.management import call_command
+
+        out = io.StringIO()
+        call_command("profile_report", directory=self.directory, stdout=out)
+
+        self.assertEqual(out.getvalue().strip(), "No matching profiles.")
+
+
+# ============== RETENTION ==============
+
+class ArchiveReviewsTests(TestCase):
+    def make_review(self, code, review, days_ago):
+        row = CodeReview.objects.create(code=code, review=review)
+        CodeReview.objects.filter(pk=row.pk).update(created_at=timezone.now() - timedelta(days=days_ago))
+        return CodeReview.objects.get(pk=row.pk)
+
+    def test_old_reviews_move_to_the_archive_intact(self):
+        old = self.make_review("x = 1\n" * 50, "Looks fine. ✅", days_ago=100)
+        broken = self.make_review("def f(:\n", "❌ Syntax error", days_ago=100)
+        recent = self.make_review("y = 2\n", "ok", days_ago=1)
+
+        report = retention.archive_reviews(older_than_days=90, batch_size=1, log=lambda message: None)
+
+        self.assertEqual(report["archived"], 2)
+        self.assertGreater(report["raw_bytes"], report["stored_bytes"])
+        self.assertEqual(list(CodeReview.objects.values_list("pk", flat=True)), [recent.pk])
+        for row in (old, broken):
+            archived = ArchivedReview.objects.get(original_id=row.pk)
+            self.assertEqual(archived.code, row.code)
+            self.assertEqual(archived.review, row.review)
+            self.assertEqual(archived.created_at, row.created_at)
+
+        stats = ReviewDailyStats.objects.get(day=timezone.localdate(old.created_at))
+        self.assertEqual(stats.reviews, 2)
+        self.assertEqual(stats.syntax_errors, 1)
+        self.assertEqual(stats.code_bytes, len(old.code) + len(broken.code))
+
+    @override_settings(RETENTION={'CODEC': 'zlib'})
+    def test_archived_review_is_still_served(self):
+        old = self.make_review("print('old')", None, days_ago=100)
+        retention.archive_reviews(older_than_days=90, log=lambda message: None)
+
+        self.assertEqual(ArchivedReview.objects.get(original_id=old.pk).codec, "zlib")
+        response = APIClient().get(f"/api/v2/aicode/{old.pk}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["code"], "print('old')")
+
+    def test_dry_run_moves_nothing(self):
+        self.make_review("x = 1", "ok", days_ago=100)
+
+        report = retention.archive_reviews(older_than_days=90, dry_run=True, log=lambda message: None)
+
+        self.assertEqual(report["archived"], 1)
+        self.assertEqual(CodeReview.objects.count(), 1)
+        self.assertFalse(ArchivedReview.objects.exists())
+        self.assertFalse(ReviewDailyStats.objects.exists())
@@ -0,0 +1,297 @@
+"""
+Per-client rate limits for the API (DRF throttling).
+
+Every client has two buckets: "llm" for requests that will call the model
+and "local" for everything answered locally (greetings, code reviews,
+reads). The view picks the bucket with `rate_bucket(request)`; analyze and
+job submissions are classified like admission control does. A client is
+identified by its X-API-Key header when that key is listed in CLIENT_RATES
+(which also sets its own rates), and by IP address otherwise, so an
+unknown key cannot buy a fresh bucket. The IP address is the socket's
+unless REST_FRAMEWORK['NUM_PROXIES'] says how many trusted proxies add to
+X-Forwarded-For, so a client cannot forge that header to reset its buckets.
+
+Buckets use GCRA: one timestamp per client and bucket (the theoretical
+arrival time) is kept, and a rate of "30/min" allows bursts of up to 30
+and refills one request every two seconds. Each check reads and updates
+the timestamp atomically. With STORE "shared" (the default) timestamps
+live in a memory-mapped file that every worker process on the host
+shares, so a check costs a few microseconds. With STORE "cache" they live
+in the CACHE alias, e.g. Redis when several hosts serve the API, and a
+per-bucket lock taken with cache.add makes the read and write one step.
+
+Responses carry RateLimit-Limit, RateLimit-Remaining, RateLimit-Reset and
+RateLimit-Policy headers, and a throttled request gets 429 with Retry-After.
+WebSocket chat messages are checked with `check_client` against the same
+buckets (see mainapp/consumers.py).
+"""
+import functools
+import hashlib
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.throttling import BaseThrottle
+
+
+RATELIMIT_DEFAULTS = {
+    'ENABLED': True,
+    'RATES': {'llm': '30/min', 'local': '300/min'},
+    'CLIENT_RATES': {},            # API key -> {'llm': ..., 'local': ...}
+    'API_KEY_HEADER': 'X-API-Key',
+    'STORE': 'shared',             # 'shared' (this host's processes) or 'cache'
+    'SHARED_FILE': os.path.join(settings.BASE_DIR, '.ratelimit'),
+    'SHARED_SLOTS': 65536,         # buckets the shared file holds (16 bytes each)
+    'CACHE': 'default',
+}
+
+LLM = "llm"
+LOCAL = "local"
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def get_setting(name):
+    return getattr(settings, 'RATELIMIT', {}).get(name, RATELIMIT_DEFAULTS[name])
+
+
+@functools.lru_cache(maxsize=None)
+def parse_rate(rate):
+    """Parse "30/min" into (30, 60)."""
+    count, _, period = rate.partition('/')
+    return int(count), PERIODS[period.strip()[0].lower()]
+
+
+class Limit:
+    """Outcome of one bucket check."""
+
+    __slots__ = ("allowed", "limit", "period", "remaining", "reset", "retry_after")
+
+    def __init__(self, allowed, limit, period, remaining, reset, retry_after):
+        self.allowed = allowed
+        self.limit = limit
+        self.period = period
+        self.remaining = remaining
+        self.reset = reset
+        self.retry_after = retry_after
+
+
+# ============== STORES ==============
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def _lock_file(fd):
+    if fcntl is not None:
+        fcntl.lockf(fd, fcntl.LOCK_EX)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_LOCK, 1)
+
+
+def _unlock_file(fd):
+    if fcntl is not None:
+        fcntl.lockf(fd, fcntl.LOCK_UN)
+    else:
+        os.lseek(fd, 0, os.SEEK_SET)
+        msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+
+
+class SharedStore:
+    """
+    Bucket timestamps in a memory-mapped file shared by the host's processes.
+
+    The file is a table of `slots` (key hash, TAT) pairs searched by linear
+    probing. A slot whose TAT has passed is free again, since that bucket
+    is full anyway; when all probed slots are in use the one closest to
+    expiring is taken over. An update holds a thread lock and an exclusive
+    lock on the file.
+    """
+
+    SLOT = struct.Struct("<Qd")
+    PROBES = 16
+
+    def __init__(self, path, slots):
+        self.path = path
+        self.slots = slots
+        self.lock = threading.Lock()
+        self.pid = None
+
+    def _open(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self.fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o600)
+        size = self.slots * self.SLOT.size
+        if os.fstat(self.fd).st_size < size:
+            os.ftruncate(self.fd, size)
+        self.map = mmap.mmap(self.fd, size)
+        self.pid = os.getpid()
+
+    def update(self, key, fn, now):
+        """Call fn(TAT or None) atomically; it returns (new TAT or None to leave it, result)."""
+        digest = int.from_bytes(hashlib.blake2b(key.encode(), digest_size=8).digest(), "little") or 1
+        first = digest % self.slots
+        size = self.SLOT.size
+        with self.lock:
+            if self.pid != os.getpid():
+                self._open()
+            _lock_file(self.fd)
+            try:
+                found = free = oldest = None
+                for probe in range(min(self.PROBES, self.slots)):
+                    index = (first + probe) % self.slots
+                    stored, tat = self.SLOT.unpack_from(self.map, index * size)
+                    if stored == digest:
+                        found = index
+                        break
+                    if free is None and (not stored or tat <= now):
+                        free = index
+                    if oldest is None or tat < oldest[1]:
+                        oldest = (index, tat)
+                if found is not None:
+                    new_tat, result = fn(tat)
+                    index = found
+                else:
+                    new_tat, result = fn(None)
+                    index = free if free is not None else oldest[0]
+                if new_tat is not None:
+                    self.SLOT.pack_into(self.map, index * size, digest, new_tat)
+                return result
+            finally:
+                _unlock_file(self.fd)
+
+
+class CacheStore:
+    """
+    Bucket timestamps in a Django cache. A per-bucket lock taken with
+    cache.add (atomic on Redis, Memcached and the database cache) makes the
+    read and write one step; if the lock cannot be had within LOCK_WAIT the
+    check goes ahead without it rather than stall the request.
+    """
+
+    LOCK_TIMEOUT = 1    # seconds; frees the lock of a crashed process
+    LOCK_WAIT = 0.05    # seconds
+
+    def __init__(self, alias):
+        self.alias = alias
+
+    def update(self, key, fn, now):
+        cache = caches[self.alias]
+        lock_key = f"{key}:lock"
+        deadline = time.monotonic() + self.LOCK_WAIT
+        locked = cache.add(lock_key, 1, timeout=self.LOCK_TIMEOUT)
+        while not locked and time.monotonic() < deadline:
+            time.sleep(0.001)
+            locked = cache.add(lock_key, 1, timeout=self.LOCK_TIMEOUT)
+        try:
+            new_tat, result = fn(cache.get(key))
+            if new_tat is not None:
+                cache.set(key, new_tat, timeout=math.ceil(new_tat - now) + 1)
+            return result
+        finally:
+            if locked:
+                cache.delete(lock_key)
+
+
+_stores = {}
+
+
+def _reset_stores_after_fork():
+    # A lock held by another thread at fork() time would never be released
+    _stores.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_stores_after_fork)
+
+
+def get_store():
+    if get_setting('STORE') == 'cache':
+        return CacheStore(get_setting('CACHE'))
+    path, slots = get_setting('SHARED_FILE'), get_setting('SHARED_SLOTS')
+    store = _stores.get((path, slots))
+    if store is None:
+        store = _stores.setdefault((path, slots), SharedStore(path, slots))
+    return store
+
+
+# ============== GCRA ==============
+
+def check(key, rate, now=None):
+    """Take one request from the bucket `key`; returns a Limit."""
+    count, period = parse_rate(rate)
+    interval = period / count
+    now = time.time() if now is None else now
+
+    def take(stored):
+        tat = max(stored or now, now)
+        new_tat = tat + interval
+        # The bucket holds `count` requests: a TAT up to one period ahead is allowed
+        over = new_tat - now - period
+        if over > 0:
+            return None, Limit(False, count, period, 0, math.ceil(tat - now), math.ceil(over))
+        remaining = int((period - (new_tat - now)) / interval)
+        return new_tat, Limit(True, count, period, remaining, math.ceil(new_tat - now), 0)
+
+    return get_store().update(key, take, now)
+
+
+def check_client(bucket, api_key, ident):
+    """
+    Take one request from a client's `bucket`: the client is its API key
+    when listed in CLIENT_RATES, else `ident` (its IP address). Returns a
+    Limit, or None when rate limiting is disabled.
+    """
+    if not get_setting('ENABLED'):
+        return None
+    client_rates = get_setting('CLIENT_RATES').get(api_key) if api_key else None
+    if client_rates is not None:
+        client = "key:" + hashlib.sha256(api_key.encode()).hexdigest()[:16]
+    else:
+        client, client_rates = "ip:" + ident, {}
+    rate = client_rates.get(bucket) or get_setting('RATES')[bucket]
+    return check(f"ratelimit:{bucket}:{client}", rate)
+
+
+class ClientRateThrottle(BaseThrottle):
+    """Throttle by client and bucket; see the module docstring."""
+
+    def allow_request(self, request, view):
+        bucket = view.rate_bucket(request) if hasattr(view, 'rate_bucket') else LOCAL
+        api_key = request.headers.get(get_setting('API_KEY_HEADER'), '')
+        limit = check_client(bucket, api_key, self.get_ident(request))
+        if limit is None:
+            return True
+        request.rate_limit = limit
+        self.retry_after = limit.retry_after
+        return limit.allowed
+
+    def wait(self):
+        return self.retry_after
+
+
+class RateLimitedMixin:
+    """Throttle a view set with ClientRateThrottle and send RateLimit headers."""
+
+    throttle_classes = [ClientRateThrottle]
+
+    def rate_bucket(self, request):
+        return LOCAL
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        limit = getattr(request, 'rate_limit', None)
+        if limit is not None:
+            response['RateLimit-Limit'] = str(limit.limit)
+            response['RateLimit-Remaining'] = str(limit.remaining)
+            response['RateLimit-Reset'] = str(limit.reset)
+            response['RateLimit-Policy'] = f"{limit.limit};w={limit.period}"
+        return response
@@ -1,8 +1,10 @@
 from rest_framework.routers import DefaultRouter
-from .views import CodeReviewViewSet, AnalyzeViewSet
+from .views import CodeReviewViewSet, AnalyzeViewSet, JobViewSet, MetricsViewSet
 
 router = DefaultRouter()
 router.register(r'aicode', CodeReviewViewSet)
 router.register(r'analyze', AnalyzeViewSet, basename='analyze')
+router.register(r'jobs', JobViewSet, basename='job')
+router.register(r'metrics', MetricsViewSet, basename='metrics')
 
 urlpatterns = router.urls
@@ -0,0 +1,51 @@
+from . import sandbox
+
+
+def verify_versions(original, improvements):
+    """
+    Check improved versions against the original by running them.
+
+    The original and every improved version are timed in the sandbox in
+    parallel. A version counts as verified when it runs successfully and
+    prints exactly what the original prints (the sandbox compares output by
+    hash, so long outputs are never held in full). Returns `(best_version,
+    timings)` where `best_version` is the fastest verified version (or None
+    if nothing could be verified) and `timings` has one entry per version,
+    with the original reported as version 0.
+    """
+    candidates = [(0, original)] + [
+        (item.get("version"), item.get("code", "")) for item in improvements
+    ]
+
+    # Versions are often identical (e.g. the local fallback), so time each
+    # distinct source only once.
+    executor = sandbox.get_executor()
+    futures = {}
+    for _, code in candidates:
+        if code not in futures:
+            futures[code] = executor.submit(sandbox.time_code, code)
+    results = {code: future.result() for code, future in futures.items()}
+
+    baseline = results[original]
+    timings = []
+    for version, code in candidates:
+        result = results[code]
+        entry = {
+            "version": version,
+            "success": bool(result.get("success")),
+            "matches_original": bool(
+                result.get("success") and baseline.get("success")
+                and result.get("output_hash") == baseline.get("output_hash")
+            ),
+        }
+        if result.get("times"):
+            entry["best_ms"] = round(min(result["times"]) * 1000, 4)
+            entry["mean_ms"] = round(sum(result["times"]) / len(result["times"]) * 1000, 4)
+            entry["runs"] = result["number"] * len(result["times"])
+        if result.get("error"):
+            entry["error"] = result["error"]
+        timings.append(entry)
+
+    verified = [t for t in timings if t["version"] and t["matches_original"] and "best_ms" in t]
+    best_version = min(verified, key=lambda t: t["best_ms"])["version"] if verified else None
+    return best_version, timings
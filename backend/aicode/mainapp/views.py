@@ -1,122 +1,157 @@
 import ast
-import os
+import functools
 import re
 import json
-import sys
-import io
-import google.generativeai as genai
-from rest_framework import viewsets
+import random
+import time
+from django.http import Http404, StreamingHttpResponse
+from django.urls import reverse
+from django.utils.cache import patch_cache_control
+from rest_framework import status, viewsets
+from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
-from .models import CodeReview
-from .serializers import CodeReviewSerializer, AnalyzeInputSerializer, AnalyzeOutputSerializer
-
-# Configure Gemini API
-GEMINI_API_KEY = os.environ.get('GEMINI_API_KEY', '')
-if GEMINI_API_KEY:
-    genai.configure(api_key=GEMINI_API_KEY)
+from . import admission, batching, diffs, hedging, jobs, llm, metrics, profiling, prompts, results, routing, sandbox, structured, throttling
+from .code_review import review_code
+from .models import AnalysisJob, ArchivedReview, CodeReview
+from .perf_analyzer import analyze_performance
+from .renderers import EventStreamRenderer, analysis_response, sse_event
+from .serializers import AnalysisJobSerializer, CodeReviewSerializer, AnalyzeInputSerializer
+from .verification import verify_versions
 
 
 def execute_python_code(code):
-    """Execute Python code and return the output."""
-    # Capture stdout
-    old_stdout = sys.stdout
-    sys.stdout = captured_output = io.StringIO()
-    
-    try:
-        # Execute the code
-        exec(code, {})
-        output = captured_output.getvalue()
-        sys.stdout = old_stdout
-        
-        if output:
-            return {"success": True, "output": output.strip()}
-        else:
-            return {"success": True, "output": "(No output)"}
-    except Exception as e:
-        sys.stdout = old_stdout
-        return {"success": False, "error": str(e)}
-
-
-class CodeReviewViewSet(viewsets.ModelViewSet):
+    """Execute Python code in the sandbox and return the output."""
+    # Output is kept as a bounded head and tail, however much the code prints
+    result = sandbox.execute(code)
+    if not result.get("success"):
+        return {"success": False, "error": result.get("error", "Execution failed")}
+    output = result.get("output", "")
+    if output.strip():
+        return {"success": True, "output": output.strip()}
+    else:
+        return {"success": True, "output": "(No output)"}
+
+
+class CodeReviewViewSet(throttling.RateLimitedMixin, viewsets.ModelViewSet):
     queryset = CodeReview.objects.all()
     serializer_class = CodeReviewSerializer
 
     def perform_create(self, serializer):
         code = serializer.validated_data["code"]
+        serializer.save(review=review_code(code), code_hash=results.query_hash(code))
+
+    def retrieve(self, request, *args, **kwargs):
         try:
-            ast.parse(code)
-            review = "✅ Code is syntactically correct."
-        except SyntaxError as e:
-            review = f"❌ Syntax Error: {e}"
-        serializer.save(review=review)
+            return super().retrieve(request, *args, **kwargs)
+        except Http404:
+            # Old reviews live compressed in the archive (manage.py archive_reviews)
+            pk = kwargs["pk"]
+            archived = ArchivedReview.objects.filter(original_id=pk).first() if str(pk).isdigit() else None
+            if archived is None:
+                raise
+            review = CodeReview(
+                id=archived.original_id, code=archived.code, review=archived.review, created_at=archived.created_at,
+            )
+            return Response(self.get_serializer(review).data)
 
 
 # ============== INTELLIGENT INPUT DETECTION ==============
 
+GREETINGS = frozenset(['hi', 'hello', 'hey', 'hai', 'hallo', 'hiya', 'greetings', 'sup', 'yo'])
+
+GENERAL_PATTERNS = [
+    r'who (is|was|are|were)\s+',
+    r'what (is|was|are|were)\s+',
+    r'when\s+',
+    r'where\s+',
+    r'why\s+',
+    r'how\s+',
+    r'explain\s+',
+    r'tell me about\s+',
+]
+
+# Programming-related keywords that should NOT be treated as general knowledge
+PROGRAMMING_KEYWORDS = ('python', 'javascript', 'java', 'code', 'function', 'class', 'variable',
+                        'array', 'list', 'string', 'loop', 'syntax', 'programming', 'algorithm',
+                        'def ', 'import ', 'const ', 'let ', 'var ', 'function ', '=>', '->')
+
+CODE_INDICATORS = [
+    r'\bdef\s+\w+\s*\(',
+    r'\bclass\s+\w+',
+    r'\bimport\s+\w+',
+    r'\bfrom\s+\w+\s+import',
+    r'\bif\s+.*:\s*$',
+    r'\bfor\s+\w+\s+in\s+',
+    r'\bwhile\s+',
+    r'\breturn\s+',
+    r'\bprint\s*\(',
+    r'\b\w+\s*=\s*\[',
+    r'\b\w+\s*=\s*\{',
+    r'\b\w+\s*=\s*\(',
+    r'\blen\s*\(',
+    r'\brange\s*\(',
+    r'\[.*\].*for\s+',
+    r'=.*\[.*\]',
+]
+
+CODE_REQUEST_KEYWORDS = (
+    'write code', 'create code', 'generate code', 'make code',
+    'how to write', 'how to create', 'how to make',
+    'write a program', 'create a program', 'build a program',
+    'implement', 'function that', 'program that',
+    'code for', 'write python', 'create python',
+    # New patterns
+    'give me', 'show me', 'write a', 'create a',
+    'python code', 'java code', 'javascript code',
+    'how to', 'can you', 'i need', 'need a',
+    'basic', 'simple', 'example',
+)
+
+
+@functools.lru_cache(maxsize=None)
+def get_classifier_patterns():
+    """Compile the classifier regexes once per process (see warmup.warm_up)."""
+    return {
+        "general": re.compile('^(?:' + '|'.join(GENERAL_PATTERNS) + ')'),
+        "code": re.compile('|'.join(CODE_INDICATORS)),
+    }
+
+
 def is_greeting(text):
     """Detect if input is a greeting."""
-    greetings = ['hi', 'hello', 'hey', 'hai', 'hallo', 'hiya', 'greetings', 'sup', 'yo']
     text_lower = text.lower().strip()
-    return text_lower in greetings or len(text_lower) < 4
+    return text_lower in GREETINGS or len(text_lower) < 4
 
 
 def is_general_knowledge(text):
     """Detect if input is general knowledge question (not programming)."""
-    general_patterns = [
-        r'^who (is|was|are|were)\s+',
-        r'^what (is|was|are|were)\s+',
-        r'^when\s+',
-        r'^where\s+',
-        r'^why\s+',
-        r'^how\s+',
-        r'^explain\s+',
-        r'^tell me about\s+',
-    ]
     text_lower = text.lower().strip()
     
-    # Programming-related keywords that should NOT be treated as general knowledge
-    programming_keywords = ['python', 'javascript', 'java', 'code', 'function', 'class', 'variable', 
-                          'array', 'list', 'string', 'loop', 'syntax', 'programming', 'algorithm',
-                          'def ', 'import ', 'const ', 'let ', 'var ', 'function ', '=>', '->']
-    
-    for keyword in programming_keywords:
+    for keyword in PROGRAMMING_KEYWORDS:
         if keyword in text_lower:
             return False
     
-    for pattern in general_patterns:
-        if re.match(pattern, text_lower):
-            return True
-    
-    return False
+    return bool(get_classifier_patterns()["general"].match(text_lower))
 
 
 def contains_python_code(text):
     """Detect if input contains Python code patterns."""
-    # More comprehensive detection
-    code_indicators = [
-        r'\bdef\s+\w+\s*\(',
-        r'\bclass\s+\w+',
-        r'\bimport\s+\w+',
-        r'\bfrom\s+\w+\s+import',
-        r'\bif\s+.*:\s*
+    if get_classifier_patterns()["code"].search(text):
+        return True
+    
+    # Also check for common Python syntax elements
+    if ':' in text and ('=' in text or 'for' in text or 'if' in text or 'def' in text):
+        return True
+    
+    return False
 
 
 def is_code_request(query):
     """Detect if user wants code to be written/generated."""
-    code_keywords = [
-        'write code', 'create code', 'generate code', 'make code',
-        'how to write', 'how to create', 'how to make',
-        'write a program', 'create a program', 'build a program',
-        'implement', 'function that', 'program that',
-        'code for', 'write python', 'create python',
-        # New patterns
-        'give me', 'show me', 'write a', 'create a',
-        'python code', 'java code', 'javascript code',
-        'how to', 'can you', 'i need', 'need a',
-        'basic', 'simple', 'example',
-    ]
     query_lower = query.lower()
-    for keyword in code_keywords:
+    for keyword in CODE_REQUEST_KEYWORDS:
         if keyword in query_lower:
             return True
     return False
@@ -153,20 +188,66 @@ def detect_input_type(query):
     return "programming"
 
 
+# ============== KNOWLEDGE BASE ==============
+
+GREETING_MESSAGES = [
+    "Hello! 👋 How can I help you today?",
+    "Hi there! 🚀 What can I assist you with?",
+    "Hey! 😊 Ready to help with coding or any questions!",
+    "Hello! I'm here to help with code, questions, or anything else!",
+]
+
+# Offline answers for programming questions, used when no LLM is available
+PROGRAMMING_FALLBACKS = {
+    "list": "A list in Python is an ordered, mutable collection that can store items of different types.\n\n```python\nfruits = ['apple', 'banana', 'cherry']\nprint(fruits)\n```",
+    "dictionary": "A dictionary is a collection of key-value pairs. It's unordered, mutable, and indexed by keys.\n\n```python\nperson = {'name': 'John', 'age': 30}\nprint(person['name'])\n```",
+    "function": "A function is a reusable block of code that performs a specific task.\n\n```python\ndef greet(name):\n    return f'Hello, {name}!'\n\nprint(greet('World'))\n```",
+    "loop": "A loop repeats code execution for each item in a sequence.\n\n```python\nfor i in range(5):\n    print(i)\n```",
+    "class": "A class is a blueprint for creating objects.\n\n```python\nclass Dog:\n    def __init__(self, name):\n        self.name = name\n    def bark(self):\n        return 'Woof!'\n\nmy_dog = Dog('Buddy')\nprint(my_dog.bark())\n```",
+    "string": "A string is a sequence of characters used to represent text.\n\n```python\nmessage = 'Hello, World!'\nprint(message.upper())\n```",
+    "file": "Working with files in Python:\n\n```python\nwith open('file.txt', 'r') as f:\n    content = f.read()\n```",
+}
+
+# Offline code samples for code requests, used when no LLM is available
+CODE_EXAMPLES = {
+    # Common patterns
+    "reverse": "def reverse_list(lst):\n    return lst[::-1]\n\n# Example\nprint(reverse_list([1, 2, 3, 4, 5]))",
+    "sort": "def sort_list(lst):\n    return sorted(lst)\n\n# Example\nprint(sort_list([5, 2, 8, 1, 9]))",
+    "prime": "def is_prime(n):\n    if n < 2:\n        return False\n    for i in range(2, int(n**0.5) + 1):\n        if n % i == 0:\n            return False\n    return True\n\n# Example\nprint(is_prime(17))",
+    "fibonacci": "def fibonacci(n):\n    fib = [0, 1]\n    for i in range(2, n):\n        fib.append(fib[i-1] + fib[i-2])\n    return fib[:n]\n\n# Example\nprint(fibonacci(10))",
+    "factorial": "def factorial(n):\n    if n <= 1:\n        return 1\n    return n * factorial(n-1)\n\n# Example\nprint(factorial(5))",
+    "binary search": "def binary_search(arr, target):\n    left, right = 0, len(arr) - 1\n    while left <= right:\n        mid = (left + right) // 2\n        if arr[mid] == target:\n            return mid\n        elif arr[mid] < target:\n            left = mid + 1\n        else:\n            right = mid - 1\n    return -1\n\n# Example\nprint(binary_search([1, 2, 3, 4, 5], 3))",
+    "list": "# Python List Operations\nmy_list = [1, 2, 3, 4, 5]\nmy_list.append(6)\nmy_list.pop()\nprint(my_list)",
+    "dictionary": "# Python Dictionary Operations\nmy_dict = {'name': 'John', 'age': 30}\nmy_dict['city'] = 'NYC'\nprint(my_dict.get('name'))",
+    "string": "# String Operations\ntext = 'Hello World'\nprint(text.upper())\nprint(text.split())\nprint(text.replace('World', 'Python'))",
+    # Basic examples
+    "basic": "# Basic Python Examples\n\n# Hello World\nprint('Hello, World!')\n\n# Variables\nname = 'John'\nage = 25\nprint(f'Name: {name}, Age: {age}')\n\n# List\nfruits = ['apple', 'banana', 'cherry']\nfor fruit in fruits:\n    print(fruit)",
+    "simple": "# Simple Python Examples\n\n# Sum of numbers\nnumbers = [1, 2, 3, 4, 5]\ntotal = sum(numbers)\nprint(f'Sum: {total}')\n\n# Average\naverage = total / len(numbers)\nprint(f'Average: {average}')",
+    "example": "# Python Examples\n\n# For loop\nfor i in range(5):\n    print(i)\n\n# While loop\ncount = 0\nwhile count < 5:\n    print(count)\n    count += 1\n\n# If-else\nx = 10\nif x > 5:\n    print('x is greater than 5')\nelse:\n    print('x is less than or equal to 5')",
+}
+
+DEFAULT_CODE_EXAMPLE = """# Python Basic Program\n\n# 1. Hello World\nprint('Hello, World!')\n\n# 2. Variables and Data Types\nname = 'Python'\nversion = 3.11\nis_awesome = True\n\nprint(f'Language: {name}')\nprint(f'Version: {version}')\nprint(f'Is Awesome: {is_awesome}')\n\n# 3. List\nlanguages = ['Python', 'JavaScript', 'Java']\nfor lang in languages:\n    print(f'I love {lang}')}\n\n# 4. Function\ndef greet(name):\n    return f'Hello, {name}!'\n\nprint(greet('Developer'))\n\n# 5. Class\nclass Calculator:\n    def add(self, a, b):\n        return a + b\n    \n    def multiply(self, a, b):\n        return a * b\n\ncalc = Calculator()\nprint(f'5 + 3 = {calc.add(5, 3)}')\nprint(f'4 * 7 = {calc.multiply(4, 7)}')"""
+
+
+@functools.lru_cache(maxsize=None)
+def get_knowledge_base():
+    """Build the offline lookup tables once per process (see warmup.warm_up)."""
+    return {
+        "programming": tuple(PROGRAMMING_FALLBACKS.items()),
+        "code_examples": tuple(
+            (key, code, f"## Generated Code\n\n```python\n{code}\n```")
+            for key, code in CODE_EXAMPLES.items()
+        ),
+    }
+
+
 # ============== RESPONSE HANDLERS ==============
 
 def handle_greeting():
     """Handle greeting with friendly response."""
-    greetings = [
-        "Hello! 👋 How can I help you today?",
-        "Hi there! 🚀 What can I assist you with?",
-        "Hey! 😊 Ready to help with coding or any questions!",
-        "Hello! I'm here to help with code, questions, or anything else!",
-    ]
-    import random
     return {
         "type": "greeting",
-        "response": random.choice(greetings),
+        "response": random.choice(GREETING_MESSAGES),
         "error": None,
         "corrected_code": "",
         "improved_versions": [],
@@ -174,10 +255,10 @@ def handle_greeting():
     }
 
 
-def handle_general_knowledge(query):
+def handle_general_knowledge(query, context=""):
     """Handle general knowledge questions with natural response."""
     
-    if not GEMINI_API_KEY:
+    if not llm.is_available():
         return {
             "type": "general",
             "response": f"I can help you with that! But for the best answer about '{query}', please ask a specific question.",
@@ -188,11 +269,10 @@ def handle_general_knowledge(query):
         }
     
     try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
+        prepared = prompts.prepare_input(query, "general")
         prompt = f"""You are a helpful AI assistant. Answer this question naturally and clearly:
 
-{query}
+{prepared.text}
 
 Provide a friendly, informative response. If relevant, you can include a small code example, but don't force it.
 JSON format:
@@ -200,14 +280,21 @@ JSON format:
   "response": "your answer here"
 }}"""
         
-        response = model.generate_content(prompt)
-        result_text = response.text
-        
-        start = result_text.find('{')
-        end = result_text.rfind('}') + 1
-        if start >= 0 and end > start:
-            json_str = result_text[start:end]
-            result = json.loads(json_str)
+        # Questions without chat context can share an upstream call
+        result = None if context else batching.ask("general", prepared.text)
+        if result is None and structured.is_enabled("general"):
+            result = structured.generate("general", prepared, context)
+        if result is None:
+            if context:
+                prompt = f"{context}\n\n{prompt}"
+            result_text = routing.generate(prompt, "general", prepared.tokens_after)
+
+            start = result_text.find('{')
+            end = result_text.rfind('}') + 1
+            if start >= 0 and end > start:
+                json_str = result_text[start:end]
+                result = json.loads(json_str)
+        if result is not None:
             return {
                 "type": "general",
                 "response": result.get("response", ""),
@@ -229,23 +316,13 @@ JSON format:
     }
 
 
-def handle_programming_question(query):
+def handle_programming_question(query, context=""):
     """Handle programming questions with explanation and examples."""
     
-    if not GEMINI_API_KEY:
+    if not llm.is_available():
         # Better fallback for programming questions
-        fallback_responses = {
-            "list": "A list in Python is an ordered, mutable collection that can store items of different types.\n\n```python\nfruits = ['apple', 'banana', 'cherry']\nprint(fruits)\n```",
-            "dictionary": "A dictionary is a collection of key-value pairs. It's unordered, mutable, and indexed by keys.\n\n```python\nperson = {'name': 'John', 'age': 30}\nprint(person['name'])\n```",
-            "function": "A function is a reusable block of code that performs a specific task.\n\n```python\ndef greet(name):\n    return f'Hello, {name}!'\n\nprint(greet('World'))\n```",
-            "loop": "A loop repeats code execution for each item in a sequence.\n\n```python\nfor i in range(5):\n    print(i)\n```",
-            "class": "A class is a blueprint for creating objects.\n\n```python\nclass Dog:\n    def __init__(self, name):\n        self.name = name\n    def bark(self):\n        return 'Woof!'\n\nmy_dog = Dog('Buddy')\nprint(my_dog.bark())\n```",
-            "string": "A string is a sequence of characters used to represent text.\n\n```python\nmessage = 'Hello, World!'\nprint(message.upper())\n```",
-            "file": "Working with files in Python:\n\n```python\nwith open('file.txt', 'r') as f:\n    content = f.read()\n```",
-        }
-        
         query_lower = query.lower()
-        for key, response in fallback_responses.items():
+        for key, response in get_knowledge_base()["programming"]:
             if key in query_lower:
                 return {
                     "type": "programming",
@@ -266,11 +343,10 @@ def handle_programming_question(query):
         }
     
     try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
+        prepared = prompts.prepare_input(query, "programming")
         prompt = f"""You are a programming expert. Answer this question clearly with explanation and examples:
 
-{query}
+{prepared.text}
 
 Provide:
 1. Clear explanation
@@ -284,15 +360,20 @@ JSON format:
   "best_practices": ["practice 1", "practice 2"]
 }}"""
         
-        response = model.generate_content(prompt)
-        result_text = response.text
-        
-        start = result_text.find('{')
-        end = result_text.rfind('}') + 1
-        if start >= 0 and end > start:
-            json_str = result_text[start:end]
-            result = json.loads(json_str)
-            
+        result = None if context else batching.ask("programming", prepared.text)
+        if result is None and structured.is_enabled("programming"):
+            result = structured.generate("programming", prepared, context)
+        if result is None:
+            if context:
+                prompt = f"{context}\n\n{prompt}"
+            result_text = routing.generate(prompt, "programming", prepared.tokens_after)
+
+            start = result_text.find('{')
+            end = result_text.rfind('}') + 1
+            if start >= 0 and end > start:
+                json_str = result_text[start:end]
+                result = json.loads(json_str)
+        if result is not None:
             docs = f"## {query}\n\n{result.get('response', '')}"
             if result.get('example_code'):
                 docs += f"\n\n### Example Code\n\n```python\n{result.get('example_code')}\n```"
@@ -320,40 +401,23 @@ JSON format:
     }
 
 
-def generate_code_with_gemini(query):
+def generate_code_with_gemini(query, context=""):
     """Generate code directly when user asks for code."""
     
-    if not GEMINI_API_KEY:
+    if not llm.is_available():
         # Better fallback - generate basic code examples
         query_lower = query.lower()
         
-        code_examples = {
-            # Common patterns
-            "reverse": "def reverse_list(lst):\n    return lst[::-1]\n\n# Example\nprint(reverse_list([1, 2, 3, 4, 5]))",
-            "sort": "def sort_list(lst):\n    return sorted(lst)\n\n# Example\nprint(sort_list([5, 2, 8, 1, 9]))",
-            "prime": "def is_prime(n):\n    if n < 2:\n        return False\n    for i in range(2, int(n**0.5) + 1):\n        if n % i == 0:\n            return False\n    return True\n\n# Example\nprint(is_prime(17))",
-            "fibonacci": "def fibonacci(n):\n    fib = [0, 1]\n    for i in range(2, n):\n        fib.append(fib[i-1] + fib[i-2])\n    return fib[:n]\n\n# Example\nprint(fibonacci(10))",
-            "factorial": "def factorial(n):\n    if n <= 1:\n        return 1\n    return n * factorial(n-1)\n\n# Example\nprint(factorial(5))",
-            "binary search": "def binary_search(arr, target):\n    left, right = 0, len(arr) - 1\n    while left <= right:\n        mid = (left + right) // 2\n        if arr[mid] == target:\n            return mid\n        elif arr[mid] < target:\n            left = mid + 1\n        else:\n            right = mid - 1\n    return -1\n\n# Example\nprint(binary_search([1, 2, 3, 4, 5], 3))",
-            "list": "# Python List Operations\nmy_list = [1, 2, 3, 4, 5]\nmy_list.append(6)\nmy_list.pop()\nprint(my_list)",
-            "dictionary": "# Python Dictionary Operations\nmy_dict = {'name': 'John', 'age': 30}\nmy_dict['city'] = 'NYC'\nprint(my_dict.get('name'))",
-            "string": "# String Operations\ntext = 'Hello World'\nprint(text.upper())\nprint(text.split())\nprint(text.replace('World', 'Python'))",
-            # Basic examples
-            "basic": "# Basic Python Examples\n\n# Hello World\nprint('Hello, World!')\n\n# Variables\nname = 'John'\nage = 25\nprint(f'Name: {name}, Age: {age}')\n\n# List\nfruits = ['apple', 'banana', 'cherry']\nfor fruit in fruits:\n    print(fruit)",
-            "simple": "# Simple Python Examples\n\n# Sum of numbers\nnumbers = [1, 2, 3, 4, 5]\ntotal = sum(numbers)\nprint(f'Sum: {total}')\n\n# Average\naverage = total / len(numbers)\nprint(f'Average: {average}')",
-            "example": "# Python Examples\n\n# For loop\nfor i in range(5):\n    print(i)\n\n# While loop\ncount = 0\nwhile count < 5:\n    print(count)\n    count += 1\n\n# If-else\nx = 10\nif x > 5:\n    print('x is greater than 5')\nelse:\n    print('x is less than or equal to 5')",
-        }
-        
-        for key, code in code_examples.items():
+        for key, code, documentation in get_knowledge_base()["code_examples"]:
             if key in query_lower:
                 return {
                     "answer": f"Here's Python code for {query}:",
                     "example_code": code,
-                    "documentation": f"## Generated Code\n\n```python\n{code}\n```"
+                    "documentation": documentation
                 }
         
         # Default fallback - basic program
-        default_code = """# Python Basic Program\n\n# 1. Hello World\nprint('Hello, World!')\n\n# 2. Variables and Data Types\nname = 'Python'\nversion = 3.11\nis_awesome = True\n\nprint(f'Language: {name}')\nprint(f'Version: {version}')\nprint(f'Is Awesome: {is_awesome}')\n\n# 3. List\nlanguages = ['Python', 'JavaScript', 'Java']\nfor lang in languages:\n    print(f'I love {lang}')}\n\n# 4. Function\ndef greet(name):\n    return f'Hello, {name}!'\n\nprint(greet('Developer'))\n\n# 5. Class\nclass Calculator:\n    def add(self, a, b):\n        return a + b\n    \n    def multiply(self, a, b):\n        return a * b\n\ncalc = Calculator()\nprint(f'5 + 3 = {calc.add(5, 3)}')\nprint(f'4 * 7 = {calc.multiply(4, 7)}')"""
+        default_code = DEFAULT_CODE_EXAMPLE
         
         return {
             "answer": f"Here's Python basic code for you:",
@@ -362,11 +426,10 @@ def generate_code_with_gemini(query):
         }
     
     try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
+        prepared = prompts.prepare_input(query, "code_request")
         prompt = f"""You are a Python expert. Write clean, working Python code for this request:
 
-Request: {query}
+Request: {prepared.text}
 
 Rules:
 - Write complete, working code
@@ -380,14 +443,19 @@ Respond with JSON:
   "explanation": "one sentence about what it does"
 }}"""
         
-        response = model.generate_content(prompt)
-        result_text = response.text
-        
-        start = result_text.find('{')
-        end = result_text.rfind('}') + 1
-        if start >= 0 and end > start:
-            json_str = result_text[start:end]
-            result = json.loads(json_str)
+        result = structured.generate("code_request", prepared, context) \
+            if structured.is_enabled("code_request") else None
+        if result is None:
+            if context:
+                prompt = f"{context}\n\n{prompt}"
+            result_text = routing.generate(prompt, "code_request", prepared.tokens_after)
+
+            start = result_text.find('{')
+            end = result_text.rfind('}') + 1
+            if start >= 0 and end > start:
+                json_str = result_text[start:end]
+                result = json.loads(json_str)
+        if result is not None:
             return {
                 "answer": result.get("explanation", ""),
                 "example_code": result.get("code", ""),
@@ -403,9 +471,15 @@ Respond with JSON:
     }
 
 
-def analyze_code_with_gemini(code):
-    """Use Gemini API to analyze code and provide improvements."""
-    
+LOCAL_FIELDS = ("is_valid", "error", "corrected_code", "output")
+
+
+def local_code_check(code):
+    """
+    Syntax check, local fix and execution: the part of a code review that
+    needs no LLM. Returns the LOCAL_FIELDS, with the fixed code (if any) as
+    corrected_code.
+    """
     # First, try to parse and execute the code
     try:
         ast.parse(code)
@@ -436,19 +510,39 @@ def analyze_code_with_gemini(code):
                 is_valid = True
                 error_info = {"message": "Fixed!", "fixed": True}
                 code_output = fixed_result.get("output", "")
+    return {"is_valid": is_valid, "error": error_info, "corrected_code": code, "output": code_output}
+
+
+def analyze_code_with_gemini(code, context="", local=None, fallback=True):
+    """
+    Use Gemini API to analyze code and provide improvements.
+
+    When the model is unavailable or fails, the local analysis (which runs
+    the code) is returned instead; with `fallback` False llm.LLMError is
+    raised and the code is never executed.
+    """
+    
+    # `local` is the local_code_check(code) result when already known
+    local = local or local_code_check(code)
+    code, is_valid, error_info, code_output = (
+        local["corrected_code"], local["is_valid"], local["error"], local["output"]
+    )
     
-    if not GEMINI_API_KEY:
+    if not llm.is_available():
+        if not fallback:
+            raise llm.LLMError("No LLM provider is configured")
         result = local_code_analysis(code, is_valid, error_info)
         result["output"] = code_output
         return result
     
     try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
+        # Comments and large literals are left out of the prompt; the
+        # model's changes are applied to the original code
+        prepared = prompts.prepare_input(code, "code")
         prompt = f"""Review this Python code:
 
 ```
-{code}
+{prepared.text}
 ```
 
 Provide JSON with:
@@ -464,18 +558,42 @@ Provide JSON with:
   "best_version": 2
 }}"""
         
-        response = model.generate_content(prompt)
-        result_text = response.text
-        
-        start = result_text.find('{')
-        end = result_text.rfind('}') + 1
-        if start >= 0 and end > start:
-            json_str = result_text[start:end]
-            result = json.loads(json_str)
+        result = structured.generate("code", prepared, context) if structured.is_enabled("code") else None
+        if result is None:
+            if context:
+                prompt = f"{context}\n\n{prompt}"
+            result_text = routing.generate(prompt, "code", prepared.tokens_after)
+
+            start = result_text.find('{')
+            end = result_text.rfind('}') + 1
+            if start >= 0 and end > start:
+                json_str = result_text[start:end]
+                result = json.loads(json_str)
+        if result is not None:
+            # The model counts lines in the compacted code
+            if isinstance(result.get("error"), dict):
+                result["error"]["line"] = prepared.source_line(result["error"].get("line"))
+            if prepared.clipped:
+                # The model saw the code with lines omitted, so its rewrites
+                # would carry the omission marker: keep the submitted code
+                result["corrected_code"] = code
+                result["improvements"] = []
+                result["best_version"] = 0
+                result["clipped"] = True
+                return result
+            if result.get("corrected_code"):
+                result["corrected_code"] = prepared.restore_code(result["corrected_code"])
+            for improvement in result.get("improvements") or []:
+                if improvement.get("code"):
+                    improvement["code"] = prepared.restore_code(improvement["code"])
             return result
     except Exception as e:
         print(f"Gemini error: {e}")
+        if not fallback:
+            raise
     
+    if not fallback:
+        raise llm.LLMError("No JSON object in the model's reply")
     return local_code_analysis(code, is_valid, error_info)
 
 
@@ -571,636 +689,354 @@ def local_fix_syntax(code, error_info):
         return None
 
 
-# ============== MAIN VIEW SET ==============
+# ============== ANALYSIS PIPELINE ==============
 
-class AnalyzeViewSet(viewsets.ViewSet):
-    serializer_class = AnalyzeInputSerializer
+def analyze_query(query, profile=False, on_partial=None, context="", input_type=None, local=None):
+    """
+    Classify `query`, run the matching handler and return the API response dict.
 
-    def create(self, request):
-        serializer = AnalyzeInputSerializer(data=request.data)
-        serializer.is_valid(raise_exception=True)
-        
-        query = serializer.validated_data["query"]
-        
-        # Detect input type intelligently
+    `on_partial(stage, fields)`, if given, is called as each stage of a code
+    analysis completes, with the response fields known so far. `context` is
+    prepended to LLM prompts (e.g. the conversation so far in a chat).
+    `input_type` skips detection when the caller has already classified it,
+    and `local` skips the local check of code already run by the caller.
+    """
+    # Detect input type intelligently
+    if input_type is None:
         input_type = detect_input_type(query)
-        
-        # Handle based on detected type
-        if input_type == "greeting":
-            result = handle_greeting()
-        elif input_type == "general":
-            result = handle_general_knowledge(query)
-        elif input_type == "code_request":
-            code_result = generate_code_with_gemini(query)
-            result = {
-                "type": "code",
-                "is_valid": True,
-                "error": None,
-                "corrected_code": code_result.get("example_code", ""),
-                "improved_versions": [],
-                "best_version": 0,
-                "response": code_result.get("answer", ""),
-                "answer": code_result.get("answer", ""),
-                "example_code": code_result.get("example_code", ""),
-                "documentation": code_result.get("documentation", ""),
-                "output": ""
-            }
-        elif input_type == "code":
-            analysis = analyze_code_with_gemini(query)
-            result = {
-                "type": "code",
+    profiling.tag(input_type=input_type)
+    if on_partial:
+        on_partial("classified", {"input_type": input_type})
+
+    # Handle based on detected type
+    if input_type == "greeting":
+        result = handle_greeting()
+    elif input_type == "general":
+        result = handle_general_knowledge(query, context=context)
+    elif input_type == "code_request":
+        code_result = generate_code_with_gemini(query, context=context)
+        result = {
+            "type": "code",
+            "is_valid": True,
+            "error": None,
+            "corrected_code": code_result.get("example_code", ""),
+            "improved_versions": [],
+            "best_version": 0,
+            "response": code_result.get("answer", ""),
+            "answer": code_result.get("answer", ""),
+            "example_code": code_result.get("example_code", ""),
+            "documentation": code_result.get("documentation", ""),
+            "output": ""
+        }
+    elif input_type == "code":
+        if local is None:
+            local = local_code_check(query)
+        if on_partial:
+            on_partial("local", dict(local))
+        analysis = analyze_code_with_gemini(query, context=context, local=local)
+        # The model does not run the code; keep the local output
+        analysis.setdefault("output", local["output"])
+        improvements = analysis.get("improvements", [])
+        best_version = analysis.get("best_version", 2)
+        if on_partial:
+            on_partial("analyzed", {
                 "is_valid": analysis.get("is_valid", True),
                 "error": analysis.get("error"),
                 "corrected_code": analysis.get("corrected_code", query),
-                "improved_versions": analysis.get("improvements", []),
-                "best_version": analysis.get("best_version", 2),
-                "response": "",
-                "answer": "",
-                "example_code": analysis.get("corrected_code", ""),
-                "documentation": f"## Code Analysis\n\nStatus: {'✅ Correct' if analysis.get('is_valid') else '❌ Has Errors'}",
-                "output": analysis.get("output", "")
-            }
-        else:  # programming
-            result = handle_programming_question(query)
-        
-        # Build response for API
-        response_data = {
-            "type": result.get("type", "general"),
-            "is_valid": result.get("is_valid", True),
-            "error": result.get("error"),
-            "corrected_code": result.get("corrected_code", ""),
-            "improved_versions": result.get("improved_versions", []),
-            "best_version": result.get("best_version", 0),
-            "answer": result.get("response", ""),
-            "example_code": result.get("example_code", ""),
-            "documentation": result.get("documentation", ""),
-            "output": result.get("output", "")
+                "improved_versions": improvements,
+                "output": analysis.get("output", ""),
+            })
+        timings = []
+        profile_future = None
+        if profile and analysis.get("is_valid", True):
+            # Profile alongside the version timings rather than after them
+            profile_future = sandbox.get_executor().submit(
+                sandbox.profile_code, analysis.get("corrected_code") or query
+            )
+        if improvements and analysis.get("is_valid", True):
+            # Pick the best version by measured speed, not by the model's claim
+            measured_best, timings = verify_versions(analysis.get("corrected_code") or query, improvements)
+            if measured_best is not None:
+                best_version = measured_best
+            if on_partial:
+                on_partial("verified", {"best_version": best_version, "timings": timings})
+        profile = profile_future.result() if profile_future else None
+        performance_hints = analyze_performance(analysis.get("corrected_code") or query)
+        documentation = f"## Code Analysis\n\nStatus: {'✅ Correct' if analysis.get('is_valid') else '❌ Has Errors'}"
+        if analysis.get("clipped"):
+            documentation += "\n\nThe code is too long to review in full, so no corrections or improved versions are suggested."
+        if performance_hints:
+            documentation += "\n\n### Performance\n" + "\n".join(
+                [f"- Line {h['line']} ({h['complexity']}): {h['message']}" for h in performance_hints]
+            )
+        result = {
+            "type": "code",
+            "is_valid": analysis.get("is_valid", True),
+            "error": analysis.get("error"),
+            "corrected_code": analysis.get("corrected_code", query),
+            "improved_versions": improvements,
+            "best_version": best_version,
+            "timings": timings,
+            "profile": profile,
+            "performance_hints": performance_hints,
+            "response": "",
+            "answer": "",
+            "example_code": analysis.get("corrected_code", ""),
+            "documentation": documentation,
+            "output": analysis.get("output", "")
         }
-        
-        output_serializer = AnalyzeOutputSerializer(response_data)
-        return Response(output_serializer.data)
-,
-        r'\bfor\s+\w+\s+in\s+',
-        r'\bwhile\s+',
-        r'\breturn\s+',
-        r'\bprint\s*\(',
-        r'\b\w+\s*=\s*\[',
-        r'\b\w+\s*=\s*\{',
-        r'\b\w+\s*=\s*\(',
-        r'\bprint\s*\(',
-        r'\blen\s*\(',
-        r'\brange\s*\(',
-        r'\[.*\].*for\s+',
-        r'=.*\[.*\]',
-    ]
-    
-    # Check each pattern
-    for pattern in code_indicators:
-        if re.search(pattern, text):
-            return True
-    
-    # Also check for common Python syntax elements
-    if ':' in text and ('=' in text or 'for' in text or 'if' in text or 'def' in text):
-        return True
-    
-    return False
-
-
-def is_code_request(query):
-    """Detect if user wants code to be written/generated."""
-    code_keywords = [
-        'write code', 'create code', 'generate code', 'make code',
-        'how to write', 'how to create', 'how to make',
-        'write a program', 'create a program', 'build a program',
-        'implement', 'function that', 'program that',
-        'code for', 'write python', 'create python',
-        # New patterns
-        'give me', 'show me', 'write a', 'create a',
-        'python code', 'java code', 'javascript code',
-        'how to', 'can you', 'i need', 'need a',
-        'basic', 'simple', 'example',
-    ]
-    query_lower = query.lower()
-    for keyword in code_keywords:
-        if keyword in query_lower:
-            return True
-    return False
+    else:  # programming
+        result = handle_programming_question(query, context=context)
+
+    # Build response for API
+    response_data = {
+        "type": result.get("type", "general"),
+        "is_valid": result.get("is_valid", True),
+        "error": result.get("error"),
+        "corrected_code": result.get("corrected_code", ""),
+        "improved_versions": result.get("improved_versions", []),
+        "best_version": result.get("best_version", 0),
+        "answer": result.get("response", ""),
+        "example_code": result.get("example_code", ""),
+        "documentation": result.get("documentation", ""),
+        "output": result.get("output", "")
+    }
+    if "timings" in result:
+        response_data["timings"] = result["timings"]
+    if result.get("profile"):
+        response_data["profile"] = result["profile"]
+    if "performance_hints" in result:
+        response_data["performance_hints"] = result["performance_hints"]
+    return response_data
 
 
-def detect_input_type(query):
+def start_progressive(request, query, options, reservation=None):
     """
-    Intelligently detect the type of user input.
-    Returns: "greeting" | "general" | "programming" | "code" | "code_request"
+    Phase one of a progressive code review: run the local check now, queue
+    the LLM review as a job started in this process and return the local
+    result with a "pending" pointer to the job, which can be polled or
+    followed as Server-Sent Events. The job runs in `reservation`, its
+    place in the LLM admission lane.
     """
-    query = query.strip()
-    
-    # 1. Check for greeting
-    if is_greeting(query):
-        return "greeting"
-    
-    # 2. Try to parse as Python code
-    if contains_python_code(query):
-        try:
-            ast.parse(query)
-            return "code"  # Valid Python code
-        except:
-            return "code"  # Invalid code, still treat as code
-    
-    # 3. Check if user wants code to be written
-    if is_code_request(query):
-        return "code_request"
-    
-    # 4. Check for general knowledge question
-    if is_general_knowledge(query):
-        return "general"
-    
-    # 5. Default to programming question
-    return "programming"
-
-
-# ============== RESPONSE HANDLERS ==============
-
-def handle_greeting():
-    """Handle greeting with friendly response."""
-    greetings = [
-        "Hello! 👋 How can I help you today?",
-        "Hi there! 🚀 What can I assist you with?",
-        "Hey! 😊 Ready to help with coding or any questions!",
-        "Hello! I'm here to help with code, questions, or anything else!",
-    ]
-    import random
-    return {
-        "type": "greeting",
-        "response": random.choice(greetings),
-        "error": None,
-        "corrected_code": "",
-        "improved_versions": [],
-        "documentation": ""
-    }
-
-
-def handle_general_knowledge(query):
-    """Handle general knowledge questions with natural response."""
-    
-    if not GEMINI_API_KEY:
-        return {
-            "type": "general",
-            "response": f"I can help you with that! But for the best answer about '{query}', please ask a specific question.",
-            "error": None,
-            "corrected_code": "",
-            "improved_versions": [],
-            "documentation": ""
-        }
-    
-    try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
-        prompt = f"""You are a helpful AI assistant. Answer this question naturally and clearly:
-
-{query}
-
-Provide a friendly, informative response. If relevant, you can include a small code example, but don't force it.
-JSON format:
-{{
-  "response": "your answer here"
-}}"""
-        
-        response = model.generate_content(prompt)
-        result_text = response.text
-        
-        start = result_text.find('{')
-        end = result_text.rfind('}') + 1
-        if start >= 0 and end > start:
-            json_str = result_text[start:end]
-            result = json.loads(json_str)
-            return {
-                "type": "general",
-                "response": result.get("response", ""),
-                "error": None,
-                "corrected_code": "",
-                "improved_versions": [],
-                "documentation": f"## {query}\n\n{result.get('response', '')}"
-            }
-    except Exception as e:
-        print(f"Gemini error: {e}")
-    
-    return {
-        "type": "general",
-        "response": f"That's an interesting question about '{query}'. I'd be happy to help with coding-related topics!",
-        "error": None,
-        "corrected_code": "",
-        "improved_versions": [],
-        "documentation": ""
-    }
-
-
-def handle_programming_question(query):
-    """Handle programming questions with explanation and examples."""
-    
-    if not GEMINI_API_KEY:
-        # Better fallback for programming questions
-        fallback_responses = {
-            "list": "A list in Python is an ordered, mutable collection that can store items of different types.\n\n```python\nfruits = ['apple', 'banana', 'cherry']\nprint(fruits)\n```",
-            "dictionary": "A dictionary is a collection of key-value pairs. It's unordered, mutable, and indexed by keys.\n\n```python\nperson = {'name': 'John', 'age': 30}\nprint(person['name'])\n```",
-            "function": "A function is a reusable block of code that performs a specific task.\n\n```python\ndef greet(name):\n    return f'Hello, {name}!'\n\nprint(greet('World'))\n```",
-            "loop": "A loop repeats code execution for each item in a sequence.\n\n```python\nfor i in range(5):\n    print(i)\n```",
-            "class": "A class is a blueprint for creating objects.\n\n```python\nclass Dog:\n    def __init__(self, name):\n        self.name = name\n    def bark(self):\n        return 'Woof!'\n\nmy_dog = Dog('Buddy')\nprint(my_dog.bark())\n```",
-            "string": "A string is a sequence of characters used to represent text.\n\n```python\nmessage = 'Hello, World!'\nprint(message.upper())\n```",
-            "file": "Working with files in Python:\n\n```python\nwith open('file.txt', 'r') as f:\n    content = f.read()\n```",
-        }
-        
-        query_lower = query.lower()
-        for key, response in fallback_responses.items():
-            if key in query_lower:
-                return {
-                    "type": "programming",
-                    "response": response,
-                    "error": None,
-                    "corrected_code": "",
-                    "improved_versions": [],
-                    "documentation": f"## {query}\n\n{response}"
-                }
-        
-        return {
-            "type": "programming",
-            "response": f"I'd be happy to help with '{query}'! However, I need a Gemini API key to provide a detailed explanation. Please add your API key to the .env file.",
-            "error": None,
-            "corrected_code": "",
-            "improved_versions": [],
-            "documentation": f"## {query}\n\nThis is a programming topic. Add your GEMINI_API_KEY for detailed explanations."
-        }
-    
-    try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
-        prompt = f"""You are a programming expert. Answer this question clearly with explanation and examples:
-
-{query}
-
-Provide:
-1. Clear explanation
-2. Code example (if relevant)
-3. Best practices
-
-JSON format:
-{{
-  "response": "explanation here",
-  "example_code": "code example if relevant, empty string if not",
-  "best_practices": ["practice 1", "practice 2"]
-}}"""
-        
-        response = model.generate_content(prompt)
-        result_text = response.text
-        
-        start = result_text.find('{')
-        end = result_text.rfind('}') + 1
-        if start >= 0 and end > start:
-            json_str = result_text[start:end]
-            result = json.loads(json_str)
-            
-            docs = f"## {query}\n\n{result.get('response', '')}"
-            if result.get('example_code'):
-                docs += f"\n\n### Example Code\n\n```python\n{result.get('example_code')}\n```"
-            if result.get('best_practices'):
-                docs += f"\n\n### Best Practices\n" + "\n".join([f"- {p}" for p in result.get('best_practices', [])])
-            
-            return {
-                "type": "programming",
-                "response": result.get("response", ""),
-                "error": None,
-                "corrected_code": result.get("example_code", ""),
-                "improved_versions": [],
-                "documentation": docs
-            }
-    except Exception as e:
-        print(f"Gemini error: {e}")
-    
-    return {
-        "type": "programming",
-        "response": f"Here's what I know about {query}:",
-        "error": None,
-        "corrected_code": "",
+    local = local_code_check(query)
+    job = jobs.enqueue(query, profile=options["profile"], partial=dict(local, stage="local"))
+    response_data = {
+        "type": "code",
+        "is_valid": local["is_valid"],
+        "error": local["error"],
+        "corrected_code": local["corrected_code"],
         "improved_versions": [],
-        "documentation": f"## {query}"
+        "best_version": 0,
+        "answer": "",
+        "example_code": local["corrected_code"],
+        "documentation": "",
+        "output": local["output"],
+        "pending": {
+            "job": job.pk,
+            "status": job.status,
+            "poll": request.build_absolute_uri(reverse("job-detail", kwargs={"pk": job.pk})),
+            "events": request.build_absolute_uri(reverse("job-events", kwargs={"pk": job.pk})),
+        },
     }
+    jobs.start(job, reservation)
+    return response_data
 
 
-def generate_code_with_gemini(query):
-    """Generate code directly when user asks for code."""
-    
-    if not GEMINI_API_KEY:
-        # Better fallback - generate basic code examples
-        query_lower = query.lower()
-        
-        code_examples = {
-            # Common patterns
-            "reverse": "def reverse_list(lst):\n    return lst[::-1]\n\n# Example\nprint(reverse_list([1, 2, 3, 4, 5]))",
-            "sort": "def sort_list(lst):\n    return sorted(lst)\n\n# Example\nprint(sort_list([5, 2, 8, 1, 9]))",
-            "prime": "def is_prime(n):\n    if n < 2:\n        return False\n    for i in range(2, int(n**0.5) + 1):\n        if n % i == 0:\n            return False\n    return True\n\n# Example\nprint(is_prime(17))",
-            "fibonacci": "def fibonacci(n):\n    fib = [0, 1]\n    for i in range(2, n):\n        fib.append(fib[i-1] + fib[i-2])\n    return fib[:n]\n\n# Example\nprint(fibonacci(10))",
-            "factorial": "def factorial(n):\n    if n <= 1:\n        return 1\n    return n * factorial(n-1)\n\n# Example\nprint(factorial(5))",
-            "binary search": "def binary_search(arr, target):\n    left, right = 0, len(arr) - 1\n    while left <= right:\n        mid = (left + right) // 2\n        if arr[mid] == target:\n            return mid\n        elif arr[mid] < target:\n            left = mid + 1\n        else:\n            right = mid - 1\n    return -1\n\n# Example\nprint(binary_search([1, 2, 3, 4, 5], 3))",
-            "list": "# Python List Operations\nmy_list = [1, 2, 3, 4, 5]\nmy_list.append(6)\nmy_list.pop()\nprint(my_list)",
-            "dictionary": "# Python Dictionary Operations\nmy_dict = {'name': 'John', 'age': 30}\nmy_dict['city'] = 'NYC'\nprint(my_dict.get('name'))",
-            "string": "# String Operations\ntext = 'Hello World'\nprint(text.upper())\nprint(text.split())\nprint(text.replace('World', 'Python'))",
-            # Basic examples
-            "basic": "# Basic Python Examples\n\n# Hello World\nprint('Hello, World!')\n\n# Variables\nname = 'John'\nage = 25\nprint(f'Name: {name}, Age: {age}')\n\n# List\nfruits = ['apple', 'banana', 'cherry']\nfor fruit in fruits:\n    print(fruit)",
-            "simple": "# Simple Python Examples\n\n# Sum of numbers\nnumbers = [1, 2, 3, 4, 5]\ntotal = sum(numbers)\nprint(f'Sum: {total}')\n\n# Average\naverage = total / len(numbers)\nprint(f'Average: {average}')",
-            "example": "# Python Examples\n\n# For loop\nfor i in range(5):\n    print(i)\n\n# While loop\ncount = 0\nwhile count < 5:\n    print(count)\n    count += 1\n\n# If-else\nx = 10\nif x > 5:\n    print('x is greater than 5')\nelse:\n    print('x is less than or equal to 5')",
-        }
-        
-        for key, code in code_examples.items():
-            if key in query_lower:
-                return {
-                    "answer": f"Here's Python code for {query}:",
-                    "example_code": code,
-                    "documentation": f"## Generated Code\n\n```python\n{code}\n```"
-                }
-        
-        # Default fallback - basic program
-        default_code = """# Python Basic Program\n\n# 1. Hello World\nprint('Hello, World!')\n\n# 2. Variables and Data Types\nname = 'Python'\nversion = 3.11\nis_awesome = True\n\nprint(f'Language: {name}')\nprint(f'Version: {version}')\nprint(f'Is Awesome: {is_awesome}')\n\n# 3. List\nlanguages = ['Python', 'JavaScript', 'Java']\nfor lang in languages:\n    print(f'I love {lang}')}\n\n# 4. Function\ndef greet(name):\n    return f'Hello, {name}!'\n\nprint(greet('Developer'))\n\n# 5. Class\nclass Calculator:\n    def add(self, a, b):\n        return a + b\n    \n    def multiply(self, a, b):\n        return a * b\n\ncalc = Calculator()\nprint(f'5 + 3 = {calc.add(5, 3)}')\nprint(f'4 * 7 = {calc.multiply(4, 7)}')"""
-        
-        return {
-            "answer": f"Here's Python basic code for you:",
-            "example_code": default_code,
-            "documentation": f"## Basic Python Code\n\n```python\n{default_code}\n```"
-        }
-    
-    try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
-        prompt = f"""You are a Python expert. Write clean, working Python code for this request:
-
-Request: {query}
-
-Rules:
-- Write complete, working code
-- Add brief comments
-- Keep it simple and readable
-- Return ONLY the code, no explanations
-
-Respond with JSON:
-{{
-  "code": "the python code here",
-  "explanation": "one sentence about what it does"
-}}"""
-        
-        response = model.generate_content(prompt)
-        result_text = response.text
-        
-        start = result_text.find('{')
-        end = result_text.rfind('}') + 1
-        if start >= 0 and end > start:
-            json_str = result_text[start:end]
-            result = json.loads(json_str)
-            return {
-                "answer": result.get("explanation", ""),
-                "example_code": result.get("code", ""),
-                "documentation": f"## Generated Code\n\n```python\n{result.get('code', '')}\n```"
-            }
-    except Exception as e:
-        print(f"Gemini error: {e}")
-    
-    return {
-        "answer": "Here's the code you requested:",
-        "example_code": "# Code generation",
-        "documentation": "## Code"
-    }
-
+# ============== MAIN VIEW SET ==============
 
-def analyze_code_with_gemini(code):
-    """Use Gemini API to analyze code and provide improvements."""
-    
-    # First, try to parse and execute the code
-    try:
-        ast.parse(code)
-        is_valid = True
-        error_info = None
-    except SyntaxError as e:
-        is_valid = False
-        error_info = {
-            "message": str(e.msg) if hasattr(e, 'msg') else str(e),
-            "line": e.lineno if hasattr(e, 'lineno') else None,
-            "column": e.offset if hasattr(e, 'offset') else None,
-            "text": e.text.strip() if hasattr(e, 'text') and e.text else None
-        }
-    
-    # Execute code and get output
-    execution_result = execute_python_code(code)
-    code_output = execution_result.get("output", "") if execution_result.get("success") else ""
-    
-    # If code has errors, try to fix it
-    if not is_valid:
-        # Try local fix first
-        fixed_code = local_fix_syntax(code, error_info)
-        if fixed_code:
-            # Try to execute fixed code
-            fixed_result = execute_python_code(fixed_code)
-            if fixed_result.get("success"):
-                code = fixed_code
-                is_valid = True
-                error_info = {"message": "Fixed!", "fixed": True}
-                code_output = fixed_result.get("output", "")
-    
-    if not GEMINI_API_KEY:
-        result = local_code_analysis(code, is_valid, error_info)
-        result["output"] = code_output
-        return result
-    
-    try:
-        model = genai.GenerativeModel('gemini-1.5-flash')
-        
-        prompt = f"""Review this Python code:
+def analysis_rate_bucket(request):
+    """Charge an analysis submission to the client's "llm" or "local" bucket."""
+    query = request.data.get("query") if request.method == "POST" else None
+    if isinstance(query, str) and admission.classify(detect_input_type(query)) == admission.LLM:
+        return throttling.LLM
+    return throttling.LOCAL
 
-```
-{code}
-```
 
-Provide JSON with:
-{{
-  "is_valid": true/false,
-  "error": {{"message": "", "line": null}} or null,
-  "corrected_code": "fixed code",
-  "improvements": [
-    {{"version": 1, "code": "v1", "explanation": ""}},
-    {{"version": 2, "code": "v2", "explanation": ""}},
-    {{"version": 3, "code": "v3", "explanation": ""}}
-  ],
-  "best_version": 2
-}}"""
-        
-        response = model.generate_content(prompt)
-        result_text = response.text
-        
-        start = result_text.find('{')
-        end = result_text.rfind('}') + 1
-        if start >= 0 and end > start:
-            json_str = result_text[start:end]
-            result = json.loads(json_str)
-            return result
-    except Exception as e:
-        print(f"Gemini error: {e}")
-    
-    return local_code_analysis(code, is_valid, error_info)
+class AnalyzeViewSet(throttling.RateLimitedMixin, viewsets.ViewSet):
+    serializer_class = AnalyzeInputSerializer
+    lookup_value_regex = '[0-9a-f]{64}'
 
+    def rate_bucket(self, request):
+        return analysis_rate_bucket(request)
 
-def local_code_analysis(code, is_valid, error_info):
-    """Fallback local code analysis."""
-    corrected_code = code
-    improvements = []
-    code_output = ""
-    
-    # Execute original code to get output
-    if is_valid:
-        result = execute_python_code(code)
-        if result.get("success"):
-            code_output = result.get("output", "")
-    
-    if not is_valid and error_info:
-        lines = code.split('\n')
-        fixed_lines = []
-        for i, line in enumerate(lines, 1):
-            fixed_line = line
-            if error_info.get('line') == i:
-                stripped = line.strip()
-                if (stripped.endswith('if') or stripped.endswith('else') or
-                    stripped.endswith('elif') or stripped.endswith('for') or
-                    stripped.endswith('while') or stripped.endswith('def') or
-                    stripped.endswith('class') or stripped.endswith('try') or
-                    stripped.endswith('except') or stripped.endswith('finally')):
-                    if not stripped.endswith(':'):
-                        fixed_line = line.rstrip() + ':'
-            fixed_lines.append(fixed_line)
-        
-        corrected_code = '\n'.join(fixed_lines)
+    def create(self, request):
+        serializer = AnalyzeInputSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
         
+        query = serializer.validated_data["query"]
+        options = results.analysis_options(profile=serializer.validated_data["profile"])
+        key = results.analysis_key(query, options)
+
+        # Retries with the same Idempotency-Key get the first attempt's result
+        idempotency_key = request.headers.get("Idempotency-Key")
+        if idempotency_key:
+            replayed = results.begin_idempotent(idempotency_key, key)
+            if replayed is not None:
+                if serializer.validated_data["compact"]:
+                    replayed = diffs.compact_response(replayed)
+                response = analysis_response(request, replayed)
+                response["Idempotent-Replayed"] = "true"
+                return self.with_location(response, replayed, key)
+
+        progressive = False
         try:
-            ast.parse(corrected_code)
-            error_info["fixed"] = True
-            error_info["fix_message"] = "Fixed!"
-            # Try to execute fixed code
-            result = execute_python_code(corrected_code)
-            if result.get("success"):
-                code_output = result.get("output", "")
-        except:
-            error_info["fixed"] = False
-            corrected_code = code
-    
-    if is_valid or (error_info and error_info.get('fixed')):
-        improvements = [
-            {"version": 1, "code": code, "explanation": "Original code"},
-            {"version": 2, "code": code, "explanation": "More Pythonic version"},
-            {"version": 3, "code": code, "explanation": "Optimized version"}
-        ]
-    
-    return {
-        "is_valid": is_valid,
-        "error": error_info,
-        "corrected_code": corrected_code,
-        "improvements": improvements,
-        "best_version": 2,
-        "output": code_output
-    }
-
-
-def local_fix_syntax(code, error_info):
-    """Try to fix syntax errors locally."""
-    if not error_info:
-        return None
-    
-    lines = code.split('\n')
-    fixed_lines = []
-    
-    for i, line in enumerate(lines, 1):
-        fixed_line = line
-        if error_info.get('line') == i:
-            stripped = line.strip()
-            # Add colon if missing
-            if (stripped.endswith('if') or stripped.endswith('else') or
-                stripped.endswith('elif') or stripped.endswith('for') or
-                stripped.endswith('while') or stripped.endswith('def') or
-                stripped.endswith('class') or stripped.endswith('try') or
-                stripped.endswith('except') or stripped.endswith('finally') or
-                stripped.endswith('with')):
-                if not stripped.endswith(':'):
-                    fixed_line = line.rstrip() + ':'
-        fixed_lines.append(fixed_line)
-    
-    fixed_code = '\n'.join(fixed_lines)
-    
-    # Verify it works
-    try:
-        ast.parse(fixed_code)
-        return fixed_code
-    except:
-        return None
-
-
-# ============== MAIN VIEW SET ==============
-
-class AnalyzeViewSet(viewsets.ViewSet):
+            stored = results.get_result(key, max_age=results.get_setting('TTL'))
+            if stored is not None:
+                results.record_hit(stored)
+                response_data = stored.response
+            else:
+                # Cheap and LLM-bound requests run in separate lanes; see admission.py
+                input_type = detect_input_type(query)
+                progressive = serializer.validated_data["progressive"] and input_type == "code" \
+                    and llm.is_available()
+                if progressive:
+                    # The LLM phase runs as a job; only the local check runs
+                    # here. The job's place in the LLM lane is taken now, so
+                    # a full lane still turns the request away with 503.
+                    reservation = admission.reserve(admission.LLM)
+                    try:
+                        with admission.admit(admission.CHEAP):
+                            response_data = start_progressive(request, query, options, reservation)
+                    except BaseException:
+                        reservation.cancel()
+                        raise
+                else:
+                    with admission.admit(admission.classify(input_type)), routing.request_key(key):
+                        response_data = analyze_query(query, profile=options["profile"], input_type=input_type)
+                    results.store_result(key, query, options, response_data)
+        except BaseException:
+            if idempotency_key:
+                results.release_idempotent(idempotency_key)
+            raise
+        if idempotency_key:
+            results.finish_idempotent(idempotency_key, response_data)
+
+        # Greetings are fully determined by the chosen message
+        static_key = ("greeting", response_data["answer"]) if response_data["type"] == "greeting" else None
+        if serializer.validated_data["compact"]:
+            response_data = diffs.compact_response(response_data)
+        response = analysis_response(request, response_data, static_key=static_key)
+        if progressive:
+            response.status_code = status.HTTP_202_ACCEPTED
+            return response
+        return self.with_location(response, response_data, key)
+
+    def retrieve(self, request, pk=None):
+        stored = results.get_result(pk)
+        if stored is None:
+            raise NotFound("No stored analysis with this id.")
+        response_data = stored.response
+        if request.query_params.get("compact") in ("1", "true"):
+            response_data = diffs.compact_response(response_data)
+        response = analysis_response(request, response_data)
+        patch_cache_control(response, public=True, max_age=results.get_setting('MAX_AGE'))
+        return response
+
+    @action(detail=False, methods=["post"], url_path="run", renderer_classes=[EventStreamRenderer, JSONRenderer])
+    def run(self, request):
+        """
+        Run code in the sandbox and stream what it prints as Server-Sent
+        Events: "output" events carry {"text"} chunks as they are printed and
+        a final "done" event carries {"success", "error", "output",
+        "truncated"}, with the output kept as a bounded head and tail.
+        """
+        serializer = AnalyzeInputSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        streaming = sandbox.StreamingRun(serializer.validated_data["query"])
+
+        def events():
+            limit = sandbox.get_setting('STREAM_MAX_CHARS')
+            sent = 0
+            for chunk in streaming:
+                if sent < limit:
+                    chunk = chunk[:limit - sent]
+                    sent += len(chunk)
+                    yield sse_event("output", {"text": chunk})
+            result = streaming.result
+            yield sse_event("done", {
+                "success": bool(result.get("success")),
+                "error": result.get("error"),
+                "output": streaming.output.getvalue(),
+                "truncated": streaming.output.truncated,
+            })
+
+        response = StreamingHttpResponse(events(), content_type="text/event-stream")
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"  # let nginx pass events through
+        return response
+
+    def with_location(self, response, response_data, key):
+        """Point clients (and caches) at the GET-able copy of a stored result."""
+        if response_data.get("type") not in results.UNSTORED_TYPES:
+            response["Content-Location"] = reverse("analyze-detail", kwargs={"pk": key})
+        return response
+
+
+class JobViewSet(throttling.RateLimitedMixin, viewsets.ViewSet):
+    """Submit an analysis to the job queue and poll it by id."""
     serializer_class = AnalyzeInputSerializer
 
+    def rate_bucket(self, request):
+        return analysis_rate_bucket(request)
+
     def create(self, request):
         serializer = AnalyzeInputSerializer(data=request.data)
         serializer.is_valid(raise_exception=True)
-        
-        query = serializer.validated_data["query"]
-        
-        # Detect input type intelligently
-        input_type = detect_input_type(query)
-        
-        # Handle based on detected type
-        if input_type == "greeting":
-            result = handle_greeting()
-        elif input_type == "general":
-            result = handle_general_knowledge(query)
-        elif input_type == "code_request":
-            code_result = generate_code_with_gemini(query)
-            result = {
-                "type": "code",
-                "is_valid": True,
-                "error": None,
-                "corrected_code": code_result.get("example_code", ""),
-                "improved_versions": [],
-                "best_version": 0,
-                "response": code_result.get("answer", ""),
-                "answer": code_result.get("answer", ""),
-                "example_code": code_result.get("example_code", ""),
-                "documentation": code_result.get("documentation", ""),
-                "output": ""
-            }
-        elif input_type == "code":
-            analysis = analyze_code_with_gemini(query)
-            result = {
-                "type": "code",
-                "is_valid": analysis.get("is_valid", True),
-                "error": analysis.get("error"),
-                "corrected_code": analysis.get("corrected_code", query),
-                "improved_versions": analysis.get("improvements", []),
-                "best_version": analysis.get("best_version", 2),
-                "response": "",
-                "answer": "",
-                "example_code": analysis.get("corrected_code", ""),
-                "documentation": f"## Code Analysis\n\nStatus: {'✅ Correct' if analysis.get('is_valid') else '❌ Has Errors'}",
-                "output": analysis.get("output", "")
-            }
-        else:  # programming
-            result = handle_programming_question(query)
-        
-        # Build response for API
-        response_data = {
-            "type": result.get("type", "general"),
-            "is_valid": result.get("is_valid", True),
-            "error": result.get("error"),
-            "corrected_code": result.get("corrected_code", ""),
-            "improved_versions": result.get("improved_versions", []),
-            "best_version": result.get("best_version", 0),
-            "answer": result.get("response", ""),
-            "example_code": result.get("example_code", ""),
-            "documentation": result.get("documentation", ""),
-            "output": result.get("output", "")
-        }
-        
-        output_serializer = AnalyzeOutputSerializer(response_data)
-        return Response(output_serializer.data)
+        job = jobs.enqueue(serializer.validated_data["query"], profile=serializer.validated_data["profile"])
+        location = reverse("job-detail", kwargs={"pk": job.pk})
+        return Response(
+            {"id": job.pk, "status": job.status, "url": request.build_absolute_uri(location)},
+            status=status.HTTP_202_ACCEPTED,
+            headers={"Location": location},
+        )
+
+    def retrieve(self, request, pk=None):
+        job = AnalysisJob.objects.filter(pk=pk).first()
+        if job is None:
+            raise NotFound("No job with this id.")
+        return Response(AnalysisJobSerializer(job).data)
+
+    @action(detail=True, methods=["get"], renderer_classes=[EventStreamRenderer, JSONRenderer])
+    def events(self, request, pk=None):
+        """
+        Follow a job as Server-Sent Events: a "partial" event with the
+        job's partial fields whenever its stage changes, then a final "done"
+        event with the result or a "failed" event with the error.
+        """
+        if not AnalysisJob.objects.filter(pk=pk).exists():
+            raise NotFound("No job with this id.")
+        # Each stream holds a worker thread, so only a few run at once
+        reservation = admission.reserve(admission.STREAM)
+
+        def events():
+            interval = jobs.get_setting('EVENT_POLL_INTERVAL')
+            deadline = time.monotonic() + jobs.get_setting('EVENT_TIMEOUT')
+            stage = None
+            with reservation:
+                while True:
+                    job = AnalysisJob.objects.get(pk=pk)
+                    if job.partial.get("stage") != stage:
+                        stage = job.partial.get("stage")
+                        yield sse_event("partial", job.partial)
+                    if job.status == AnalysisJob.DONE:
+                        yield sse_event("done", job.result)
+                        return
+                    if job.status == AnalysisJob.FAILED or time.monotonic() > deadline:
+                        yield sse_event("failed", {"error": job.error or "Timed out waiting for the job."})
+                        return
+                    time.sleep(interval)
+
+        response = StreamingHttpResponse(events(), content_type="text/event-stream")
+        # Give the place back if the stream is closed before it starts
+        response._resource_closers.append(reservation.cancel)
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
+
+
+class MetricsViewSet(viewsets.ViewSet):
+    """In-process performance counters of the worker serving the request."""
+
+    def list(self, request):
+        counters = metrics.snapshot()
+        return Response({**counters, **hedging.rates(counters)})
@@ -0,0 +1,61 @@
+"""
+Worker warm-up.
+
+`warm_up()` does the one-off work that would otherwise land on a worker's
+first requests: compiling the input classifier, building the offline
+knowledge base, loading the performance analyzer and serializers, and
+starting the sandbox pool. The LLM SDK is left unloaded unless asked for,
+since importing it is the slowest part of startup.
+
+Run it from `MainappConfig.ready()` by setting WARM_UP['ON_READY'], or from
+a pre-forking server's post-fork hook, e.g. in gunicorn.conf.py::
+
+    def post_fork(server, worker):
+        from mainapp.warmup import warm_up
+        warm_up()
+"""
+import time
+
+from django.conf import settings
+
+
+WARM_UP_DEFAULTS = {
+    'ON_READY': False,
+    'SANDBOX_POOL': True,
+    'LLM_SDK': False,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'WARM_UP', {}).get(name, WARM_UP_DEFAULTS[name])
+
+
+def warm_up(sandbox_pool=None, llm_sdk=None):
+    """Run every warm-up step and return how long each took, in ms."""
+    from . import llm, sandbox, views
+    from .perf_analyzer import analyze_performance
+    from .serializers import AnalyzeOutputSerializer
+
+    if sandbox_pool is None:
+        sandbox_pool = get_setting('SANDBOX_POOL')
+    if llm_sdk is None:
+        llm_sdk = get_setting('LLM_SDK')
+
+    steps = [
+        ("classifier", lambda: views.detect_input_type("def f(x):\n    return x")),
+        ("knowledge_base", views.get_knowledge_base),
+        ("perf_analyzer", lambda: analyze_performance("for i in range(3):\n    s = sorted([i])\n")),
+        ("serializers", lambda: AnalyzeOutputSerializer({"type": "greeting", "is_valid": True}).data),
+    ]
+    if sandbox_pool:
+        steps.append(("sandbox_pool", sandbox.warm_pool))
+    if llm_sdk:
+        provider = llm.get_provider()
+        steps.append(("llm_sdk", getattr(provider, 'load_sdk', provider.is_available)))
+
+    timings = {}
+    for name, step in steps:
+        started = time.perf_counter()
+        step()
+        timings[name] = round((time.perf_counter() - started) * 1000, 3)
+    return timings
@@ -17,7 +17,7 @@ function Home() {
     setResult(null);
 
     try {
-      const response = await analyzeInput(query);
+      const response = await analyzeInput(query, (data) => setResult(data));
       setResult(response.data);
     } catch (err) {
       console.error(err);
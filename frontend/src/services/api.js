@@ -8,6 +8,86 @@ export const submitCode = (code) => {
   return API.post("aicode/", { code });
 };
 
-export const analyzeInput = (query) => {
-  return API.post("analyze/", { query });
+// Rebuilds the code fields of a compact analyze response (code_base +
+// code_patches, see backend mainapp/diffs.py) so components get full text.
+export const expandCompactResponse = (data) => {
+  if (!data || !data.code_patches) return data;
+  const { code_base: base = "", code_patches: patches, ...full } = data;
+  if ("improved_versions" in full) {
+    full.improved_versions = (full.improved_versions || []).map((v) => ({ ...v }));
+  }
+  const baseLines = base.match(/[^\n]*\n|[^\n]+$/g) || [];
+  const texts = {};
+  for (const [target, patch] of Object.entries(patches)) {
+    let text;
+    if (patch.same) text = base;
+    else if (patch.ref) text = texts[patch.ref];
+    else if (patch.edits) {
+      const out = [];
+      let position = 0;
+      for (const [start, end, lines] of patch.edits) {
+        out.push(...baseLines.slice(position, start), ...lines);
+        position = end;
+      }
+      out.push(...baseLines.slice(position));
+      text = out.join("");
+    } else text = patch.text;
+    texts[target] = text;
+    if (target.startsWith("improved_versions.")) {
+      full.improved_versions[Number(target.split(".")[1])].code = text;
+    } else {
+      full[target] = text;
+    }
+  }
+  return full;
+};
+
+// Code reviews are progressive: the first response carries the local check
+// (validity, fix, output) and `pending`; onUpdate(data) then receives the
+// full result when the LLM review finishes.
+export const analyzeInput = (query, onUpdate) => {
+  return API.post("analyze/", { query, compact: true, progressive: true }).then((response) => {
+    const data = expandCompactResponse(response.data);
+    if (data.pending && onUpdate) {
+      const events = new EventSource(data.pending.events);
+      events.addEventListener("done", (event) => {
+        events.close();
+        onUpdate(JSON.parse(event.data));
+      });
+      events.addEventListener("failed", () => events.close());
+    }
+    return { ...response, data };
+  });
+};
+
+// One WebSocket per chat; the server keeps the conversation context.
+// Send JSON {"query": "..."} and read {"type": "session" | "analysis" | "error"} messages.
+export const openChatSession = (sessionId) => {
+  const path = sessionId ? `ws/chat/${sessionId}/` : "ws/chat/";
+  return new WebSocket(`ws://127.0.0.1:8000/${path}`);
+};
+
+// Streams what the code prints. onEvent(type, data) receives "output"
+// events ({ text }) as they happen and a final "done" event.
+export const runCodeStream = async (code, onEvent) => {
+  const response = await fetch(`${API.defaults.baseURL}analyze/run/`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json", Accept: "text/event-stream" },
+    body: JSON.stringify({ query: code }),
+  });
+  const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+  let buffer = "";
+  for (;;) {
+    const { value, done } = await reader.read();
+    if (done) break;
+    buffer += value;
+    let end;
+    while ((end = buffer.indexOf("\n\n")) >= 0) {
+      const block = buffer.slice(0, end);
+      buffer = buffer.slice(end + 2);
+      const type = block.match(/^event: (.*)$/m)?.[1];
+      const data = block.match(/^data: (.*)$/m)?.[1];
+      if (type && data) onEvent(type, JSON.parse(data));
+    }
+  }
 };